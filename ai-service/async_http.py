@@ -0,0 +1,32 @@
+import asyncio
+
+import httpx
+
+# Shared keep-alive client for outbound model calls made from request
+# handlers. Timeouts are set per call; these are only the defaults.
+DEFAULT_TIMEOUT = httpx.Timeout(30.0, connect=5.0)
+POOL_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=60)
+
+_client = None
+_client_loop = None
+
+
+def get_client():
+    """
+    Return the pooled AsyncClient for the running event loop. A client is
+    tied to the loop it was created on, so a new one is made if the loop
+    changes (e.g. under a test client).
+    """
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client.is_closed or _client_loop is not loop:
+        _client = httpx.AsyncClient(timeout=DEFAULT_TIMEOUT, limits=POOL_LIMITS)
+        _client_loop = loop
+    return _client
+
+
+async def close_client():
+    global _client, _client_loop
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client, _client_loop = None, None
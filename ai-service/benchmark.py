@@ -0,0 +1,322 @@
+"""
+Micro-benchmarks for the rag_pipeline hot paths, no model required.
+
+    python benchmark.py                               # 1k, 10k, 100k docs -> bench_results.json
+    python benchmark.py --sizes 1000,500000 --queries 500
+    python benchmark.py --baseline bench_baseline.json  # exit 1 on regressions
+    python benchmark.py --out bench_baseline.json       # record a new baseline
+
+Each corpus size runs in its own process so peak RSS is per size. Documents
+are synthetic "Knowledge (topicNNN): ..." texts drawn from per-topic word
+lists, and embeddings are deterministic functions of the text (topic
+direction plus hashed noise), so vectors cluster like real ones and runs
+are repeatable. Timed: preprocess_data, build_index, retrieve in every
+retrieval mode and GET /rag/knowledge (through the ASGI app). Latencies
+are reported as percentiles in ms; allocations are tracemalloc peaks for
+one call; RSS is the process high-water mark after each phase.
+"""
+import os
+import re
+import sys
+import json
+import time
+import zlib
+import random
+import argparse
+import platform
+import tempfile
+import resource
+import subprocess
+import tracemalloc
+
+import numpy as np
+
+SYLLABLES = ["ka", "lo", "mi", "ne", "ru", "sa", "ti", "vo", "ze", "ba", "de", "fu"]
+VOCAB = [a + b + c for a in SYLLABLES for b in SYLLABLES for c in SYLLABLES]
+TOPICS = 200
+WORDS_PER_TOPIC = 40
+MODES = ("dense", "lexical", "hybrid")
+PAGE_LIMIT = 50
+MAX_PAGE_REQUESTS = 300
+
+# Metrics compared against a baseline (lower is better)
+COMPARED = ("seconds", "p50_ms", "p95_ms")
+
+_TOPIC_RE = re.compile(r"topic(\d+)")
+
+
+# ── Synthetic corpus ──────────────────────────────────────────────────────────
+def topic_words(topic):
+    start = (topic * WORDS_PER_TOPIC) % len(VOCAB)
+    return [VOCAB[(start + i) % len(VOCAB)] for i in range(WORDS_PER_TOPIC)]
+
+
+def synthetic_text(rng, topic, n_words):
+    """Mostly topic words with some general vocabulary mixed in."""
+    own = topic_words(topic)
+    return " ".join(rng.choice(own) if rng.random() < 0.7 else rng.choice(VOCAB) for _ in range(n_words))
+
+
+def synthetic_documents(n, seed=0):
+    rng = random.Random(seed)
+    for i in range(n):
+        topic = rng.randrange(TOPICS)
+        yield f"Knowledge (topic{topic:03d}): {synthetic_text(rng, topic, rng.randint(20, 40))} #{i}"
+
+
+def synthetic_sessions(n, seed=1):
+    """User data items in the shape preprocess_data receives from /rag/analyze."""
+    rng = random.Random(seed)
+    return [{"date": f"2025-01-{1 + i % 28:02d}", "duration": rng.randint(15, 120),
+             "notes": f"topic{rng.randrange(TOPICS):03d} " + synthetic_text(rng, rng.randrange(TOPICS), 15)}
+            for i in range(n)]
+
+
+def synthetic_queries(n, seed=2):
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(n):
+        topic = rng.randrange(TOPICS)
+        queries.append(f"topic{topic:03d} " + " ".join(rng.sample(topic_words(topic), 3)))
+    return queries
+
+
+# ── Fake embeddings ───────────────────────────────────────────────────────────
+class FakeEmbedder:
+    """Deterministic text -> vector: the text's topic direction plus hashed noise."""
+
+    def __init__(self, dim, seed=3):
+        rng = np.random.default_rng(seed)
+        self.topics = rng.standard_normal((TOPICS, dim)).astype(np.float32)
+        self.noise = rng.standard_normal((4096, dim)).astype(np.float32)
+
+    def embed(self, texts):
+        topics = np.array([int(m.group(1)) % TOPICS if (m := _TOPIC_RE.search(t)) else 0 for t in texts])
+        noise = np.array([zlib.crc32(t.encode("utf-8")) % len(self.noise) for t in texts])
+        return self.topics[topics] + 0.6 * self.noise[noise]
+
+    def embed_documents(self, texts, provider=None, progress=None):
+        return self.embed(texts)
+
+    def fetch_query_embedding(self, query, provider):
+        return self.embed([query])[0]
+
+    async def fetch_query_embedding_async(self, query, provider):
+        return self.embed([query])[0]
+
+
+# ── Measurement helpers ───────────────────────────────────────────────────────
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2 ** 20, 1)
+
+
+def alloc_peak_kb(fn, *args, **kwargs):
+    """tracemalloc peak while running fn once."""
+    tracemalloc.start()
+    try:
+        fn(*args, **kwargs)
+        return round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+    finally:
+        tracemalloc.stop()
+
+
+def latency_summary(samples):
+    ms = np.asarray(samples) * 1000
+    return {
+        "n": len(ms),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "max_ms": round(float(ms.max()), 3),
+    }
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+# ── One corpus size (runs in a child process) ─────────────────────────────────
+def run_size(size, n_queries, dim):
+    import rag_pipeline
+    fake = FakeEmbedder(dim)
+    rag_pipeline.embed_documents = fake.embed_documents
+    rag_pipeline.fetch_query_embedding = fake.fetch_query_embedding
+    rag_pipeline.fetch_query_embedding_async = fake.fetch_query_embedding_async
+
+    results = {"rss_start_mb": peak_rss_mb()}
+
+    sessions = synthetic_sessions(size)
+    seconds, docs = timed(rag_pipeline.preprocess_data, sessions)
+    results["preprocess_data"] = {"seconds": round(seconds, 4), "documents": len(docs),
+                                  "alloc_peak_kb": alloc_peak_kb(rag_pipeline.preprocess_data, sessions[:1000]),
+                                  "peak_rss_mb": peak_rss_mb()}
+
+    seconds, indexed = timed(rag_pipeline.build_index, synthetic_documents(size))
+    results["build_index"] = {"seconds": round(seconds, 4), "documents": indexed,
+                              "vector_index": rag_pipeline.current_index().index.stats() if rag_pipeline.current_index().index else None,
+                              "embeddings_bytes": rag_pipeline.embedding_footprint()["bytes"],
+                              "peak_rss_mb": peak_rss_mb()}
+
+    queries = synthetic_queries(n_queries)
+    for mode in MODES:
+        rag_pipeline.query_embedding_cache.clear()
+        rag_pipeline.retrieve(queries[0], k=3, mode=mode)  # warm-up (lazy IVF lists, BM25 arrays)
+        samples = []
+        for query in queries:
+            seconds, _ = timed(rag_pipeline.retrieve, query, k=3, mode=mode)
+            samples.append(seconds)
+        summary = latency_summary(samples)
+        summary["alloc_peak_kb"] = alloc_peak_kb(rag_pipeline.retrieve, queries[-1], k=3, mode=mode)
+        results[f"retrieve.{mode}"] = summary
+
+    results.update(bench_knowledge_endpoint())
+    results["peak_rss_mb"] = peak_rss_mb()
+    return results
+
+
+def bench_knowledge_endpoint():
+    from fastapi.testclient import TestClient
+    import main
+    client = TestClient(main.app)  # no `with`: startup (index build, warm-up) is not run
+
+    def walk(params):
+        samples, cursor = [], None
+        for _ in range(MAX_PAGE_REQUESTS):
+            query = dict(params, limit=PAGE_LIMIT, **({"cursor": cursor} if cursor is not None else {}))
+            start = time.perf_counter()
+            response = client.get("/rag/knowledge", params=query)
+            samples.append(time.perf_counter() - start)
+            if response.status_code != 200 or (cursor is None and not response.json()):
+                raise RuntimeError(f"GET /rag/knowledge {params} returned no records")
+            cursor = response.headers.get("X-Next-Cursor")
+            if cursor is None:
+                break
+        return samples
+
+    # A category that exists in this corpus; timing an empty result would record a meaningless baseline
+    categories = client.get("/rag/knowledge/categories").json()
+    if not categories:
+        raise RuntimeError("GET /rag/knowledge/categories returned no categories")
+    category = max(categories, key=categories.get)
+
+    results = {}
+    for name, params in (("knowledge.page", {}), ("knowledge.category", {"category": category})):
+        walk(params)  # warm-up
+        summary = latency_summary(walk(params))
+        summary["alloc_peak_kb"] = alloc_peak_kb(client.get, "/rag/knowledge", params=dict(params, limit=PAGE_LIMIT))
+        results[name] = summary
+    return results
+
+
+# ── Driver ────────────────────────────────────────────────────────────────────
+def run_isolated(size, args):
+    """Run one size in a fresh interpreter; returns its results dict."""
+    with tempfile.TemporaryDirectory(prefix="rag-bench-") as tmp:
+        out = os.path.join(tmp, "result.json")
+        env = dict(os.environ, AI_PROVIDER="ollama", EMBED_CACHE_DIR=os.path.join(tmp, "embeddings"),
+                   RESPONSE_CACHE_ENABLED="false")
+        cmd = [sys.executable, os.path.abspath(__file__), "--worker", str(size),
+               "--queries", str(args.queries), "--dim", str(args.dim), "--result", out]
+        proc = subprocess.run(cmd, env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+                              stdout=None if args.verbose else subprocess.DEVNULL,
+                              stderr=None if args.verbose else subprocess.PIPE, text=True)
+        if proc.returncode != 0:
+            raise RuntimeError(f"benchmark for {size} docs failed:\n{proc.stderr or ''}")
+        with open(out) as f:
+            return json.load(f)
+
+
+def compare(current, baseline, tolerance, min_delta_ms):
+    """
+    Lines describing regressions: slower than baseline by more than
+    tolerance (a fraction, e.g. 0.25) and by more than min_delta_ms, so
+    timer noise on sub-millisecond operations isn't reported.
+    """
+    regressions = []
+    for size, ops in current["results"].items():
+        for op, values in ops.items():
+            base = baseline.get("results", {}).get(size, {}).get(op)
+            if not isinstance(values, dict) or not isinstance(base, dict):
+                continue
+            for metric in COMPARED:
+                if metric in values and base.get(metric):
+                    ratio = values[metric] / base[metric]
+                    delta_ms = (values[metric] - base[metric]) * (1000 if metric == "seconds" else 1)
+                    if ratio > 1 + tolerance and delta_ms > min_delta_ms:
+                        regressions.append(f"{size:>7} docs  {op:<20} {metric:<8} "
+                                           f"{base[metric]:>10} -> {values[metric]:>10}  (x{ratio:.2f})")
+    return regressions
+
+
+def print_table(report):
+    print(f"\n{'docs':>7}  {'operation':<20} {'seconds/p50':>12} {'p95_ms':>9} {'alloc_kb':>9} {'rss_mb':>8}")
+    for size, ops in report["results"].items():
+        for op, values in ops.items():
+            if not isinstance(values, dict):
+                continue
+            first = values.get("seconds", values.get("p50_ms", ""))
+            print(f"{size:>7}  {op:<20} {first:>12} {values.get('p95_ms', ''):>9} "
+                  f"{values.get('alloc_peak_kb', ''):>9} {values.get('peak_rss_mb', ''):>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark rag_pipeline with synthetic data and fake embeddings.")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="comma-separated corpus sizes")
+    parser.add_argument("--queries", type=int, default=200, help="retrieve calls per mode")
+    parser.add_argument("--dim", type=int, default=384, help="fake embedding dimension")
+    parser.add_argument("--out", default="bench_results.json", help="where to write results")
+    parser.add_argument("--baseline", help="results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown vs baseline (0.25 = 25%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=0.1,
+                        help="ignore slowdowns smaller than this many milliseconds")
+    parser.add_argument("--verbose", action="store_true", help="show pipeline output")
+    parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        results = run_size(args.worker, args.queries, args.dim)
+        with open(args.result, "w") as f:
+            json.dump(results, f)
+        return 0
+
+    report = {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "dim": args.dim,
+            "queries": args.queries,
+            "embed_storage": os.getenv("EMBED_STORAGE", "float32"),
+            "vector_index": os.getenv("VECTOR_INDEX", "auto"),
+        },
+        "results": {},
+    }
+    for size in (int(s) for s in args.sizes.split(",") if s.strip()):
+        print(f"Benchmarking {size} documents...")
+        report["results"][str(size)] = run_isolated(size, args)
+
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print_table(report)
+    print(f"\nResults written to {args.out}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance, args.min_delta_ms)
+        if regressions:
+            print(f"\nRegressions beyond {args.tolerance:.0%} vs {args.baseline}:")
+            print("\n".join(regressions))
+            return 1
+        print(f"\nNo regressions beyond {args.tolerance:.0%} vs {args.baseline}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
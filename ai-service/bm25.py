@@ -0,0 +1,182 @@
+import re
+import copy
+import math
+from collections import Counter
+
+import numpy as np
+
+# Okapi BM25 over array-backed (CSR) postings. Lexical search needs no
+# network call, so retrieval keeps working when the embedder is down.
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were will with "
+    "i you your my me we our they them he she what how why when which who do does not".split()
+)
+
+# Rebuild the CSR arrays once this share of slots is appended or dead
+COMPACT_RATIO = 0.25
+
+
+def tokenize(text):
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    Rows match the caller's document list. Internally each document lives
+    in a slot: the base slots are frozen in CSR arrays (term -> slots, tfs),
+    later additions go to small per-term delta lists, and deleted or
+    replaced slots are tombstoned. row_of_slot maps slots back to rows so
+    deletes can compact rows without rewriting postings.
+
+    Document frequencies include tombstoned slots until the next compaction.
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.rebuild([])
+
+    @classmethod
+    def build(cls, texts, **kwargs):
+        index = cls(**kwargs)
+        index.rebuild(texts)
+        return index
+
+    def __len__(self):
+        return self.n_live
+
+    def rebuild(self, texts):
+        self.vocab = {}
+        doc_slots, doc_terms, doc_tfs = [], [], []
+        lengths = np.zeros(len(texts), dtype=np.float32)
+        for slot, text in enumerate(texts):
+            tokens = tokenize(text)
+            lengths[slot] = len(tokens)
+            for term, tf in Counter(tokens).items():
+                doc_slots.append(slot)
+                doc_terms.append(self.vocab.setdefault(term, len(self.vocab)))
+                doc_tfs.append(tf)
+
+        terms = np.asarray(doc_terms, dtype=np.int64)
+        order = np.argsort(terms, kind="stable")
+        self.post_slots = np.asarray(doc_slots, dtype=np.int32)[order]
+        self.post_tfs = np.asarray(doc_tfs, dtype=np.float32)[order]
+        counts = np.bincount(terms, minlength=len(self.vocab))
+        self.post_offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        self.df = counts.astype(np.float32)
+        self.base_terms = len(self.vocab)
+        self.base_slot_count = len(texts)
+
+        self.delta = {}
+        self.doc_len = lengths
+        self.row_of_slot = np.arange(len(texts), dtype=np.int64)
+        self.slot_of_row = np.arange(len(texts), dtype=np.int64)
+        self.n_slots = len(texts)
+        self.n_live = len(texts)
+        self.n_dead = 0
+        self.total_len = float(lengths.sum())
+
+    def fork(self):
+        """
+        Copy for a writer, so a published index is never edited in place.
+        The CSR arrays are shared (only rebuild replaces them); everything
+        add/update/delete writes to is copied.
+        """
+        clone = copy.copy(self)
+        clone.vocab = dict(self.vocab)
+        clone.df = self.df.copy()
+        clone.doc_len = self.doc_len.copy()
+        clone.row_of_slot = self.row_of_slot.copy()
+        clone.slot_of_row = self.slot_of_row.copy()
+        clone.delta = {term: (list(slots), list(tfs)) for term, (slots, tfs) in self.delta.items()}
+        return clone
+
+    def _ensure_slot_capacity(self):
+        if self.n_slots >= len(self.doc_len):
+            capacity = max(16, 2 * len(self.doc_len))
+            doc_len = np.zeros(capacity, dtype=np.float32)
+            doc_len[:self.n_slots] = self.doc_len[:self.n_slots]
+            row_of_slot = np.full(capacity, -1, dtype=np.int64)
+            row_of_slot[:self.n_slots] = self.row_of_slot[:self.n_slots]
+            self.doc_len, self.row_of_slot = doc_len, row_of_slot
+
+    def _new_slot(self, text, row):
+        self._ensure_slot_capacity()
+        slot = self.n_slots
+        tokens = tokenize(text)
+        for term, tf in Counter(tokens).items():
+            term_id = self.vocab.setdefault(term, len(self.vocab))
+            if term_id >= len(self.df):
+                self.df = np.concatenate((self.df, np.zeros(max(16, len(self.df)), dtype=np.float32)))
+            self.df[term_id] += 1
+            slots, tfs = self.delta.setdefault(term_id, ([], []))
+            slots.append(slot)
+            tfs.append(tf)
+        self.doc_len[slot] = len(tokens)
+        self.row_of_slot[slot] = row
+        self.n_slots += 1
+        self.total_len += len(tokens)
+        return slot
+
+    def _kill_slot(self, slot):
+        self.row_of_slot[slot] = -1
+        self.total_len -= float(self.doc_len[slot])
+        self.n_dead += 1
+
+    def add(self, text):
+        """Append a document as the next row."""
+        slot = self._new_slot(text, self.n_live)
+        self.slot_of_row = np.append(self.slot_of_row, slot)
+        self.n_live += 1
+
+    def update(self, row, text):
+        """Replace the text of an existing row."""
+        self._kill_slot(self.slot_of_row[row])
+        self.slot_of_row[row] = self._new_slot(text, row)
+
+    def delete(self, row):
+        """Remove a row; later rows shift up by one, like the caller's list."""
+        self._kill_slot(self.slot_of_row[row])
+        live = self.row_of_slot[:self.n_slots]
+        live[live > row] -= 1
+        self.slot_of_row = np.delete(self.slot_of_row, row)
+        self.n_live -= 1
+
+    def needs_compaction(self):
+        """True once appended or dead slots exceed COMPACT_RATIO of live rows."""
+        churn = (self.n_slots - self.base_slot_count) + self.n_dead
+        return churn > COMPACT_RATIO * max(self.n_live, 1)
+
+    def search(self, query, k=10):
+        """Return (rows, scores) of the top k live rows, best first."""
+        empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32))
+        query_terms = Counter(self.vocab[t] for t in tokenize(query) if t in self.vocab)
+        if not query_terms or self.n_live == 0 or k <= 0:
+            return empty
+
+        avgdl = max(self.total_len / self.n_live, 1e-6)
+        scores = np.zeros(self.n_slots, dtype=np.float32)
+        for term_id, qtf in query_terms.items():
+            df = float(self.df[term_id])
+            idf = math.log(1.0 + (self.n_live - df + 0.5) / (df + 0.5))
+            for slots, tfs in self._postings(term_id):
+                denom = tfs + self.k1 * (1.0 - self.b + self.b * self.doc_len[slots] / avgdl)
+                scores[slots] += qtf * idf * tfs * (self.k1 + 1.0) / denom
+
+        rows = self.row_of_slot[:self.n_slots]
+        candidates = np.flatnonzero((scores > 0) & (rows >= 0))
+        if len(candidates) == 0:
+            return empty
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+        candidates = candidates[np.argsort(-scores[candidates])]
+        return rows[candidates], scores[candidates]
+
+    def _postings(self, term_id):
+        if term_id < self.base_terms:
+            start, end = self.post_offsets[term_id], self.post_offsets[term_id + 1]
+            yield self.post_slots[start:end], self.post_tfs[start:end]
+        if term_id in self.delta:
+            slots, tfs = self.delta[term_id]
+            yield np.asarray(slots, dtype=np.int64), np.asarray(tfs, dtype=np.float32)
@@ -0,0 +1,111 @@
+import os
+import re
+
+# Token-budgeted chunking. Token counts are estimated as words plus
+# punctuation marks, which tracks subword tokenizers closely enough for
+# sizing chunks and prompt context without loading a tokenizer.
+TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "160"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "32"))
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+def count_tokens(text):
+    return len(TOKEN_RE.findall(text))
+
+
+def split_units(paragraphs):
+    """
+    Yield (separator, sentence) from paragraph texts; separator is what
+    joins the sentence to the previous one ("\n\n", "\n" or " ").
+    """
+    for paragraph in paragraphs:
+        sep = "\n\n"
+        for line in paragraph.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            for sentence in _SENTENCE_RE.split(line):
+                if sentence:
+                    yield sep, sentence
+                    sep = " "
+            sep = "\n"
+
+
+def _split_long(text, max_tokens, overlap):
+    """Cut one oversized sentence into token windows on the original characters."""
+    spans = [m.span() for m in TOKEN_RE.finditer(text)]
+    step = max(1, max_tokens - overlap)
+    for start in range(0, len(spans), step):
+        window = spans[start:start + max_tokens]
+        yield text[window[0][0]:window[-1][1]]
+        if start + max_tokens >= len(spans):
+            break
+
+
+def pack(paragraphs, max_tokens=None, overlap=None):
+    """
+    Greedily pack sentences from paragraphs into chunks of at most
+    max_tokens, starting each chunk with up to overlap tokens of trailing
+    sentences from the previous one (fewer when the next sentence would not
+    fit beside them). Consumes paragraphs lazily.
+    """
+    max_tokens = max_tokens or CHUNK_TOKENS
+    overlap = CHUNK_OVERLAP if overlap is None else min(overlap, max_tokens // 2)
+    window, size, fresh = [], 0, False
+
+    def units():
+        for sep, sentence in split_units(paragraphs):
+            if count_tokens(sentence) <= max_tokens:
+                yield sep, sentence
+            else:
+                for i, piece in enumerate(_split_long(sentence, max_tokens, overlap)):
+                    yield (sep if i == 0 else " "), piece
+
+    for sep, unit in units():
+        n = count_tokens(unit)
+        if window and size + n > max_tokens:
+            yield _join(window)
+            # Carry only as much overlap as still leaves room for this unit
+            budget = min(overlap, max_tokens - n)
+            carry, carried = [], 0
+            for item in reversed(window):
+                if carried + item[2] > budget:
+                    break
+                carry.insert(0, item)
+                carried += item[2]
+            window, size, fresh = carry, carried, False
+        window.append((sep, unit, n))
+        size += n
+        fresh = True
+    if fresh:
+        yield _join(window)
+
+
+def _join(window):
+    return "".join(sep + unit for sep, unit, _ in window).strip()
+
+
+def chunk_text(text, max_tokens=None, overlap=None):
+    """Chunks of one text; a text within budget comes back unchanged."""
+    if count_tokens(text) <= (max_tokens or CHUNK_TOKENS):
+        return [text]
+    return list(pack([text], max_tokens, overlap))
+
+
+def truncate_tokens(text, max_tokens):
+    """
+    Trim text to about max_tokens, preferring to end at a sentence or line
+    boundary over cutting mid-sentence.
+    """
+    spans = [m.span() for m in TOKEN_RE.finditer(text)]
+    if len(spans) <= max_tokens:
+        return text
+    cut = spans[max_tokens - 1][1]
+    head = text[:cut]
+    boundary = max(head.rfind("\n"), max(head.rfind(p) for p in ".!?"))
+    if boundary > cut // 2:
+        return head[:boundary + 1].rstrip()
+    return head.rstrip() + "…"
@@ -1,109 +1,189 @@
 import os
+import re
 import json
-import glob
 import csv
 
-def load_all_data(data_dir="data"):
+import chunking
+
+# Built-in knowledge is read lazily: every loader is a generator that yields
+# one formatted document at a time, so callers can stream the corpus into
+# indexing without holding intermediate lists. Prose is packed into
+# token-budgeted chunks (see chunking); CSV rows stay one record each.
+# Loaders take an optional dedup.NearDuplicateFilter that prose chunks are
+# checked against, so overlapping material from different files is indexed
+# once; dataset rows are distinct records and are never deduplicated.
+
+# Bytes read to guess the format of files without an extension
+SNIFF_BYTES = 8192
+
+# `name = [...]` — a JSON literal pasted as a Python assignment
+_ASSIGNMENT_RE = re.compile(r"^\s*[A-Za-z_]\w*\s*=\s*")
+
+
+def log(msg):
+    print(f"[Data Loader] {msg}")
+
+
+def folder_category(path, default="General"):
+    """Category from the containing folder name; files directly in data/ get default."""
+    folder = os.path.basename(os.path.dirname(path))
+    return default if folder == "data" else folder
+
+
+def _unique(chunks, dedupe):
+    if dedupe is None:
+        return chunks
+    return (chunk for chunk in chunks if not dedupe.is_duplicate(chunk))
+
+
+def iter_json(path, category=None, dedupe=None):
+    category = category or folder_category(path)
+    with open(path, 'r', encoding='utf-8') as f:
+        text = f.read()
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        # Tolerate `name = [...]`
+        data = json.loads(_ASSIGNMENT_RE.sub("", text, count=1))
+
+    # Case A: List of items
+    if isinstance(data, list):
+        for item in data:
+            if isinstance(item, dict):
+                content = item.get('content') or item.get('text') or item.get('description') or str(item)
+                for chunk in _unique(chunking.chunk_text(content), dedupe):
+                    yield f"Knowledge ({item.get('category', category)}): {chunk}"
+            elif isinstance(item, str):
+                for chunk in _unique(chunking.chunk_text(item), dedupe):
+                    yield f"Knowledge ({category}): {chunk}"
+        log(f"Loaded {len(data)} items from {path}")
+
+    # Case B: Single Object (e.g. Kaggle Metadata)
+    elif isinstance(data, dict):
+        content = data.get('description') or data.get('content') or data.get('text')
+        if content:
+            for chunk in _unique(chunking.chunk_text(content), dedupe):
+                yield f"Knowledge ({category} Metadata): {chunk}"
+            log(f"Loaded metadata from {path}")
+
+
+def iter_paragraphs(path):
+    """Yield blank-line separated paragraphs, reading line by line."""
+    paragraph = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                paragraph.append(line)
+                continue
+            if paragraph:
+                yield "".join(paragraph).strip()
+                paragraph = []
+    if paragraph:
+        yield "".join(paragraph).strip()
+
+
+def iter_text(path, category=None, dedupe=None):
+    """Yield chunks of about chunking.CHUNK_TOKENS tokens packed from the file's paragraphs."""
+    category = category or folder_category(path)
+    count = 0
+    for chunk in _unique(chunking.pack(iter_paragraphs(path)), dedupe):
+        count += 1
+        yield f"Knowledge ({category}): {chunk}"
+    log(f"Loaded {count} chunks from {path}")
+
+
+def iter_csv(path, category=None, dedupe=None):
     """
-    Load data from multiple formats in the data directory.
-    Supports .json, .txt
+    Yield one "Dataset (...)" document per row (header skipped); retries as
+    latin-1 if not UTF-8. Rows are searchable but not listed as resources.
     """
-    all_docs = []
-    
-    # helper for clean logging
-    def log(msg):
-        print(f"[Data Loader] {msg}")
+    category = category or folder_category(path, "Dataset")
+    yielded = 0
+    for encoding in ("utf-8", "latin-1"):
+        try:
+            with open(path, 'r', encoding=encoding, newline='') as f:
+                reader = csv.reader(f)
+                next(reader, None)  # Skip header if present
+                row_count = 0
+                for row in reader:
+                    if not row:
+                        continue
+                    row_count += 1
+                    # Rows already yielded before a decode error aren't repeated
+                    if row_count > yielded:
+                        yielded = row_count
+                        yield f"Dataset ({category}): {' | '.join(row)}"
+            suffix = "" if encoding == "utf-8" else f" ({encoding})"
+            log(f"Loaded {row_count} rows from {path}{suffix}")
+            return
+        except UnicodeDecodeError:
+            continue
+
+
+def sniff_format(path):
+    """Guess "json", "csv" or "txt" from a file's first bytes; None for binary."""
+    with open(path, 'rb') as f:
+        head = f.read(SNIFF_BYTES)
+    if not head or b"\0" in head:
+        return None
+    sample = head.decode('utf-8', errors='ignore')
+    stripped = _ASSIGNMENT_RE.sub("", sample.lstrip(), count=1)
+    if stripped.startswith(("[", "{")):
+        return "json"
+
+    # Tabular if a sniffed delimiter splits the first lines into the same
+    # number (> 1) of fields; prose with stray commas doesn't
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t|")
+        lines = sample.splitlines()[:-1] or sample.splitlines()
+        widths = {len(row) for row in csv.reader(lines[:5], dialect) if row}
+        if len(widths) == 1 and widths.pop() > 1:
+            return "csv"
+    except csv.Error:
+        pass
+    return "txt"
+
+
+LOADERS = {
+    "json": iter_json,
+    "txt": iter_text,
+    "csv": iter_csv,
+}
 
-    # Ensure dir exists
+
+def iter_file(path, category=None, dedupe=None):
+    """Documents from one file, dispatched on extension or sniffed content."""
+    ext = os.path.splitext(path)[1].lower().lstrip(".")
+    fmt = ext if ext else sniff_format(path)
+    loader = LOADERS.get(fmt)
+    if loader is None:
+        return
+    try:
+        yield from loader(path, category, dedupe)
+    except Exception as e:
+        log(f"Error loading {path}: {e}")
+
+
+def iter_documents(data_dir="data", dedupe=None):
+    """
+    Lazily yield documents from every file under data_dir (recursive):
+    .json, .txt and .csv by extension, extensionless files by content.
+    """
     if not os.path.exists(data_dir):
         log(f"Directory {data_dir} not found. Creating...")
         os.makedirs(data_dir)
-        return all_docs
+        return
 
-    # 1. JSON Files (Recursive)
-    # Search in all subdirectories
-    json_files = glob.glob(os.path.join(data_dir, "**", "*.json"), recursive=True)
-    for jf in json_files:
-        try:
-            # Extract category from folder name if possible
-            folder_category = os.path.basename(os.path.dirname(jf))
-            if folder_category == "data": folder_category = "General"
-            
-            with open(jf, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                
-                # Case A: List of items
-                if isinstance(data, list):
-                    for item in data:
-                        if isinstance(item, dict):
-                            content = item.get('content') or item.get('text') or item.get('description') or str(item)
-                            category = item.get('category', folder_category)
-                            all_docs.append(f"Knowledge ({category}): {content}")
-                        elif isinstance(item, str):
-                            all_docs.append(f"Knowledge ({folder_category}): {item}")
-                            
-                # Case B: Single Object (e.g. Kaggle Metadata)
-                elif isinstance(data, dict):
-                    # Try to find a description or text field
-                    content = data.get('description') or data.get('content') or data.get('text')
-                    if content:
-                        all_docs.append(f"Knowledge ({folder_category} Metadata): {content}")
-                        log(f"Loaded metadata from {jf}")
-            log(f"Loaded {len(data)} items from {jf}")
-        except Exception as e:
-            log(f"Error loading {jf}: {e}")
-
-    # 2. Text Files (Recursive)
-    txt_files = glob.glob(os.path.join(data_dir, "**", "*.txt"), recursive=True)
-    for tf in txt_files:
-        try:
-            folder_category = os.path.basename(os.path.dirname(tf))
-            if folder_category == "data": folder_category = "General"
-
-            with open(tf, 'r', encoding='utf-8') as f:
-                text = f.read()
-                paragraphs = [p.strip() for p in text.split('\n\n') if p.strip()]
-                # Add context to each paragraph
-                labeled_paragraphs = [f"Knowledge ({folder_category}): {p}" for p in paragraphs]
-                all_docs.extend(labeled_paragraphs)
-            log(f"Loaded {len(paragraphs)} paragraphs from {tf}")
-        except Exception as e:
-            log(f"Error loading {tf}: {e}")
-            
-    # 3. CSV Files (Recursive)
-    csv_files = glob.glob(os.path.join(data_dir, "**", "*.csv"), recursive=True)
-    for cf in csv_files:
-        try:
-            folder_category = os.path.basename(os.path.dirname(cf))
-            if folder_category == "data": folder_category = "Dataset"
-            
-            with open(cf, 'r', encoding='utf-8') as f:
-                reader = csv.reader(f)
-                headers = next(reader, None) # Skip header if present
-                
-                row_count = 0
-                for row in reader:
-                    if row:
-                        # Join all columns into a single string representation
-                        row_text = " | ".join(row)
-                        all_docs.append(f"Knowledge ({folder_category}): {row_text}")
-                        row_count += 1
-                        
-            log(f"Loaded {row_count} rows from {cf}")
-        except Exception as e:
-            # Try with different encoding if utf-8 fails
-            try:
-                with open(cf, 'r', encoding='latin-1') as f:
-                    reader = csv.reader(f)
-                    headers = next(reader, None)
-                    row_count = 0
-                    for row in reader:
-                        if row:
-                            row_text = " | ".join(row)
-                            all_docs.append(f"Knowledge ({folder_category}): {row_text}")
-                            row_count += 1
-                log(f"Loaded {row_count} rows from {cf} (latin-1)")
-            except Exception as e2:
-                log(f"Error loading {cf}: {e}")
-
-    return all_docs
+    for root, dirs, files in os.walk(data_dir):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for name in sorted(files):
+            if not name.startswith("."):
+                yield from iter_file(os.path.join(root, name), dedupe=dedupe)
+
+
+def load_all_data(data_dir="data"):
+    """
+    Load data from multiple formats in the data directory.
+    Supports .json, .txt, .csv and extensionless files
+    """
+    return list(iter_documents(data_dir))
@@ -0,0 +1,72 @@
+import os
+import re
+import zlib
+
+import numpy as np
+
+# Near-duplicate detection with MinHash signatures and LSH banding. Two
+# texts whose word-shingle sets have Jaccard similarity above the threshold
+# land in a shared band bucket with high probability; candidates are then
+# confirmed by comparing signatures.
+NEAR_DUP_THRESHOLD = float(os.getenv("NEAR_DUP_THRESHOLD", "0.8"))
+
+NUM_PERM = 64
+BANDS = 16          # 16 bands x 4 rows: ~64% of pairs at Jaccard 0.5 become candidates, >99.9% at 0.8
+SHINGLE_WORDS = 3
+
+_WORD_RE = re.compile(r"\w+")
+_URL_RE = re.compile(r"https?://\S+")
+_PRIME = (1 << 61) - 1
+_rng = np.random.default_rng(0x5EED)
+_A = _rng.integers(1, 1 << 29, NUM_PERM, dtype=np.uint64)
+_B = _rng.integers(0, 1 << 29, NUM_PERM, dtype=np.uint64)
+
+
+def shingles(text):
+    words = _WORD_RE.findall(_URL_RE.sub(" ", text.casefold()))
+    if len(words) < SHINGLE_WORDS:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+
+def minhash(text):
+    """NUM_PERM-value MinHash signature of text's word shingles, or None if it has no words."""
+    grams = shingles(text)
+    if not grams:
+        return None
+    hashes = np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams))
+    # (a * x + b) mod p for every permutation and shingle; fits in uint64
+    permuted = (hashes[:, None] * _A[None, :] + _B[None, :]) % np.uint64(_PRIME)
+    return permuted.min(axis=0)
+
+
+class NearDuplicateFilter:
+    """Remembers texts seen so far and flags ones too similar to an earlier text."""
+
+    def __init__(self, threshold=None):
+        self.threshold = NEAR_DUP_THRESHOLD if threshold is None else threshold
+        self.rows = NUM_PERM // BANDS
+        self.buckets = {}
+        self.signatures = []
+        self.dropped = 0
+
+    def is_duplicate(self, text):
+        """True if text nearly duplicates an earlier one; otherwise remember it."""
+        signature = minhash(text)
+        if signature is None:
+            return False
+        keys = [(band, signature[band * self.rows:(band + 1) * self.rows].tobytes()) for band in range(BANDS)]
+
+        candidates = set()
+        for key in keys:
+            candidates.update(self.buckets.get(key, ()))
+        for other in candidates:
+            if np.mean(self.signatures[other] == signature) >= self.threshold:
+                self.dropped += 1
+                return True
+
+        index = len(self.signatures)
+        self.signatures.append(signature)
+        for key in keys:
+            self.buckets.setdefault(key, []).append(index)
+        return False
@@ -0,0 +1,171 @@
+import os
+import re
+import json
+import hashlib
+import threading
+
+import numpy as np
+
+import shared_index
+
+# On-disk embedding cache. Vectors never change for a given
+# (provider, embed model, text), so they are content-addressed and reused
+# across restarts instead of being re-embedded on every cold start.
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "embeddings")
+
+MANIFEST_FILE = "manifest.json"
+VECTORS_FILE = "vectors.f32"
+KEYS_FILE = "keys.log"
+
+
+def make_key(provider, model, text):
+    """Content hash identifying one embedding: sha256(provider, model, text)."""
+    h = hashlib.sha256()
+    h.update(f"{provider}\0{model}\0".encode("utf-8"))
+    h.update(text.encode("utf-8"))
+    return h.hexdigest()
+
+
+def _write_at(path, offset, data):
+    """Write data at offset, drop anything after it and flush to disk."""
+    with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+        f.seek(offset)
+        f.write(data)
+        f.truncate()
+        f.flush()
+        os.fsync(f.fileno())
+
+
+class EmbeddingStore:
+    """
+    Append-only store of float32 vectors, their keys and a small JSON
+    manifest that commits how much of both files is valid.
+
+    Layout (one directory per provider/model):
+        vectors.f32    raw float32 rows, memory-mapped read-only
+        keys.log       one key per line; line i belongs to row i
+        manifest.json  {"provider", "model", "dim", "count", "keys_bytes"}
+
+    An append writes the new rows and keys past the committed ends, then
+    atomically replaces the manifest, so its cost depends on the batch, not
+    on the store's size. A crash mid-write leaves only uncommitted trailing
+    bytes that the next append overwrites. Appends hold a file lock and
+    first read any rows another process committed, so several worker
+    processes can share one directory.
+    """
+
+    def __init__(self, provider, model, cache_dir=None):
+        self.provider = provider
+        self.model = model
+        cache_dir = cache_dir or os.getenv("EMBED_CACHE_DIR") or DEFAULT_CACHE_DIR
+        safe_name = re.sub(r"[^A-Za-z0-9_.-]+", "_", f"{provider}-{model}")
+        self.directory = os.path.join(cache_dir, safe_name)
+        self.manifest_path = os.path.join(self.directory, MANIFEST_FILE)
+        self.vectors_path = os.path.join(self.directory, VECTORS_FILE)
+        self.keys_path = os.path.join(self.directory, KEYS_FILE)
+
+        self.dim = None
+        self.keys = []
+        self.rows = {}
+        self._keys_bytes = 0
+        self._vectors = None
+        self._lock = threading.Lock()
+        self._load()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _reset(self):
+        self.dim, self.keys, self.rows, self._keys_bytes, self._vectors = None, [], {}, 0, None
+
+    def _load(self):
+        """Read the committed state, or just the keys added since the last read."""
+        if not os.path.exists(self.manifest_path):
+            return
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            dim, count, keys_bytes = int(manifest["dim"]), int(manifest["count"]), int(manifest["keys_bytes"])
+            if dim != self.dim or keys_bytes < self._keys_bytes:
+                self._reset()
+            if keys_bytes > self._keys_bytes:
+                with open(self.keys_path, "rb") as f:
+                    f.seek(self._keys_bytes)
+                    new_keys = f.read(keys_bytes - self._keys_bytes).decode("utf-8").splitlines()
+                for key in new_keys:
+                    self.rows[key] = len(self.keys)
+                    self.keys.append(key)
+                self._keys_bytes = keys_bytes
+            # Trust only rows that are fully present on disk
+            size = os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0
+            if len(self.keys) != count or size < count * dim * 4:
+                raise ValueError(f"manifest commits {count} rows, files hold {len(self.keys)} keys / {size} bytes")
+            self.dim = dim
+            self._remap()
+        except Exception as e:
+            print(f"[Embedding Store] Ignoring unreadable cache at {self.directory}: {e}")
+            self._reset()
+
+    def _commit(self, count, keys_bytes):
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"provider": self.provider, "model": self.model, "dim": self.dim,
+                       "count": count, "keys_bytes": keys_bytes}, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _remap(self):
+        if self.keys:
+            self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r",
+                                      shape=(len(self.keys), self.dim))
+        else:
+            self._vectors = None
+
+    def get_many(self, keys):
+        """Return {key: float32 vector} for every key already in the store."""
+        with self._lock:
+            found = [(k, self.rows[k]) for k in keys if k in self.rows]
+            if not found:
+                return {}
+            block = np.asarray(self._vectors[[row for _, row in found]])
+        return {k: block[i] for i, (k, _) in enumerate(found)}
+
+    def put_many(self, keys, vectors):
+        """
+        Persist new vectors. Keys already stored, failed (all-zero) vectors
+        and vectors whose dimension doesn't match the store are skipped.
+        Returns the number of rows written.
+        """
+        with self._lock, shared_index.file_lock(os.path.join(self.directory, ".lock")):
+            self._load()  # rows another process committed since we last looked
+            new_keys, new_rows, seen = [], [], set()
+            for key, vec in zip(keys, vectors):
+                if key in self.rows or key in seen:
+                    continue
+                arr = np.asarray(vec, dtype=np.float32)
+                if arr.ndim != 1 or arr.size == 0 or not np.any(arr):
+                    continue
+                if self.dim is None:
+                    self.dim = arr.size
+                if arr.size != self.dim:
+                    continue
+                seen.add(key)
+                new_keys.append(key)
+                new_rows.append(arr)
+
+            if not new_keys:
+                return 0
+
+            os.makedirs(self.directory, exist_ok=True)
+            self._vectors = None  # release the map before touching the file
+            _write_at(self.vectors_path, len(self.keys) * self.dim * 4, np.stack(new_rows).tobytes())
+            key_data = "".join(k + "\n" for k in new_keys).encode("utf-8")
+            _write_at(self.keys_path, self._keys_bytes, key_data)
+            keys_bytes = self._keys_bytes + len(key_data)
+
+            for key in new_keys:
+                self.rows[key] = len(self.keys)
+                self.keys.append(key)
+            self._keys_bytes = keys_bytes
+            self._commit(len(self.keys), keys_bytes)
+            self._remap()
+            return len(new_keys)
@@ -0,0 +1,240 @@
+"""
+Stand-in for an Ollama server, for load tests and offline runs.
+
+    python fake_ollama.py --port 11434 --latency lognormal:0.4,0.5 --tokens-per-sec 40 --error-rate 0.02
+
+Implements GET /api/tags, POST /api/generate (streaming and not),
+POST /api/embed and POST /api/embeddings. Generation time is a sampled
+time-to-first-token plus the reply's tokens at --tokens-per-sec, and the
+finished reply carries Ollama's prompt_eval_*/eval_* stats. Replies to the
+ai-service's JSON prompts (quiz, decompose, grading) are valid JSON so the
+parsing paths run as in production. Embeddings are deterministic per text.
+
+Latency specs: fixed:S, uniform:LO,HI, exp:MEAN, lognormal:MEDIAN,SIGMA
+(seconds). --parallel N serves at most N generations at once, like
+OLLAMA_NUM_PARALLEL; the rest wait.
+"""
+import re
+import sys
+import json
+import math
+import time
+import zlib
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FILLER = ("focus review practice concept example summary recall spaced schedule topic "
+          "notes question answer method step goal progress habit session detail").split()
+
+
+def parse_latency(spec):
+    """A function returning one latency sample in seconds, from e.g. "lognormal:0.4,0.5"."""
+    kind, _, params = spec.partition(":")
+    values = [float(v) for v in params.split(",") if v]
+    if kind == "fixed":
+        return lambda: values[0]
+    if kind == "uniform":
+        return lambda: random.uniform(values[0], values[1])
+    if kind == "exp":
+        return lambda: random.expovariate(1 / values[0])
+    if kind == "lognormal":
+        return lambda: random.lognormvariate(math.log(values[0]), values[1])
+    raise ValueError(f"unknown latency distribution: {spec}")
+
+
+class FakeOllama:
+    def __init__(self, args):
+        self.latency = parse_latency(args.latency)
+        self.embed_latency = parse_latency(args.embed_latency)
+        self.tokens = args.tokens
+        self.tokens_per_sec = args.tokens_per_sec
+        self.error_rate = args.error_rate
+        self.drop_rate = args.drop_rate
+        self.embed_error_rate = args.embed_error_rate
+        self.dim = args.dim
+        self.model = args.model
+        self.slots = threading.BoundedSemaphore(args.parallel) if args.parallel > 0 else None
+        self.lock = threading.Lock()
+        self.counts = {"generate": 0, "embed": 0, "errors": 0, "dropped": 0}
+
+    def count(self, key):
+        with self.lock:
+            self.counts[key] += 1
+
+    # ── Replies ───────────────────────────────────────────────────────────────
+    def reply_for(self, prompt):
+        """Text shaped like what the ai-service asks for, ~self.tokens tokens long."""
+        n = max(1, int(random.gauss(self.tokens, self.tokens / 4)))
+        words = " ".join(random.choice(FILLER) for _ in range(n))
+        if "Reply ONLY with a JSON array, one object per item" in prompt:
+            items = len(re.findall(r"^\d+\. Q:", prompt, re.MULTILINE))
+            return json.dumps([{"index": i, "isCorrect": random.random() < 0.5, "feedback": words[:60]}
+                               for i in range(1, items + 1)])
+        if "Grade this answer" in prompt:
+            return json.dumps({"isCorrect": random.random() < 0.5, "feedback": words[:80]})
+        if "quiz questions" in prompt:
+            return json.dumps([{"question": f"{words[:40]}?", "correctAnswer": words[:20], "hint": words[:30]}
+                               for _ in range(5)])
+        if "actionable steps" in prompt:
+            return json.dumps([f"Step {i}: {words[:40]}" for i in range(1, 5)])
+        return words
+
+    def embedding(self, text):
+        rng = random.Random(zlib.crc32(text.encode("utf-8")))
+        return [rng.gauss(0, 1) for _ in range(self.dim)]
+
+    def stats(self, prompt, reply, prompt_seconds, eval_seconds):
+        return {
+            "model": self.model, "done": True,
+            "prompt_eval_count": len(prompt.split()),
+            "prompt_eval_duration": int(prompt_seconds * 1e9),
+            "eval_count": len(reply.split()),
+            "eval_duration": int(eval_seconds * 1e9),
+            "total_duration": int((prompt_seconds + eval_seconds) * 1e9),
+        }
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "FakeOllama/1.0"
+
+    def log_message(self, *args):
+        pass
+
+    @property
+    def fake(self):
+        return self.server.fake
+
+    def send_json(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.startswith("/api/tags"):
+            self.send_json(200, {"models": [{"name": self.fake.model}, {"name": "nomic-embed-text:latest"}]})
+        else:
+            self.send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.path == "/api/generate":
+            self.generate(body)
+        elif self.path in ("/api/embed", "/api/embeddings"):
+            self.embed(body)
+        else:
+            self.send_json(404, {"error": "not found"})
+
+    def embed(self, body):
+        fake = self.fake
+        fake.count("embed")
+        time.sleep(fake.embed_latency())
+        if random.random() < fake.embed_error_rate:
+            fake.count("errors")
+            self.send_json(500, {"error": "injected embedding failure"})
+        elif self.path == "/api/embed":
+            inputs = body.get("input", [])
+            inputs = [inputs] if isinstance(inputs, str) else inputs
+            self.send_json(200, {"model": body.get("model"), "embeddings": [fake.embedding(t) for t in inputs]})
+        else:
+            self.send_json(200, {"embedding": fake.embedding(body.get("prompt", ""))})
+
+    def generate(self, body):
+        fake = self.fake
+        fake.count("generate")
+        roll = random.random()
+        if roll < fake.drop_rate:
+            fake.count("dropped")
+            self.close_connection = True  # no response: the client sees a connection error
+            return
+        if roll < fake.drop_rate + fake.error_rate:
+            fake.count("errors")
+            self.send_json(500, {"error": "injected generation failure"})
+            return
+
+        if fake.slots:
+            fake.slots.acquire()
+        try:
+            prompt = body.get("prompt", "")
+            reply = fake.reply_for(prompt)
+            first_token = fake.latency()
+            per_token = 1 / fake.tokens_per_sec
+            tokens = reply.split(" ")
+            if body.get("stream", True):
+                self.stream(prompt, tokens, first_token, per_token)
+            else:
+                time.sleep(first_token + len(tokens) * per_token)
+                payload = fake.stats(prompt, reply, first_token, len(tokens) * per_token)
+                payload["response"] = reply
+                self.send_json(200, payload)
+        finally:
+            if fake.slots:
+                fake.slots.release()
+
+    def stream(self, prompt, tokens, first_token, per_token):
+        # Newline-delimited JSON; no Content-Length, so the connection closes at the end
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        time.sleep(first_token)
+        for i, token in enumerate(tokens):
+            chunk = {"model": self.fake.model, "response": token if i == 0 else " " + token, "done": False}
+            self.wfile.write((json.dumps(chunk) + "\n").encode("utf-8"))
+            self.wfile.flush()
+            time.sleep(per_token)
+        final = self.fake.stats(prompt, " ".join(tokens), first_token, len(tokens) * per_token)
+        final["response"] = ""
+        self.wfile.write((json.dumps(final) + "\n").encode("utf-8"))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Fake Ollama server for load tests.")
+    add_arguments(parser)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    return parser
+
+
+def add_arguments(parser):
+    """Behaviour options, shared with loadtest.py which can start this server itself."""
+    parser.add_argument("--latency", default="lognormal:0.3,0.4", help="time to first token distribution")
+    parser.add_argument("--tokens", type=int, default=60, help="mean reply length in tokens")
+    parser.add_argument("--tokens-per-sec", type=float, default=40.0, help="generation speed")
+    parser.add_argument("--embed-latency", default="fixed:0.01", help="per-request embedding latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of generations answered 500")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="fraction of generations dropped unanswered")
+    parser.add_argument("--embed-error-rate", type=float, default=0.0, help="fraction of embedding calls answered 500")
+    parser.add_argument("--parallel", type=int, default=0, help="concurrent generations (0 = unlimited)")
+    parser.add_argument("--dim", type=int, default=768, help="embedding dimension")
+    parser.add_argument("--model", default="qwen2.5:0.5b", help="model name reported by /api/tags")
+
+
+def make_server(args, host="127.0.0.1", port=11434):
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    server.fake = FakeOllama(args)
+    return server
+
+
+def main():
+    args = build_parser().parse_args()
+    server = make_server(args, args.host, args.port)
+    print(f"Fake Ollama listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"Served: {server.fake.counts}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,38 +2,80 @@ import os
 import requests
 import json
 import re
+import time
 import logging
 
+import httpx
+
+import async_http
+import chunking
+import llm_scheduler
+import metrics
+import ollama_health
+import providers
+import response_cache
+import single_flight
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-GENERATOR_MODEL_NAME = os.getenv("OLLAMA_MODEL", "qwen2.5:0.5b")
+GENERATOR_MODEL_NAME = providers.get("ollama").chat_model
+GEMINI_MODEL_NAME = providers.get("gemini").chat_model
 
-# ── Provider selection ────────────────────────────────────────────────────────
-def get_provider():
-    """
-    Determine which AI provider to use.
-    Priority: Environment variable > GEMINI_API_KEY presence > Ollama availability > default ollama
-    """
-    env_provider = os.getenv("AI_PROVIDER", "").lower()
-    
-    # Explicit provider set
-    if env_provider in ["gemini", "ollama"]:
-        print(f"Using provider from AI_PROVIDER env var: {env_provider}")
-        return env_provider
-    
-    # Auto-detect based on available API keys
-    if os.getenv("GEMINI_API_KEY"):
-        print("Auto-detected Gemini API key, using Gemini provider")
-        return "gemini"
-    
-    print("No API key found, defaulting to Ollama (local)")
-    return "ollama"
+OLLAMA_OPTIONS = {
+    "num_predict": 512,
+    "temperature": 0.7,
+    "top_p": 0.9
+}
 
+# ── Provider selection ────────────────────────────────────────────────────────
+# Chosen once per process; see providers.resolve
 def initialize_generator():
-    provider = get_provider()
-    model = os.getenv("OLLAMA_MODEL", "qwen2.5:0.5b") if provider == "ollama" else "gemini-1.5-flash"
-    print(f"Generator: provider={provider}, model={model}")
+    provider = providers.active()
+    print(f"Generator: provider={provider.name}, model={provider.chat_model}")
+
+# ── Ollama health ─────────────────────────────────────────────────────────────
+# Availability is tracked by a circuit breaker fed from real calls and a
+# background monitor, so generations don't probe /api/tags first.
+ollama_breaker = ollama_health.CircuitBreaker(
+    failure_threshold=int(os.getenv("OLLAMA_BREAKER_THRESHOLD", "3")),
+    reset_timeout=float(os.getenv("OLLAMA_BREAKER_RESET", "10")),
+)
+ollama_monitor = ollama_health.OllamaHealthMonitor(
+    ollama_breaker, interval=float(os.getenv("OLLAMA_HEALTH_INTERVAL", "15")))
+
+OLLAMA_DOWN_MESSAGE = "Error: Cannot connect to Ollama. Run 'ollama serve'."
+
+def start_health_monitor():
+    if providers.get_provider() == "ollama":
+        ollama_monitor.start()
+
+def record_ollama_result(status_code=None, error=None):
+    """Feed the breaker: connection errors and 5xx count as Ollama being down."""
+    if error is None and status_code is not None and status_code < 500:
+        ollama_breaker.record_success()
+    else:
+        ollama_breaker.record_failure(error or f"HTTP {status_code}")
+        ollama_monitor.trigger()
+
+# ── Ollama generation stats ───────────────────────────────────────────────────
+# Ollama reports token counts and durations (ns) with each finished generation
+ollama_tokens = metrics.Counter("ollama_tokens_total",
+                                "Tokens processed by Ollama; phase is prompt or eval (generated).", ["phase"])
+ollama_seconds = metrics.Counter("ollama_duration_seconds_total",
+                                 "Ollama-reported processing time; phase is prompt or eval.", ["phase"])
+ollama_tokens_per_second = metrics.Histogram("ollama_eval_tokens_per_second",
+                                             "Generation speed reported by Ollama (eval_count / eval_duration).",
+                                             buckets=(1, 2, 5, 10, 20, 35, 50, 75, 100, 150, 250, 500))
+
+def record_ollama_stats(data):
+    for phase, count_key, duration_key in (("prompt", "prompt_eval_count", "prompt_eval_duration"),
+                                           ("eval", "eval_count", "eval_duration")):
+        count, duration = data.get(count_key) or 0, (data.get(duration_key) or 0) / 1e9
+        ollama_tokens.inc(count, phase=phase)
+        ollama_seconds.inc(duration, phase=phase)
+        if phase == "eval" and count and duration:
+            ollama_tokens_per_second.observe(count / duration)
 
 # ── Ollama call ───────────────────────────────────────────────────────────────
 def call_ollama(prompt, model=None):
@@ -41,12 +83,8 @@ def call_ollama(prompt, model=None):
         model = os.getenv("OLLAMA_MODEL", "qwen2.5:0.5b")
     base_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
 
-    try:
-        health = requests.get(f"{base_url}/api/tags", timeout=3)
-        if health.status_code != 200:
-            return "Error: Ollama not responding."
-    except Exception:
-        return "Error: Cannot connect to Ollama. Run 'ollama serve'."
+    if not ollama_breaker.allow_request():
+        return OLLAMA_DOWN_MESSAGE
 
     try:
         response = requests.post(f"{base_url}/api/generate", json={
@@ -54,22 +92,66 @@ def call_ollama(prompt, model=None):
             "prompt": prompt,
             "stream": False,
             "keep_alive": "30m",   # keep model in VRAM for 30 min between requests
-            "options": {
-                "num_predict": 512,
-                "temperature": 0.7,
-                "top_p": 0.9
-            }
-        }, timeout=180)
+            "options": OLLAMA_OPTIONS
+        }, timeout=(5, 180))
+        record_ollama_result(response.status_code)
 
         if response.status_code == 200:
-            return response.json().get("response", "").strip()
+            data = response.json()
+            record_ollama_stats(data)
+            return data.get("response", "").strip()
         else:
             logger.error(f"Ollama error {response.status_code}: {response.text[:200]}")
             return f"Error: Ollama returned {response.status_code}. Is model '{model}' downloaded?"
+    except requests.exceptions.ConnectTimeout as e:
+        # A subclass of Timeout, but unreachable rather than slow
+        record_ollama_result(error=str(e) or "connect timeout")
+        return OLLAMA_DOWN_MESSAGE
     except requests.exceptions.Timeout:
+        # Slow, not down (model loading) — a success as far as the breaker is concerned
+        record_ollama_result(200)
+        return "Error: Ollama timed out. The model may be loading — try again in 10 seconds."
+    except Exception as e:
+        logger.error(f"Ollama exception: {e}")
+        record_ollama_result(error=str(e))
+        return "Error: Could not connect to Ollama."
+
+async def call_ollama_async(prompt, model=None):
+    """Non-blocking call_ollama over the shared pooled AsyncClient."""
+    if model is None:
+        model = os.getenv("OLLAMA_MODEL", "qwen2.5:0.5b")
+    base_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+    client = async_http.get_client()
+
+    if not ollama_breaker.allow_request():
+        return OLLAMA_DOWN_MESSAGE
+
+    try:
+        response = await client.post(f"{base_url}/api/generate", json={
+            "model": model,
+            "prompt": prompt,
+            "stream": False,
+            "keep_alive": "30m",
+            "options": OLLAMA_OPTIONS
+        }, timeout=httpx.Timeout(180, connect=5))
+        record_ollama_result(response.status_code)
+
+        if response.status_code == 200:
+            data = response.json()
+            record_ollama_stats(data)
+            return data.get("response", "").strip()
+        else:
+            logger.error(f"Ollama error {response.status_code}: {response.text[:200]}")
+            return f"Error: Ollama returned {response.status_code}. Is model '{model}' downloaded?"
+    except httpx.ConnectTimeout as e:
+        record_ollama_result(error=str(e) or "connect timeout")
+        return OLLAMA_DOWN_MESSAGE
+    except httpx.TimeoutException:
+        record_ollama_result(200)
         return "Error: Ollama timed out. The model may be loading — try again in 10 seconds."
     except Exception as e:
         logger.error(f"Ollama exception: {e}")
+        record_ollama_result(error=str(e) or type(e).__name__)
         return "Error: Could not connect to Ollama."
 
 # ── Gemini call ───────────────────────────────────────────────────────────────
@@ -77,7 +159,7 @@ def call_gemini(prompt):
     api_key = os.getenv("GEMINI_API_KEY")
     if not api_key:
         return "Error: GEMINI_API_KEY not set."
-    url = f"https://generativelanguage.googleapis.com/v1/models/gemini-1.5-flash:generateContent"
+    url = f"https://generativelanguage.googleapis.com/v1/models/{GEMINI_MODEL_NAME}:generateContent"
     try:
         response = requests.post(url, params={"key": api_key},
             headers={"Content-Type": "application/json"},
@@ -90,54 +172,348 @@ def call_gemini(prompt):
     except Exception as e:
         return f"Error: {e}"
 
+async def call_gemini_async(prompt):
+    """Non-blocking call_gemini over the shared pooled AsyncClient."""
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        return "Error: GEMINI_API_KEY not set."
+    url = f"https://generativelanguage.googleapis.com/v1/models/{GEMINI_MODEL_NAME}:generateContent"
+    try:
+        response = await async_http.get_client().post(url, params={"key": api_key},
+            headers={"Content-Type": "application/json"},
+            json={"contents": [{"parts": [{"text": prompt}]}]},
+            timeout=30)
+        if response.status_code == 200:
+            return response.json()["candidates"][0]["content"]["parts"][0]["text"].strip()
+        logger.error(f"Gemini error {response.status_code}: {response.text[:200]}")
+        return f"Error: Gemini returned {response.status_code}"
+    except Exception as e:
+        return f"Error: {e}"
+
+# ── Streaming calls ───────────────────────────────────────────────────────────
+# Async generators yielding text chunks as the model produces them. Failures
+# are yielded as a single "Error: ..." chunk, like the non-streaming calls.
+async def stream_ollama_async(prompt, model=None):
+    if model is None:
+        model = os.getenv("OLLAMA_MODEL", "qwen2.5:0.5b")
+    base_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+
+    if not ollama_breaker.allow_request():
+        yield OLLAMA_DOWN_MESSAGE
+        return
+
+    try:
+        async with async_http.get_client().stream("POST", f"{base_url}/api/generate", json={
+            "model": model,
+            "prompt": prompt,
+            "stream": True,
+            "keep_alive": "30m",
+            "options": OLLAMA_OPTIONS
+        }, timeout=httpx.Timeout(180, connect=5)) as response:
+            record_ollama_result(response.status_code)
+            if response.status_code != 200:
+                body = (await response.aread()).decode("utf-8", "replace")
+                logger.error(f"Ollama error {response.status_code}: {body[:200]}")
+                yield f"Error: Ollama returned {response.status_code}. Is model '{model}' downloaded?"
+                return
+            # Newline-delimited JSON, one object per token batch
+            async for line in response.aiter_lines():
+                if not line.strip():
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("response"):
+                    yield chunk["response"]
+                if chunk.get("done"):
+                    record_ollama_stats(chunk)
+                    break
+    except httpx.ConnectTimeout as e:
+        record_ollama_result(error=str(e) or "connect timeout")
+        yield OLLAMA_DOWN_MESSAGE
+    except httpx.TimeoutException:
+        # Reachable but slow: settles a half-open trial like call_ollama_async does
+        record_ollama_result(200)
+        yield "Error: Ollama timed out. The model may be loading — try again in 10 seconds."
+    except Exception as e:
+        logger.error(f"Ollama stream exception: {e}")
+        record_ollama_result(error=str(e) or type(e).__name__)
+        yield "Error: Could not connect to Ollama."
+
+async def stream_gemini_async(prompt):
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        yield "Error: GEMINI_API_KEY not set."
+        return
+    url = f"https://generativelanguage.googleapis.com/v1/models/{GEMINI_MODEL_NAME}:streamGenerateContent"
+    try:
+        async with async_http.get_client().stream("POST", url, params={"key": api_key, "alt": "sse"},
+                headers={"Content-Type": "application/json"},
+                json={"contents": [{"parts": [{"text": prompt}]}]},
+                timeout=httpx.Timeout(60, connect=5)) as response:
+            if response.status_code != 200:
+                body = (await response.aread()).decode("utf-8", "replace")
+                logger.error(f"Gemini error {response.status_code}: {body[:200]}")
+                yield f"Error: Gemini returned {response.status_code}"
+                return
+            # Server-sent events: "data: {GenerateContentResponse}"
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = json.loads(line[5:])
+                for candidate in data.get("candidates", [])[:1]:
+                    for part in candidate.get("content", {}).get("parts", []):
+                        if part.get("text"):
+                            yield part["text"]
+    except Exception as e:
+        yield f"Error: {e}"
+
+def stream_ai_async(prompt):
+    if providers.get_provider() == "gemini":
+        return stream_gemini_async(prompt)
+    return stream_ollama_async(prompt)
+
+ASSISTANT_MARKER = "Assistant:"
+
+class ChatStreamCleaner:
+    """
+    Streaming equivalent of reply.split("Assistant:")[-1].strip().
+
+    feed() turns raw model chunks into ("token", text) events, holding back
+    any tail that might be the start of the marker. If a marker shows up
+    after text was already sent, a ("reset", None) event tells the client
+    to discard what it has shown. reply is the final cleaned text.
+    """
+
+    def __init__(self):
+        self.raw = ""
+        self.start = 0       # where the current reply begins in raw
+        self.sent = 0        # raw[start:sent] has been handled
+        self.emitted = False
+
+    def _held_back(self):
+        for n in range(min(len(ASSISTANT_MARKER) - 1, len(self.raw) - self.sent), 0, -1):
+            if ASSISTANT_MARKER.startswith(self.raw[-n:]):
+                return n
+        return 0
+
+    def _flush(self, end):
+        events = []
+        segment = self.raw[self.sent:end]
+        if not self.emitted:
+            segment = segment.lstrip()
+        if segment:
+            events.append(("token", segment))
+            self.emitted = True
+        self.sent = max(self.sent, end)
+        return events
+
+    def feed(self, chunk):
+        events = []
+        self.raw += chunk
+        marker_at = self.raw.rfind(ASSISTANT_MARKER)
+        if marker_at >= 0 and marker_at + len(ASSISTANT_MARKER) > self.start:
+            if self.emitted:
+                events.append(("reset", None))
+            self.start = self.sent = marker_at + len(ASSISTANT_MARKER)
+            self.emitted = False
+        return events + self._flush(len(self.raw) - self._held_back())
+
+    def finish(self):
+        return self._flush(len(self.raw))
+
+    @property
+    def reply(self):
+        return self.raw.split(ASSISTANT_MARKER)[-1].strip()
+
+# ── Response cache ────────────────────────────────────────────────────────────
+# Opt-in (RESPONSE_CACHE_ENABLED=true). Only callers that pass a cache_policy
+# are cached; the policy sets how long a response stays valid, in seconds.
+RESPONSE_CACHE_POLICIES = {
+    "improve-notes": 7 * 24 * 3600,
+    "decompose": 7 * 24 * 3600,
+    "plan": 24 * 3600,
+    "quiz": 3600,   # short, so "try again" soon produces new questions
+}
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() in ("1", "true", "yes", "on")
+llm_response_cache = response_cache.ResponseCache(
+    os.getenv("RESPONSE_CACHE_PATH"),
+    max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "5000")),
+)
+
+def get_generation_settings(provider):
+    """(model, options) used for a generation — part of the response cache key."""
+    if provider == "gemini":
+        return GEMINI_MODEL_NAME, {}
+    return os.getenv("OLLAMA_MODEL", "qwen2.5:0.5b"), OLLAMA_OPTIONS
+
+def cache_lookup(provider, prompt, cache_policy, bypass_cache):
+    """
+    Returns (cache_key, ttl, cached_response). cache_key is None when the
+    call isn't cacheable; cached_response is None on a miss or bypass.
+    """
+    ttl = RESPONSE_CACHE_POLICIES.get(cache_policy) if RESPONSE_CACHE_ENABLED else None
+    if not ttl:
+        return None, None, None
+    model, options = get_generation_settings(provider)
+    cache_key = response_cache.make_key(provider, model, options, prompt)
+    cached = None if bypass_cache else llm_response_cache.get(cache_key)
+    return cache_key, ttl, cached
+
+def cache_store(cache_key, response, cache_policy, ttl):
+    # Never cache failures
+    if cache_key and response and not response.startswith("Error"):
+        llm_response_cache.put(cache_key, response, cache_policy, ttl)
+
+# ── Single-flight ─────────────────────────────────────────────────────────────
+# Identical concurrent generations (same provider, model, options and prompt)
+# share one upstream request; see single_flight
+inflight_calls = single_flight.SingleFlight()
+inflight_calls_async = single_flight.AsyncSingleFlight()
+
+def flight_key(provider, prompt):
+    model, options = get_generation_settings(provider)
+    return response_cache.make_key(provider, model, options, prompt)
+
+# ── Scheduling ────────────────────────────────────────────────────────────────
+# At most LLM_CONCURRENCY_<BACKEND> generations run per backend; the rest
+# queue by priority (interactive chat, then standard features, then batch
+# jobs like plans and analysis) and a full queue refuses with QueueFull,
+# which main turns into 429 + Retry-After. One coalesced flight holds one slot.
+def _queue_limits():
+    return {p: int(os.getenv(f"LLM_QUEUE_LIMIT_{p.upper()}", default))
+            for p, default in zip(llm_scheduler.PRIORITIES, ("32", "16", "8"))}
+
+scheduler = llm_scheduler.LLMScheduler(
+    concurrency={
+        "ollama": int(os.getenv("LLM_CONCURRENCY_OLLAMA", "2")),
+        "gemini": int(os.getenv("LLM_CONCURRENCY_GEMINI", "8")),
+    },
+    queue_limits=_queue_limits(),
+)
+
+def check_capacity(priority):
+    """Raise llm_scheduler.QueueFull up front, e.g. before starting a stream."""
+    scheduler.admit(providers.get_provider(), priority)
+
 # ── Unified call ──────────────────────────────────────────────────────────────
-def call_ai(prompt):
-    if get_provider() == "gemini":
-        return call_gemini(prompt)
-    return call_ollama(prompt)
+def call_ai(prompt, cache_policy=None, bypass_cache=False, priority="standard"):
+    """
+    Generate a response with the active provider. With a cache_policy (and
+    the cache enabled) identical requests are answered from disk; bypass_cache
+    skips the lookup but still stores the fresh response. Identical calls
+    already in flight are joined rather than repeated. priority picks the
+    scheduler queue the call waits in for a backend slot.
+    """
+    provider = providers.get_provider()
+    cache_key, ttl, cached = cache_lookup(provider, prompt, cache_policy, bypass_cache)
+    if cached is not None:
+        return cached
+
+    def generate():
+        start = time.perf_counter()
+        with scheduler.slot_sync(provider, priority):
+            metrics.stage_seconds.observe(time.perf_counter() - start, stage="queue")
+            with metrics.stage("generate"):
+                if provider == "gemini":
+                    response = call_gemini(prompt)
+                else:
+                    response = call_ollama(prompt)
+        cache_store(cache_key, response, cache_policy, ttl)
+        return response
+
+    return inflight_calls.do(flight_key(provider, prompt), generate)
+
+async def call_ai_async(prompt, cache_policy=None, bypass_cache=False, priority="standard"):
+    """call_ai for request handlers: awaits the model without blocking the event loop."""
+    provider = providers.get_provider()
+    cache_key, ttl, cached = cache_lookup(provider, prompt, cache_policy, bypass_cache)
+    if cached is not None:
+        return cached
+
+    async def generate():
+        start = time.perf_counter()
+        async with scheduler.slot(provider, priority):
+            metrics.stage_seconds.observe(time.perf_counter() - start, stage="queue")
+            with metrics.stage("generate"):
+                if provider == "gemini":
+                    response = await call_gemini_async(prompt)
+                else:
+                    response = await call_ollama_async(prompt)
+        cache_store(cache_key, response, cache_policy, ttl)
+        return response
+
+    return await inflight_calls_async.do(flight_key(provider, prompt), generate)
 
 # ── Feature functions ─────────────────────────────────────────────────────────
-def generate_chat_response(message, history, context=""):
-    greetings = {"hi", "hello", "hey", "greetings", "good morning", "sup"}
-    if message.lower().strip() in greetings:
-        return "Hello! I'm your AI Study Coach. Ask me about your topics, progress, or study tips."
+GREETINGS = {"hi", "hello", "hey", "greetings", "good morning", "sup"}
+# Retrieved context per chat turn, in (estimated) tokens; about two chunks
+CHAT_CONTEXT_TOKENS = int(os.getenv("CHAT_CONTEXT_TOKENS", "320"))
+GREETING_REPLY = "Hello! I'm your AI Study Coach. Ask me about your topics, progress, or study tips."
 
+def build_chat_prompt(message, history, context=""):
     # Keep context short for small models
-    ctx_snippet = context[:800] if context else ""
+    ctx_snippet = chunking.truncate_tokens(context, CHAT_CONTEXT_TOKENS) if context else ""
     history_snippet = ""
     if history:
         recent = history[-4:]  # last 2 exchanges
         history_snippet = "\n".join(f"{m['role'].capitalize()}: {m['content'][:200]}" for m in recent)
 
-    prompt = f"""You are a helpful study coach. Answer briefly and directly.
+    return f"""You are a helpful study coach. Answer briefly and directly.
 
 Context: {ctx_snippet}
 {f'Recent chat:{chr(10)}{history_snippet}' if history_snippet else ''}
 
 User: {message}
 Answer:"""
-    return call_ai(prompt)
 
+def generate_chat_response(message, history, context=""):
+    if message.lower().strip() in GREETINGS:
+        return GREETING_REPLY
+    return call_ai(build_chat_prompt(message, history, context), priority="interactive")
+
+async def generate_chat_response_async(message, history, context=""):
+    if message.lower().strip() in GREETINGS:
+        return GREETING_REPLY
+    return await call_ai_async(build_chat_prompt(message, history, context), priority="interactive")
+
+async def stream_chat_response_async(message, history, context=""):
+    """Yields the chat reply in chunks as the model generates it."""
+    if message.lower().strip() in GREETINGS:
+        yield GREETING_REPLY
+        return
+    start = time.perf_counter()
+    async with scheduler.slot(providers.get_provider(), "interactive"):
+        metrics.stage_seconds.observe(time.perf_counter() - start, stage="queue")
+        with metrics.stage("generate"):
+            async for chunk in stream_ai_async(build_chat_prompt(message, history, context)):
+                yield chunk
 
-def generate_study_plan(topics, goals, hours_per_week):
-    prompt = f"""Create a weekly study schedule.
+
+def build_study_plan_prompt(topics, goals, hours_per_week):
+    return f"""Create a weekly study schedule.
 Topics: {', '.join(topics)}
 Goal: {goals}
 Hours/week: {hours_per_week}
 
 Write a clear day-by-day plan. Be concise."""
-    return call_ai(prompt)
 
+def generate_study_plan(topics, goals, hours_per_week, bypass_cache=False):
+    prompt = build_study_plan_prompt(topics, goals, hours_per_week)
+    return call_ai(prompt, cache_policy="plan", bypass_cache=bypass_cache, priority="batch")
+
+async def generate_study_plan_async(topics, goals, hours_per_week, bypass_cache=False):
+    prompt = build_study_plan_prompt(topics, goals, hours_per_week)
+    return await call_ai_async(prompt, cache_policy="plan", bypass_cache=bypass_cache, priority="batch")
 
-def generate_subtasks(task, context=""):
-    prompt = f"""Break this learning task into 4 short actionable steps.
+
+def build_subtasks_prompt(task, context=""):
+    return f"""Break this learning task into 4 short actionable steps.
 Task: {task}
 {f'Context: {context}' if context else ''}
 
 Return ONLY a JSON array of strings, no other text.
 Example: ["Step 1", "Step 2", "Step 3", "Step 4"]"""
 
-    response = call_ai(prompt)
+def parse_subtasks(response):
     try:
         match = re.search(r'\[.*?\]', response, re.DOTALL)
         if match:
@@ -148,6 +524,17 @@ Example: ["Step 1", "Step 2", "Step 3", "Step 4"]"""
     lines = [l.strip().lstrip('-•123456789. ') for l in response.split('\n') if l.strip()]
     return [l for l in lines if l][:5]
 
+def generate_subtasks(task, context="", bypass_cache=False):
+    response = call_ai(build_subtasks_prompt(task, context), cache_policy="decompose", bypass_cache=bypass_cache)
+    with metrics.stage("parse"):
+        return parse_subtasks(response)
+
+async def generate_subtasks_async(task, context="", bypass_cache=False):
+    response = await call_ai_async(build_subtasks_prompt(task, context), cache_policy="decompose",
+                                   bypass_cache=bypass_cache)
+    with metrics.stage("parse"):
+        return parse_subtasks(response)
+
 
 def generate_text(prompt, max_length=300):
     return call_ai(prompt)
@@ -0,0 +1,212 @@
+import os
+import re
+import json
+import asyncio
+import logging
+from fractions import Fraction
+
+import generator
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Grading is decided locally whenever the answer is obviously right or
+# wrong; only the remaining questions reach the model, all in one prompt.
+OVERLAP_CORRECT_THRESHOLD = 0.8
+GRADE_CONCURRENCY = int(os.getenv("GRADE_CONCURRENCY", "3"))
+
+_ARTICLES = {"a", "an", "the"}
+_NUMBER_RE = re.compile(r"^[-+]?(\d+(\.\d*)?|\.\d+)(e[-+]?\d+)?$")
+_FRACTION_RE = re.compile(r"^[-+]?\d+\s*/\s*\d+$")
+
+# Tokens that can flip an answer's meaning; "t" is what's left of "n't"
+# after normalize_answer drops the apostrophe
+_NEGATIONS = {"not", "no", "never", "none", "nor", "neither", "nothing", "without", "cannot", "t",
+              "false", "incorrect", "wrong"}
+_NEGATING_PREFIXES = ("un", "in", "im", "il", "ir", "non", "dis", "anti")
+
+
+def normalize_answer(text):
+    """Casefold, drop punctuation and articles, collapse whitespace."""
+    text = str(text or "").casefold()
+    text = re.sub(r"[^\w\s./%-]", " ", text)
+    tokens = [t.strip(".") for t in text.split()]
+    return " ".join(t for t in tokens if t and t not in _ARTICLES)
+
+
+def parse_number(text):
+    """Parse '42', '3.50', '1/2', '50%' or '1,000' to a Fraction, else None."""
+    text = str(text or "").strip().replace(",", "")
+    scale = 1
+    if text.endswith("%"):
+        text, scale = text[:-1].strip(), Fraction(1, 100)
+    try:
+        if _FRACTION_RE.match(text):
+            num, den = (int(p) for p in text.split("/"))
+            return Fraction(num, den) * scale if den else None
+        if _NUMBER_RE.match(text.lower()):
+            return Fraction(text) * scale
+    except (ValueError, ZeroDivisionError):
+        pass
+    return None
+
+
+def token_overlap(expected, answer):
+    """F1 of the token multisets of two normalized answers."""
+    exp_tokens, ans_tokens = expected.split(), answer.split()
+    if not exp_tokens or not ans_tokens:
+        return 0.0
+    remaining = list(exp_tokens)
+    common = 0
+    for token in ans_tokens:
+        if token in remaining:
+            remaining.remove(token)
+            common += 1
+    if common == 0:
+        return 0.0
+    precision = common / len(ans_tokens)
+    recall = common / len(exp_tokens)
+    return 2 * precision * recall / (precision + recall)
+
+
+def _extra_tokens(tokens, other):
+    """Tokens of tokens not matched by one in other (multiset difference)."""
+    remaining = list(other)
+    extra = []
+    for token in tokens:
+        if token in remaining:
+            remaining.remove(token)
+        else:
+            extra.append(token)
+    return extra
+
+
+def is_negating(token):
+    """True for negations and words that may carry a negating prefix (unstable, inorganic)."""
+    if token in _NEGATIONS:
+        return True
+    return any(token.startswith(p) and len(token) - len(p) >= 3 for p in _NEGATING_PREFIXES)
+
+
+def overlap_is_safe(expected, answer):
+    """
+    Token overlap may only decide "correct" when the answer adds nothing
+    to the expected answer, and what it leaves out can't change its meaning.
+    """
+    exp_tokens, ans_tokens = expected.split(), answer.split()
+    if _extra_tokens(ans_tokens, exp_tokens):
+        return False
+    return not any(is_negating(t) for t in _extra_tokens(exp_tokens, ans_tokens))
+
+
+def grade_fast(question):
+    """
+    Decide the obvious cases without a model call. Returns
+    {"isCorrect", "feedback"} or None when the model should grade it.
+    """
+    expected = normalize_answer(question.get("correctAnswer", ""))
+    answer = normalize_answer(question.get("userAnswer", ""))
+
+    if not answer:
+        return {"isCorrect": False, "feedback": "No answer given."}
+    if not expected:
+        return None
+    if answer == expected:
+        return {"isCorrect": True, "feedback": "Correct — matches the expected answer."}
+
+    expected_num = parse_number(question.get("correctAnswer", ""))
+    answer_num = parse_number(question.get("userAnswer", ""))
+    if expected_num is not None and answer_num is not None:
+        if expected_num == answer_num:
+            return {"isCorrect": True, "feedback": "Correct — numerically equivalent."}
+        return {"isCorrect": False, "feedback": f"Incorrect — the expected answer is {question.get('correctAnswer')}."}
+
+    if token_overlap(expected, answer) >= OVERLAP_CORRECT_THRESHOLD and overlap_is_safe(expected, answer):
+        return {"isCorrect": True, "feedback": "Correct — essentially the expected answer."}
+    return None
+
+
+def build_grade_prompt(question):
+    return f"""Grade this answer. Reply ONLY with JSON.
+Q: {question.get('question','')}
+Correct: {question.get('correctAnswer','')}
+User: {question.get('userAnswer','')}
+JSON: {{"isCorrect":true/false,"feedback":"one sentence"}}"""
+
+
+def build_batch_grade_prompt(questions):
+    items = "\n".join(
+        f"{i}. Q: {q.get('question','')}\n   Correct: {q.get('correctAnswer','')}\n   User: {q.get('userAnswer','')}"
+        for i, q in enumerate(questions, 1)
+    )
+    return f"""Grade each answer. Reply ONLY with a JSON array, one object per item, in order.
+{items}
+JSON: [{{"index":1,"isCorrect":true/false,"feedback":"one sentence"}}]"""
+
+
+def parse_grade(response):
+    try:
+        match = re.search(r'\{[^{}]*\}', response, re.DOTALL)
+        if match:
+            return json.loads(match.group())
+    except Exception:
+        pass
+    return {"isCorrect": False, "feedback": "Could not grade."}
+
+
+def parse_batch_grades(response, count):
+    """Map item index -> grade from a batched response; missing items are absent."""
+    grades = {}
+    try:
+        match = re.search(r'\[.*\]', response, re.DOTALL)
+        items = json.loads(match.group()) if match else []
+    except Exception:
+        items = []
+    if not isinstance(items, list):
+        return grades
+    for position, item in enumerate(items):
+        if not isinstance(item, dict) or "isCorrect" not in item:
+            continue
+        index = item.get("index", position + 1)
+        if isinstance(index, int) and 1 <= index <= count:
+            grades[index - 1] = item
+    return grades
+
+
+async def grade_questions_async(questions):
+    """
+    Grade a quiz with at most one model call in the common case: fast-path
+    decisions first, then one batched prompt for the rest. Items the batch
+    reply doesn't cover are graded individually, GRADE_CONCURRENCY at a time.
+    """
+    results = [grade_fast(q) for q in questions]
+    pending = [i for i, r in enumerate(results) if r is None]
+
+    if len(pending) > 1:
+        response = await generator.call_ai_async(build_batch_grade_prompt([questions[i] for i in pending]))
+        with metrics.stage("parse"):
+            batch = parse_batch_grades(response, len(pending))
+        for j, i in enumerate(pending):
+            if j in batch:
+                results[i] = batch[j]
+        pending = [i for i in pending if results[i] is None]
+        if pending:
+            logger.info(f"Batched grading covered {len(batch)} items; grading {len(pending)} individually")
+
+    semaphore = asyncio.Semaphore(max(1, GRADE_CONCURRENCY))
+
+    async def grade_one(i):
+        async with semaphore:
+            response = await generator.call_ai_async(build_grade_prompt(questions[i]))
+            with metrics.stage("parse"):
+                results[i] = parse_grade(response)
+
+    await asyncio.gather(*(grade_one(i) for i in pending))
+
+    return [{
+        "question": q.get("question"),
+        "userAnswer": q.get("userAnswer"),
+        "correctAnswer": q.get("correctAnswer"),
+        "isCorrect": bool(result.get("isCorrect", False)),
+        "feedback": result.get("feedback", "")
+    } for q, result in zip(questions, results)]
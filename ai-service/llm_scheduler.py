@@ -0,0 +1,221 @@
+import math
+import time
+import heapq
+import asyncio
+import itertools
+import threading
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+
+# Admission control in front of the model backends. Each backend runs at
+# most `concurrency` generations at once; further calls wait in a priority
+# queue (interactive before standard before batch, FIFO within a class),
+# and a class whose queue is full is refused with a Retry-After estimate.
+PRIORITIES = ("interactive", "standard", "batch")
+
+WAITING = "waiting"
+GRANTED = "granted"
+CANCELLED = "cancelled"
+
+# Recent waits kept per priority for percentiles
+WAIT_WINDOW = 512
+
+
+class QueueFull(Exception):
+    def __init__(self, backend, priority, retry_after):
+        super().__init__(f"{backend} {priority} queue is full; retry in {retry_after}s")
+        self.backend = backend
+        self.priority = priority
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ("rank", "seq", "priority", "state", "enqueued", "loop", "future", "event")
+
+    def __init__(self, priority, seq):
+        self.rank = PRIORITIES.index(priority)
+        self.seq = seq
+        self.priority = priority
+        self.state = WAITING
+        self.enqueued = time.monotonic()
+        self.loop = None
+        self.future = None
+        self.event = None
+
+    def __lt__(self, other):
+        return (self.rank, self.seq) < (other.rank, other.seq)
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class BackendQueue:
+    """
+    Slots for one backend. Both asyncio tasks and threads can wait; a
+    released slot is handed straight to the best waiter, so a newcomer
+    can't overtake the queue.
+    """
+
+    def __init__(self, name, concurrency, queue_limits):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.queue_limits = queue_limits
+        self.active = 0
+        self.service_time = 5.0  # EWMA seconds a slot is held, for Retry-After
+        self._heap = []
+        self._queued = {p: 0 for p in PRIORITIES}
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._waits = {p: deque(maxlen=WAIT_WINDOW) for p in PRIORITIES}
+        self._admitted = {p: 0 for p in PRIORITIES}
+        self._rejected = {p: 0 for p in PRIORITIES}
+        self._wait_total = {p: 0.0 for p in PRIORITIES}
+
+    # ── Admission ─────────────────────────────────────────────────────────────
+    def _retry_after(self, rank):
+        ahead = sum(self._queued[p] for p in PRIORITIES[:rank + 1])
+        return min(60, max(1, math.ceil((ahead + 1) * self.service_time / self.concurrency)))
+
+    def _check_limit(self, priority):
+        if self._queued[priority] >= self.queue_limits.get(priority, 0):
+            self._rejected[priority] += 1
+            raise QueueFull(self.name, priority, self._retry_after(PRIORITIES.index(priority)))
+
+    def admit(self, priority):
+        """Raise QueueFull now if a call at this priority would be refused."""
+        with self._lock:
+            if self.active >= self.concurrency:
+                self._check_limit(priority)
+
+    def _enter(self, priority):
+        """Under the lock: take a free slot (returns None) or enqueue a waiter."""
+        if self.active < self.concurrency:
+            self.active += 1
+            self._record_wait(priority, 0.0)
+            return None
+        self._check_limit(priority)
+        waiter = _Waiter(priority, next(self._seq))
+        heapq.heappush(self._heap, waiter)
+        self._queued[priority] += 1
+        return waiter
+
+    def _record_wait(self, priority, seconds):
+        self._admitted[priority] += 1
+        self._wait_total[priority] += seconds
+        self._waits[priority].append(seconds)
+
+    # ── Acquire / release ─────────────────────────────────────────────────────
+    async def acquire_async(self, priority):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            waiter = self._enter(priority)
+            if waiter is None:
+                return
+            waiter.loop, waiter.future = loop, loop.create_future()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter.state == WAITING:
+                    waiter.state = CANCELLED
+                    self._queued[priority] -= 1
+                    raise
+            # Granted while being cancelled: pass the slot on
+            self.release()
+            raise
+
+    def acquire(self, priority):
+        with self._lock:
+            waiter = self._enter(priority)
+            if waiter is None:
+                return
+            waiter.event = threading.Event()
+        waiter.event.wait()
+
+    def release(self, held=None):
+        with self._lock:
+            if held is not None:
+                self.service_time = 0.8 * self.service_time + 0.2 * held
+            while self._heap:
+                waiter = heapq.heappop(self._heap)
+                if waiter.state != WAITING:
+                    continue
+                waiter.state = GRANTED
+                self._queued[waiter.priority] -= 1
+                self._record_wait(waiter.priority, time.monotonic() - waiter.enqueued)
+                if waiter.event is not None:
+                    waiter.event.set()
+                else:
+                    waiter.loop.call_soon_threadsafe(_resolve, waiter.future)
+                return
+            self.active -= 1
+
+    # ── Metrics ───────────────────────────────────────────────────────────────
+    def stats(self):
+        with self._lock:
+            classes = {}
+            for p in PRIORITIES:
+                waits = sorted(self._waits[p])
+                pick = lambda q: round(waits[min(len(waits) - 1, int(q * len(waits)))], 4) if waits else 0.0
+                classes[p] = {
+                    "queued": self._queued[p],
+                    "queue_limit": self.queue_limits.get(p, 0),
+                    "admitted": self._admitted[p],
+                    "rejected": self._rejected[p],
+                    "wait_avg": round(self._wait_total[p] / self._admitted[p], 4) if self._admitted[p] else 0.0,
+                    "wait_p50": pick(0.5),
+                    "wait_p95": pick(0.95),
+                    "wait_max": round(waits[-1], 4) if waits else 0.0,
+                }
+            return {"concurrency": self.concurrency, "active": self.active,
+                    "service_time": round(self.service_time, 3), "priorities": classes}
+
+
+class LLMScheduler:
+    """One BackendQueue per backend name, created on first use."""
+
+    def __init__(self, concurrency, queue_limits, default_concurrency=2):
+        self.concurrency = concurrency
+        self.queue_limits = queue_limits
+        self.default_concurrency = default_concurrency
+        self._queues = {}
+        self._lock = threading.Lock()
+
+    def queue(self, backend):
+        with self._lock:
+            queue = self._queues.get(backend)
+            if queue is None:
+                queue = BackendQueue(backend, self.concurrency.get(backend, self.default_concurrency),
+                                     self.queue_limits)
+                self._queues[backend] = queue
+            return queue
+
+    def admit(self, backend, priority):
+        self.queue(backend).admit(priority)
+
+    @asynccontextmanager
+    async def slot(self, backend, priority):
+        queue = self.queue(backend)
+        await queue.acquire_async(priority)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            queue.release(time.monotonic() - start)
+
+    @contextmanager
+    def slot_sync(self, backend, priority):
+        queue = self.queue(backend)
+        queue.acquire(priority)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            queue.release(time.monotonic() - start)
+
+    def stats(self):
+        with self._lock:
+            queues = list(self._queues.values())
+        return {queue.name: queue.stats() for queue in queues}
@@ -0,0 +1,340 @@
+"""
+Load test for the ai-service's /rag/* endpoints.
+
+    # Self-contained: starts fake_ollama and the service on free ports
+    python loadtest.py --start --rps 10 --duration 60
+    python loadtest.py --start --rps 20 --latency lognormal:0.8,0.5 --parallel 2 --error-rate 0.05
+
+    # Against an already running service
+    python loadtest.py --url http://127.0.0.1:8000 --rps 5 --endpoints chat,quiz,knowledge
+
+Requests are sent open-loop at --rps (Poisson arrivals with --poisson), so a
+slow service builds up concurrency instead of slowing the test down. Each
+arrival goes to the next endpoint in the weighted mix. The report gives
+per-endpoint throughput, p50/p95/p99 latency, time to first byte for the
+streamed chat, error rate and 429s (scheduler backpressure) separately.
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import tempfile
+import threading
+import subprocess
+import itertools
+
+import httpx
+
+import fake_ollama
+
+NOTES = "Spaced repetition schedules reviews at growing intervals. Active recall means testing yourself."
+MODEL_ERROR_MARKER = b'"Error: '
+
+QUESTIONS = [
+    {"question": "What is 2+2?", "userAnswer": "4", "correctAnswer": "4"},
+    {"question": "Define spaced repetition", "userAnswer": "reviewing over time",
+     "correctAnswer": "Reviewing material at increasing intervals"},
+    {"question": "Capital of France?", "userAnswer": "Lyon", "correctAnswer": "Paris"},
+]
+
+
+# ── Scenarios ─────────────────────────────────────────────────────────────────
+# name -> (weight, fn(i, state) -> (method, path, json body or None))
+def _chat(i, state):
+    return "POST", "/rag/chat", {"message": f"How should I review topic {i % 50}?", "history": []}
+
+def _chat_stream(i, state):
+    return "POST", "/rag/chat/stream", {"message": f"Explain study technique number {i % 50}", "history": []}
+
+def _analyze(i, state):
+    return "POST", "/rag/analyze", {
+        "topics": [{"title": f"Topic {i % 20}", "category": "Math", "status": "active", "goal": "exam"}],
+        "sessions": [{"date": "2025-01-10", "duration": 45, "notes": NOTES}],
+    }
+
+def _improve_notes(i, state):
+    return "POST", "/rag/improve-notes", {"notes": f"{NOTES} ({i})", "topic": "Memory"}
+
+def _plan(i, state):
+    return "POST", "/rag/plan", {"topics": ["Algebra", f"Topic {i % 10}"], "goals": "Pass the exam", "hours_per_week": 6}
+
+def _decompose(i, state):
+    return "POST", "/rag/decompose", {"task": f"Learn chapter {i % 30} of calculus", "context": ""}
+
+def _quiz(i, state):
+    return "POST", "/rag/quiz", {"topic": f"Topic {i % 25}", "notes": NOTES, "difficulty": "Medium"}
+
+def _grade(i, state):
+    return "POST", "/rag/grade", {"questions": QUESTIONS}
+
+def _knowledge(i, state):
+    return "GET", "/rag/knowledge?limit=50", None
+
+def _categories(i, state):
+    return "GET", "/rag/knowledge/categories", None
+
+def _knowledge_write(i, state):
+    # Add, then replace and delete earlier additions, so the index stays near its size
+    ids = state.setdefault("ids", [])
+    body = {"category": "Load Test", "content": f"Load test resource {i}: {NOTES}"}
+    if len(ids) > 5 and i % 3 == 1:
+        return "PUT", f"/rag/knowledge/{ids[-1]}", body
+    if len(ids) > 5 and i % 3 == 2:
+        return "DELETE", f"/rag/knowledge/{ids.pop(0)}", None
+    doc_id = f"loadtest-{i}"
+    ids.append(doc_id)
+    return "POST", "/rag/knowledge", dict(body, id=doc_id)
+
+SCENARIOS = {
+    "chat": (4, _chat),
+    "chat_stream": (4, _chat_stream),
+    "analyze": (1, _analyze),
+    "improve_notes": (1, _improve_notes),
+    "plan": (1, _plan),
+    "decompose": (1, _decompose),
+    "quiz": (2, _quiz),
+    "grade": (2, _grade),
+    "knowledge": (2, _knowledge),
+    "categories": (1, _categories),
+    "knowledge_write": (1, _knowledge_write),
+}
+
+
+def endpoint_cycle(names, seed=0):
+    """Endless weighted sequence of scenario names, shuffled deterministically."""
+    deck = [name for name in names for _ in range(SCENARIOS[name][0])]
+    random.Random(seed).shuffle(deck)
+    return itertools.cycle(deck)
+
+
+# ── Driver ────────────────────────────────────────────────────────────────────
+class Stats:
+    def __init__(self):
+        self.latencies = []
+        self.first_byte = []
+        self.ok = 0
+        self.errors = 0
+        self.rejected = 0
+        self.statuses = {}
+
+    def record(self, status, seconds, first_byte=None):
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        if status == 429:
+            self.rejected += 1
+        elif isinstance(status, int) and status < 400:
+            self.ok += 1
+            self.latencies.append(seconds)
+            if first_byte is not None:
+                self.first_byte.append(first_byte)
+        else:
+            self.errors += 1
+
+
+def percentile(samples, q):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+async def send(client, name, method, path, body, stats):
+    start = time.perf_counter()
+    try:
+        async with client.stream(method, path, json=body) as response:
+            first_byte, content = None, bytearray()
+            async for chunk in response.aiter_bytes():
+                if first_byte is None:
+                    first_byte = time.perf_counter() - start
+                content += chunk
+            # The service reports model failures as "Error: ..." text inside a 200
+            status = response.status_code
+            if status == 200 and MODEL_ERROR_MARKER in content:
+                status = "model-error"
+            stats[name].record(status, time.perf_counter() - start,
+                               first_byte if name == "chat_stream" else None)
+    except httpx.HTTPError as e:
+        stats[name].record(type(e).__name__, time.perf_counter() - start)
+
+
+async def run_load(url, rps, duration, names, poisson, timeout, seed=0):
+    stats = {name: Stats() for name in names}
+    cycle = endpoint_cycle(names, seed)
+    rng = random.Random(seed)
+    state = {}
+    tasks = []
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=200)
+    async with httpx.AsyncClient(base_url=url, timeout=timeout, limits=limits) as client:
+        start = time.perf_counter()
+        next_at, i, max_lag = 0.0, 0, 0.0
+        while next_at < duration:
+            delay = start + next_at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                max_lag = max(max_lag, -delay)
+            name = next(cycle)
+            method, path, body = SCENARIOS[name][1](i, state)
+            tasks.append(asyncio.create_task(send(client, name, method, path, body, stats)))
+            i += 1
+            next_at += rng.expovariate(rps) if poisson else 1 / rps
+        sent_for = time.perf_counter() - start
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - start
+    return {"sent": i, "send_seconds": sent_for, "elapsed": elapsed, "max_lag": max_lag, "stats": stats}
+
+
+def summarize(run, target_rps):
+    def ms(value):
+        return round(value * 1000, 1) if value is not None else None
+
+    endpoints = {}
+    for name, s in run["stats"].items():
+        total = s.ok + s.errors + s.rejected
+        if not total:
+            continue
+        endpoints[name] = {
+            "requests": total,
+            "ok": s.ok,
+            "errors": s.errors,
+            "rejected_429": s.rejected,
+            "error_rate": round(s.errors / total, 4),
+            "throughput_rps": round(s.ok / run["elapsed"], 3),
+            "p50_ms": ms(percentile(s.latencies, 50)),
+            "p95_ms": ms(percentile(s.latencies, 95)),
+            "p99_ms": ms(percentile(s.latencies, 99)),
+            "first_byte_p50_ms": ms(percentile(s.first_byte, 50)),
+            "first_byte_p95_ms": ms(percentile(s.first_byte, 95)),
+            "statuses": {str(k): v for k, v in s.statuses.items()},
+        }
+    all_latencies = [x for s in run["stats"].values() for x in s.latencies]
+    ok = sum(e["ok"] for e in endpoints.values())
+    total = sum(e["requests"] for e in endpoints.values())
+    return {
+        "target_rps": target_rps,
+        "offered_rps": round(run["sent"] / run["send_seconds"], 3) if run["send_seconds"] else 0.0,
+        "throughput_rps": round(ok / run["elapsed"], 3),
+        "requests": total,
+        "error_rate": round(sum(e["errors"] for e in endpoints.values()) / total, 4) if total else 0.0,
+        "rejected_429": sum(e["rejected_429"] for e in endpoints.values()),
+        "p50_ms": ms(percentile(all_latencies, 50)),
+        "p95_ms": ms(percentile(all_latencies, 95)),
+        "p99_ms": ms(percentile(all_latencies, 99)),
+        "max_send_lag_ms": ms(run["max_lag"]),
+        "endpoints": endpoints,
+    }
+
+
+def print_report(report):
+    print(f"\n{'endpoint':<16} {'reqs':>6} {'ok':>6} {'err%':>6} {'429':>5} {'rps':>7} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'ttfb p50':>9}")
+    for name, e in report["endpoints"].items():
+        print(f"{name:<16} {e['requests']:>6} {e['ok']:>6} {e['error_rate'] * 100:>6.1f} {e['rejected_429']:>5} "
+              f"{e['throughput_rps']:>7} {e['p50_ms'] or '-':>8} {e['p95_ms'] or '-':>8} {e['p99_ms'] or '-':>8} "
+              f"{e['first_byte_p50_ms'] or '-':>9}")
+    print(f"\nOffered {report['offered_rps']} rps (target {report['target_rps']}), "
+          f"completed {report['throughput_rps']} rps; error rate {report['error_rate'] * 100:.1f}%, "
+          f"{report['rejected_429']} rejected with 429")
+    print(f"Overall latency p50 {report['p50_ms']} ms, p95 {report['p95_ms']} ms, p99 {report['p99_ms']} ms; "
+          f"worst send lag {report['max_send_lag_ms']} ms")
+
+
+# ── Local stack ───────────────────────────────────────────────────────────────
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_ready(url, timeout):
+    """Wait until /ready reports the index built and warmed (503 until then)."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            response = httpx.get(f"{url}/ready", timeout=2)
+            if response.status_code == 200:
+                return True
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    return False
+
+
+def start_stack(args, workdir):
+    """Start fake_ollama in this process and uvicorn in a child; returns (url, server, process)."""
+    ollama_port, service_port = free_port(), free_port()
+    server = fake_ollama.make_server(args, "127.0.0.1", ollama_port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    env = dict(os.environ,
+               AI_PROVIDER="ollama",
+               OLLAMA_BASE_URL=f"http://127.0.0.1:{ollama_port}",
+               OLLAMA_MODEL=args.model,
+               EMBED_CACHE_DIR=os.path.join(workdir, "embeddings"),
+               RESPONSE_CACHE_PATH=os.path.join(workdir, "responses.sqlite3"))
+    log = open(os.path.join(workdir, "service.log"), "w")
+    process = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+                                "--port", str(service_port), "--workers", str(args.workers)],
+                               cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+                               stdout=log, stderr=subprocess.STDOUT)
+    return f"http://127.0.0.1:{service_port}", server, process
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive the ai-service /rag/* endpoints at a target request rate.")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="service to test (ignored with --start)")
+    parser.add_argument("--start", action="store_true", help="start fake_ollama and the service locally")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers with --start")
+    parser.add_argument("--rps", type=float, default=5.0, help="target requests per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to send for")
+    parser.add_argument("--endpoints", default=",".join(SCENARIOS), help="comma-separated scenarios")
+    parser.add_argument("--poisson", action="store_true", help="exponential inter-arrival times")
+    parser.add_argument("--timeout", type=float, default=120.0, help="per-request timeout, seconds")
+    parser.add_argument("--ready-timeout", type=float, default=180.0, help="seconds to wait for indexing")
+    parser.add_argument("--json", help="also write the report here")
+    fake_group = parser.add_argument_group("fake Ollama (with --start)")
+    fake_ollama.add_arguments(fake_group)
+    args = parser.parse_args()
+
+    names = [n.strip() for n in args.endpoints.split(",") if n.strip()]
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown endpoints {unknown}; choose from {', '.join(SCENARIOS)}")
+
+    server = process = None
+    workdir = tempfile.TemporaryDirectory(prefix="rag-load-")
+    url = args.url
+    try:
+        if args.start:
+            url, server, process = start_stack(args, workdir.name)
+            print(f"Started service at {url} (log: {workdir.name}/service.log)")
+        print(f"Waiting for {url} to finish indexing...")
+        if not wait_ready(url, args.ready_timeout):
+            print("Service did not become ready.")
+            return 1
+
+        print(f"Sending {args.rps} rps for {args.duration:.0f}s across {', '.join(names)}")
+        run = asyncio.run(run_load(url, args.rps, args.duration, names, args.poisson, args.timeout))
+        report = summarize(run, args.rps)
+        if server is not None:
+            report["fake_ollama"] = dict(server.fake.counts)
+        print_report(report)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(report, f, indent=2)
+            print(f"Report written to {args.json}")
+        return 0
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+        if server is not None:
+            server.shutdown()
+        workdir.cleanup()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,13 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header, Response
+from fastapi.responses import StreamingResponse, JSONResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import List, Optional
 import uvicorn
 from dotenv import load_dotenv
 import os
+import json
+import time
 from datetime import datetime
 
 # Load environment variables from .env file
@@ -11,9 +15,69 @@ load_dotenv()
 
 import rag_pipeline
 import generator
+import async_http
+import grading
+import llm_scheduler
+import metrics
+import providers
+import record_store
+import startup_profile
 
 app = FastAPI(title="HyperActive AI Service")
 
+# ── Metrics ───────────────────────────────────────────────────────────────────
+# Request latency per route template; for streamed replies this is the time
+# to the first byte (stage timings cover the rest, see metrics.stage)
+http_request_seconds = metrics.Histogram("http_request_duration_seconds", "Request latency by route.",
+                                         ["method", "route", "status"])
+
+@app.middleware("http")
+async def record_latency(request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        http_request_seconds.observe(time.perf_counter() - start, method=request.method,
+                                     route=route.path if route is not None else "unmatched", status=status)
+
+def _cache_stats():
+    return {
+        "query_embedding": rag_pipeline.query_embedding_cache.stats(),
+        "scratch_embedding": rag_pipeline.scratch_embeddings.cache.stats(),
+        "response": generator.llm_response_cache.stats(),
+    }
+
+def _scheduler_stats(field):
+    return {(backend, priority): values[field]
+            for backend, queue in generator.scheduler.stats().items()
+            for priority, values in queue["priorities"].items()}
+
+metrics.Collector("ai_cache_hits_total", "Cache hits.", "counter",
+                  lambda: {(name,): s["hits"] for name, s in _cache_stats().items()}, labels=["cache"])
+metrics.Collector("ai_cache_misses_total", "Cache misses.", "counter",
+                  lambda: {(name,): s["misses"] for name, s in _cache_stats().items()}, labels=["cache"])
+metrics.Collector("ai_cache_hit_ratio", "Hits / lookups since start.", "gauge",
+                  lambda: {(name,): s["hit_ratio"] for name, s in _cache_stats().items()}, labels=["cache"])
+metrics.Collector("ai_single_flight_joined_total", "Generations answered by joining an identical in-flight call.",
+                  "counter", lambda: {(): generator.inflight_calls_async.joined + generator.inflight_calls.joined})
+metrics.Collector("llm_queue_depth", "Calls waiting for a model slot.", "gauge",
+                  lambda: _scheduler_stats("queued"), labels=["backend", "priority"])
+metrics.Collector("llm_rejected_total", "Calls refused with 429 because the queue was full.", "counter",
+                  lambda: _scheduler_stats("rejected"), labels=["backend", "priority"])
+metrics.Collector("llm_active_slots", "Model slots in use.", "gauge",
+                  lambda: {(backend,): q["active"] for backend, q in generator.scheduler.stats().items()},
+                  labels=["backend"])
+
+@app.exception_handler(llm_scheduler.QueueFull)
+async def queue_full_handler(request, exc):
+    # The model backend is saturated for this priority class; ask the client to back off
+    return JSONResponse(status_code=429, content={"detail": str(exc)},
+                        headers={"Retry-After": str(exc.retry_after)})
+
 # Pydantic Models
 class SessionData(BaseModel):
     date: str
@@ -54,37 +118,61 @@ class DecomposeRequest(BaseModel):
 
 import threading
 
+def cache_bypassed(header_value):
+    """True when the client sent X-Cache-Bypass (any value but 0/false)."""
+    return header_value is not None and header_value.strip().lower() not in ("0", "false", "no")
+
 def run_async_init():
     try:
         print("Starting background initialization of RAG index...")
-        docs = rag_pipeline.preprocess_data([])
-        rag_pipeline.build_index(docs)
+        with startup_profile.step("index"):
+            rag_pipeline.init_index()
         print("Background initialization complete.")
         # Warm up the model — send a dummy request so first real call is instant
         print("Warming up model...")
-        generator.call_ai("Hello")
-        print(f"Model warm. Provider: {generator.get_provider()}, Model: {os.getenv('OLLAMA_MODEL', 'qwen2.5:0.5b')}")
+        with startup_profile.step("model warm-up"):
+            generator.call_ai("Hello")
+        print(f"Model warm. Provider: {providers.get_provider()}, Model: {providers.active().chat_model}")
     except Exception as e:
         print(f"Startup Error: {e}")
+    if startup_profile.ENABLED:
+        startup_profile.report()
 
 @app.on_event("startup")
 async def startup_event():
+    age = startup_profile.process_age()
+    if age is not None:
+        startup_profile.record("process start to app", age)
+    with startup_profile.step("resolve provider"):
+        providers.resolve()
     # Load data on startup in a separate thread to avoid blocking the event loop
     # This ensures the server binds to the port immediately and passes health checks
     threading.Thread(target=run_async_init, daemon=True).start()
+    generator.start_health_monitor()
 
-@app.post("/rag/chat")
-async def chat_endpoint(request: ChatRequest):
+@app.on_event("shutdown")
+async def shutdown_event():
+    await async_http.close_client()
+
+async def build_chat_context(request: ChatRequest):
     # 1. Retrieve relevant context
-    context_docs = rag_pipeline.retrieve(request.message, k=2)
+    context_docs = await rag_pipeline.retrieve_async(request.message, k=2)
     context_text = "\n".join(context_docs)
 
     # 2. Append user_context (coach memory) if provided
     if request.user_context:
         context_text = request.user_context + "\n\n" + context_text
+    return context_text
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/rag/chat")
+async def chat_endpoint(request: ChatRequest):
+    context_text = await build_chat_context(request)
 
     # 3. Generate response with history
-    response = generator.generate_chat_response(
+    response = await generator.generate_chat_response_async(
         request.message,
         request.history,
         context_text
@@ -93,40 +181,73 @@ async def chat_endpoint(request: ChatRequest):
     final_response = response.split("Assistant:")[-1].strip()
     return {"reply": final_response}
 
+@app.post("/rag/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest):
+    """
+    Same reply as /rag/chat, streamed as Server-Sent Events:
+      event: token  data: {"text": "..."}   next chunk of the reply
+      event: reset  data: {}                discard text shown so far
+      event: done   data: {"reply": "..."}  final cleaned reply
+      event: error  data: {"detail": "...", "retryAfter": s}  queue filled up before a slot was free
+    """
+    context_text = await build_chat_context(request)
+    # Refuse with 429 now; once the stream has started the status can't change
+    generator.check_capacity("interactive")
+
+    async def events():
+        cleaner = generator.ChatStreamCleaner()
+        try:
+            async for chunk in generator.stream_chat_response_async(request.message, request.history, context_text):
+                for event, text in cleaner.feed(chunk):
+                    yield sse_event(event, {"text": text} if text is not None else {})
+        except llm_scheduler.QueueFull as exc:
+            # Capacity was checked above, but the queue can fill before this stream reaches it
+            yield sse_event("error", {"detail": str(exc), "retryAfter": exc.retry_after})
+            return
+        for event, text in cleaner.finish():
+            yield sse_event(event, {"text": text})
+        yield sse_event("done", {"reply": cleaner.reply})
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 # Removed duplicate /rag/study-plan logic
 # ...
 
 @app.post("/rag/analyze")
 async def analyze_progress(request: AnalyzeRequest):
     combined_data = [t.dict() for t in request.topics] + [s.dict() for s in request.sessions]
-    doc_count = rag_pipeline.build_index(combined_data)
-
-    if doc_count == 0:
+    if not combined_data:
         return {"summary": "No data yet. Start logging study sessions!"}
 
-    context = rag_pipeline.retrieve("progress summary", k=3)
+    # Score this user's data in a scratch index next to the shared corpus,
+    # instead of replacing the global index with it
+    scratch = await run_in_threadpool(rag_pipeline.build_scratch_index, combined_data)
+    context = await rag_pipeline.retrieve_async("progress summary", k=3, scratch=scratch)
     prompt = f"""Summarize this student's learning progress briefly.
 Context: {chr(10).join(context[:2])}
 Question: {request.query}
 Answer in 3-4 sentences:"""
 
-    response_text = generator.call_ai(prompt)
+    response_text = await generator.call_ai_async(prompt, priority="batch")
     return {"summary": response_text, "context_used": context}
 
 @app.post("/rag/improve-notes")
-async def improve_notes(request: ImproveNotesRequest):
+async def improve_notes(request: ImproveNotesRequest, x_cache_bypass: Optional[str] = Header(None)):
     prompt = f"""Rewrite these study notes to be clearer and better structured. Be concise.
 Notes: {request.notes[:600]}
 Improved notes:"""
-    response_text = generator.call_ai(prompt)
+    response_text = await generator.call_ai_async(prompt, cache_policy="improve-notes",
+                                                  bypass_cache=cache_bypassed(x_cache_bypass))
     return {"improvedNotes": response_text}
 
 @app.post("/rag/plan")
-async def generate_study_plan(request: StudyPlanRequest):
-    plan = generator.generate_study_plan(
+async def generate_study_plan(request: StudyPlanRequest, x_cache_bypass: Optional[str] = Header(None)):
+    plan = await generator.generate_study_plan_async(
         request.topics, 
         request.goals, 
-        request.hours_per_week
+        request.hours_per_week,
+        bypass_cache=cache_bypassed(x_cache_bypass)
     )
     # Clean up prompt echo if present
     final_plan = plan.split("Weekly Schedule:")[-1].strip() if "Weekly Schedule:" in plan else plan
@@ -134,8 +255,9 @@ async def generate_study_plan(request: StudyPlanRequest):
     return {"plan": final_plan}
 
 @app.post("/rag/decompose")
-async def decompose_task(request: DecomposeRequest):
-    sub_tasks = generator.generate_subtasks(request.task, request.context)
+async def decompose_task(request: DecomposeRequest, x_cache_bypass: Optional[str] = Header(None)):
+    sub_tasks = await generator.generate_subtasks_async(request.task, request.context,
+                                                        bypass_cache=cache_bypassed(x_cache_bypass))
     # Expected format: JSON list of strings from generator
     return {"subTasks": sub_tasks}
 
@@ -150,9 +272,10 @@ class GradeRequest(BaseModel):
 class ResourceRequest(BaseModel):
     category: str
     content: str
+    id: Optional[str] = None
 
 @app.post("/rag/quiz")
-async def generate_quiz(request: QuizRequest):
+async def generate_quiz(request: QuizRequest, x_cache_bypass: Optional[str] = Header(None)):
     """Generate 5 quiz questions from topic notes."""
     notes_snippet = request.notes[:1000] if request.notes else f"General knowledge about {request.topic}"
     prompt = f"""Generate 5 quiz questions about: {request.topic} ({request.difficulty})
@@ -161,119 +284,118 @@ Notes: {notes_snippet}
 Return ONLY a JSON array, no other text:
 [{{"question":"...","correctAnswer":"...","hint":"..."}}]"""
 
-    response = generator.call_ai(prompt)
+    response = await generator.call_ai_async(prompt, cache_policy="quiz", bypass_cache=cache_bypassed(x_cache_bypass))
     try:
         import re, json
-        match = re.search(r'\[.*\]', response, re.DOTALL)
-        if match:
-            questions = json.loads(match.group())
-            if isinstance(questions, list) and len(questions) > 0:
-                return {"questions": questions}
+        with metrics.stage("parse"):
+            match = re.search(r'\[.*\]', response, re.DOTALL)
+            questions = json.loads(match.group()) if match else None
+        if isinstance(questions, list) and len(questions) > 0:
+            return {"questions": questions}
     except Exception:
         pass
     return {"questions": [], "error": "Could not parse questions. Try again or add more session notes."}
 
 @app.post("/rag/grade")
 async def grade_quiz(request: GradeRequest):
-    """Grade answers using AI semantic matching."""
-    graded = []
-    for q in request.questions:
-        prompt = f"""Grade this answer. Reply ONLY with JSON.
-Q: {q.get('question','')}
-Correct: {q.get('correctAnswer','')}
-User: {q.get('userAnswer','')}
-JSON: {{"isCorrect":true/false,"feedback":"one sentence"}}"""
-
-        response = generator.call_ai(prompt)
-        try:
-            import re, json
-            match = re.search(r'\{[^{}]*\}', response, re.DOTALL)
-            result = json.loads(match.group()) if match else {"isCorrect": False, "feedback": "Could not grade."}
-        except Exception:
-            result = {"isCorrect": False, "feedback": "Could not grade."}
-
-        graded.append({
-            "question": q.get("question"),
-            "userAnswer": q.get("userAnswer"),
-            "correctAnswer": q.get("correctAnswer"),
-            "isCorrect": bool(result.get("isCorrect", False)),
-            "feedback": result.get("feedback", "")
-        })
+    """Grade answers: obvious cases locally, the rest with one batched AI call."""
+    graded = await grading.grade_questions_async(request.questions)
     return {"graded": graded}
 
 @app.post("/rag/knowledge")
 async def add_knowledge(request: ResourceRequest):
     """
     Allow users to add new resources to the knowledge base.
+    Only the new resource is embedded; the rest of the index is untouched.
     """
     try:
-        # Prepend to documents so it's fresh
         doc_text = f"User Resource ({request.category}): {request.content}"
-        rag_pipeline.documents.insert(0, doc_text)
-        
-        # Re-index (incremental would be better, but for small RAM, full rebuild is safer/simpler)
+        doc_id = await run_in_threadpool(rag_pipeline.add_document, doc_text, request.id)
         # Note: In a real DB, we'd save this. Here it's in-memory for the session.
-        # Ideally, backend saves it to MongoDB, then we fetch it.
-        # But for this endpoint, we just add to runtime.
-        # Ideally, we should trigger a background re-index.
-        
-        return {"status": "added", "count": len(rag_pipeline.documents)}
+        return {"status": "added", "id": doc_id, "count": len(rag_pipeline.current_index())}
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.put("/rag/knowledge/{doc_id}")
+async def upsert_knowledge(doc_id: str, request: ResourceRequest):
+    """Replace a resource's content, re-embedding just that document."""
+    try:
+        doc_text = f"User Resource ({request.category}): {request.content}"
+        existed = await run_in_threadpool(rag_pipeline.upsert_document, doc_id, doc_text)
+        return {"status": "updated" if existed else "added", "id": doc_id, "count": len(rag_pipeline.current_index())}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.delete("/rag/knowledge/{doc_id}")
+async def delete_knowledge(doc_id: str):
+    if not await run_in_threadpool(rag_pipeline.delete_document, doc_id):
+        raise HTTPException(status_code=404, detail="Document not found")
+    return {"status": "deleted", "id": doc_id, "count": len(rag_pipeline.current_index())}
+
 @app.get("/rag/knowledge")
-def get_knowledge_base():
+def get_knowledge_base(response: Response, category: Optional[str] = None,
+                       cursor: Optional[int] = None, limit: int = record_store.DEFAULT_PAGE_SIZE,
+                       order: str = "newest"):
     """
-    Return all loaded documents for the Resources page.
+    Return loaded documents for the Resources page from the record store
+    filled at ingest time: newest first (so added resources lead), or
+    ?order=oldest. Filter with ?category=; pages hold ?limit= records (at
+    most MAX_PAGE_SIZE); pass the X-Next-Cursor response header back as
+    ?cursor= for the next one.
     """
-    docs = []
-    
-    # 1. Static Files (formatted nicely)
-    # We loaded them as raw chunks in rag_pipeline. 
-    # Let's try to detect if they are markdown sections.
-    
-    for d in rag_pipeline.documents:
-        # User/System formatted strings
-        if "User Resource (" in d:
-            parts = d.split("): ", 1)
-            cat = parts[0].replace("User Resource (", "")
-            content = parts[1] if len(parts) > 1 else d
-            docs.append({"category": cat, "content": content})
-            
-        elif "# " in d and "**" in d: # Simple MD detection
-             # Guess category from first line
-             lines = d.split('\n')
-             cat_line = lines[0].replace("#", "").strip()
-             content = "\n".join(lines[1:]).strip()
-             docs.append({"category": "Guide", "title": cat_line, "content": content})
-             
-        elif "General Knowledge (" in d:
-            parts = d.split("): ", 1)
-            cat = parts[0].replace("General Knowledge (", "")
-            docs.append({"category": cat, "content": parts[1]})
-            
-        elif "Session on" not in d and "Topic:" not in d: # Exclude raw user data
-             # Check if it's one of our markdown files
-             docs.append({"category": "Study Material", "content": d})
-             
-    return docs
+    if limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be positive")
+    if order not in ("newest", "oldest"):
+        raise HTTPException(status_code=400, detail="order must be newest or oldest")
+    records, next_cursor = rag_pipeline.current_index().records.page(
+        category, cursor, min(limit, record_store.MAX_PAGE_SIZE), newest_first=order == "newest")
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = str(next_cursor)
+    return [record.to_dict() for record in records]
+
+@app.get("/rag/knowledge/categories")
+def get_knowledge_categories():
+    """Listed categories with document counts, for the Resources page filter."""
+    return rag_pipeline.current_index().records.categories()
 
 @app.get("/health")
 def health_check():
-    return {"status": "ok", "model": generator.GENERATOR_MODEL_NAME}
+    # Cached breaker state only — never probes Ollama on the request path
+    return {"status": "ok", "model": generator.GENERATOR_MODEL_NAME, "ollama": generator.ollama_monitor.status()}
+
+@app.get("/ready")
+def readiness_check():
+    """Load balancer readiness: 503 until the index is built and warmed, with build progress either way."""
+    ready, details = rag_pipeline.readiness()
+    return JSONResponse(details, status_code=200 if ready else 503)
 
 @app.get("/debug")
 def debug_info():
     """Debug endpoint to check configuration and connectivity"""
+    snapshot = rag_pipeline.current_index()
     return {
         "status": "ok",
-        "provider": generator.get_provider(),
-        "model": os.getenv('OLLAMA_MODEL', 'qwen2.5:0.5b') if generator.get_provider() == 'ollama' else 'gemini-1.5-flash',
+        "provider": providers.get_provider(),
+        "model": providers.active().chat_model,
         "gemini_key_set": bool(os.getenv("GEMINI_API_KEY")),
         "ai_provider_env": os.getenv("AI_PROVIDER", "not-set"),
         "ollama_url": os.getenv("OLLAMA_BASE_URL", "http://localhost:11434"),
+        "query_cache": rag_pipeline.query_embedding_cache.stats(),
+        "vector_index": snapshot.index.stats() if snapshot.index is not None else None,
+        "embeddings_memory": rag_pipeline.embedding_footprint(snapshot),
+        "response_cache": dict(generator.llm_response_cache.stats(), enabled=generator.RESPONSE_CACHE_ENABLED),
+        "single_flight": generator.inflight_calls_async.stats(),
+        "llm_scheduler": generator.scheduler.stats(),
+        "startup": startup_profile.steps(),
         "timestamp": str(datetime.now())
     }
 
+@app.get("/metrics")
+def metrics_endpoint():
+    """Prometheus scrape target: latencies, stage timings, index size, caches, model throughput."""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 if __name__ == "__main__":
     uvicorn.run("main:app", host="127.0.0.1", port=8000, reload=True)
@@ -0,0 +1,107 @@
+import os
+import time
+import threading
+
+import requests
+
+CLOSED = "closed"        # Ollama healthy, calls go through
+OPEN = "open"            # Ollama down, calls fail fast
+HALF_OPEN = "half_open"  # trial call in flight to see if Ollama is back
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures and fails fast
+    until reset_timeout has passed; then a single half-open trial decides
+    whether to close again or stay open for another reset_timeout.
+    """
+
+    def __init__(self, failure_threshold=3, reset_timeout=10.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.last_error = None
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                return True
+            # OPEN and cooling down, or a half-open trial is already in flight
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self.last_error = None
+
+    def record_failure(self, error=None):
+        with self._lock:
+            self.failures += 1
+            self.last_error = error
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def status(self):
+        return {"state": self.state, "consecutive_failures": self.failures, "last_error": self.last_error}
+
+
+class OllamaHealthMonitor:
+    """
+    Background thread that probes GET /api/tags every interval seconds
+    (and right away when a real call fails), feeding the breaker so the
+    generation hot path never pays for a health check.
+    """
+
+    def __init__(self, breaker, interval=15.0):
+        self.breaker = breaker
+        self.interval = interval
+        self.last_checked = None
+        self._wake = threading.Event()
+        self._thread = None
+
+    def check(self):
+        base_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+        try:
+            response = requests.get(f"{base_url}/api/tags", timeout=3)
+            if response.status_code == 200:
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure(f"/api/tags returned {response.status_code}")
+        except Exception as e:
+            self.breaker.record_failure(str(e))
+        self.last_checked = time.time()
+
+    def trigger(self):
+        """Ask for an immediate out-of-band check."""
+        self._wake.set()
+
+    def _run(self):
+        self.check()
+        while True:
+            if self.breaker.state == OPEN:
+                # Sleep until the breaker may go half-open, then probe
+                wait = max(0.0, self.breaker.opened_at + self.breaker.reset_timeout - time.monotonic())
+                self._wake.wait(wait)
+                self._wake.clear()
+                if self.breaker.allow_request():
+                    self.check()
+            else:
+                self._wake.wait(self.interval)
+                self._wake.clear()
+                self.check()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="ollama-health", daemon=True)
+            self._thread.start()
+
+    def status(self):
+        return dict(self.breaker.status(), last_checked=self.last_checked, monitoring=self._thread is not None)
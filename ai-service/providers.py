@@ -0,0 +1,72 @@
+import os
+import threading
+
+# Model providers. The generator and the embedder both ask get_provider()
+# which backend to use; the answer is worked out once per process and
+# cached, so request paths don't re-read the environment or log the choice
+# on every call. A provider registers its chat and embedding models and,
+# for auto-detection, the environment variable holding its API key.
+
+
+class Provider:
+    __slots__ = ("name", "chat_model", "embed_model", "key_env")
+
+    def __init__(self, name, chat_model, embed_model, key_env=None):
+        self.name = name
+        self.chat_model = chat_model
+        self.embed_model = embed_model
+        self.key_env = key_env
+
+
+_registry = {}
+_active = None
+_reason = None
+_lock = threading.Lock()
+
+
+def register(name, chat_model, embed_model, key_env=None):
+    _registry[name] = Provider(name, chat_model, embed_model, key_env)
+
+
+def get(name):
+    return _registry[name]
+
+
+register("ollama", os.getenv("OLLAMA_MODEL", "qwen2.5:0.5b"), os.getenv("OLLAMA_EMBED_MODEL", "nomic-embed-text"))
+register("gemini", "gemini-1.5-flash", "models/embedding-001", key_env="GEMINI_API_KEY")
+
+
+def resolve():
+    """
+    Choose the provider for this process, once.
+    Priority: AI_PROVIDER > a provider whose API key is set > ollama (local)
+    """
+    global _active, _reason
+    with _lock:
+        if _active is not None:
+            return _active
+        env_provider = os.getenv("AI_PROVIDER", "").lower()
+        if env_provider in _registry:
+            name, reason = env_provider, "AI_PROVIDER env var"
+        else:
+            keyed = [p.name for p in _registry.values() if p.key_env and os.getenv(p.key_env)]
+            name, reason = (keyed[0], "API key found") if keyed else ("ollama", "default")
+        _active, _reason = _registry[name], reason
+        print(f"Provider: {name} ({reason}); chat model {_active.chat_model}, embeddings {_active.embed_model}")
+        return _active
+
+
+def active():
+    """The selected Provider."""
+    return _active or resolve()
+
+
+def get_provider():
+    """Name of the selected provider ("ollama" or "gemini")."""
+    return (_active or resolve()).name
+
+
+def describe():
+    provider = active()
+    return {"provider": provider.name, "reason": _reason, "chat_model": provider.chat_model,
+            "embed_model": provider.embed_model, "registered": sorted(_registry)}
@@ -0,0 +1,68 @@
+import numpy as np
+
+# Compressed storage for normalized embedding rows. "float16" halves the
+# float32 footprint; "int8" stores each row as int8 codes plus one float32
+# scale (row ≈ codes * scale), about a quarter of float32.
+STORAGE_TYPES = ("float32", "float16", "int8")
+
+# Rows dequantized per matrix product, to bound temporary memory
+CHUNK_ROWS = 16384
+
+
+def quantize(matrix, storage):
+    """
+    Encode float32 rows. Returns (codes, scales); scales is None unless
+    storage is "int8". All-zero rows encode to zero codes and scale 0.
+    """
+    matrix = np.atleast_2d(np.asarray(matrix, dtype=np.float32))
+    if storage == "float16":
+        return matrix.astype(np.float16), None
+    if storage != "int8":
+        return matrix, None
+    peak = np.abs(matrix).max(axis=1) if matrix.size else np.zeros(len(matrix), dtype=np.float32)
+    scales = (peak / 127.0).astype(np.float32)
+    codes = np.zeros(matrix.shape, dtype=np.int8)
+    nonzero = scales > 0
+    codes[nonzero] = np.rint(matrix[nonzero] / scales[nonzero, None]).astype(np.int8)
+    return codes, scales
+
+
+def dequantize(codes, scales, rows=None):
+    """float32 copy of the given rows (all rows if rows is None)."""
+    block = codes if rows is None else codes[rows]
+    block = block.astype(np.float32)
+    if scales is not None:
+        block *= (scales if rows is None else scales[rows])[:, None]
+    return block
+
+
+def score(codes, scales, queries, rows=None):
+    """
+    codes @ queries.T as float32 (n_rows, n_queries), dequantizing
+    CHUNK_ROWS rows at a time so compressed matrices stay compressed.
+    """
+    queries = np.atleast_2d(queries)
+    if codes.dtype == np.float32 and scales is None:
+        return (codes if rows is None else codes[rows]) @ queries.T
+    n = len(codes) if rows is None else len(rows)
+    out = np.empty((n, len(queries)), dtype=np.float32)
+    for start in range(0, n, CHUNK_ROWS):
+        part = slice(start, start + CHUNK_ROWS) if rows is None else rows[start:start + CHUNK_ROWS]
+        out[start:start + CHUNK_ROWS] = dequantize(codes, scales, part) @ queries.T
+    return out
+
+
+def footprint(codes, scales, rows=None):
+    """Bytes held by the first rows rows of codes/scales, and float32/float64 equivalents."""
+    rows = len(codes) if rows is None else rows
+    dim = codes.shape[1] if codes.ndim == 2 else 0
+    used = rows * dim * codes.itemsize + (rows * scales.itemsize if scales is not None else 0)
+    return {
+        "storage": "int8" if scales is not None else str(codes.dtype),
+        "rows": rows,
+        "dim": dim,
+        "bytes": used,
+        "float32_bytes": rows * dim * 4,
+        "float64_bytes": rows * dim * 8,
+        "saving_vs_float32": round(1 - used / (rows * dim * 4), 3) if rows and dim else 0.0,
+    }
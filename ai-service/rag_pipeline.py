@@ -1,41 +1,64 @@
 import os
-import google.generativeai as genai
+import time
+import uuid
+import random
+import asyncio
+import hashlib
+import threading
+import contextlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 import numpy as np
+import requests
 
-# Configure Gemini
-api_key = os.getenv("GEMINI_API_KEY")
-if api_key:
-    genai.configure(api_key=api_key)
+import async_http
+import providers
+import record_store
+import bm25
+import dedup
+import data_loader
+import ttl_cache
+import embedding_store
+import vector_index
+import quantization
+import metrics
+import shared_index
 
-# In-memory storage suitable for < 1000 docs (Extremely fast & light)
-documents = []
-document_embeddings = None
+# The shared corpus lives in an IndexSnapshot (see current_index): texts,
+# ids, L2-normalized vectors in EMBED_STORAGE precision (for int8, row i ≈
+# codes[i] * scales[i]), a validity mask for rows whose embedding succeeded,
+# BM25, the dense index and parsed records, all for the same rows. Readers
+# take one snapshot and use only it; writers publish a new one.
 
-import requests
+# "dense" (embeddings), "lexical" (BM25) or "hybrid" (reciprocal rank fusion)
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "dense").lower()
+RETRIEVAL_MODES = ("dense", "lexical", "hybrid")
 
-def get_provider():
-    """
-    Determine which AI provider to use.
-    Priority: Environment variable > GEMINI_API_KEY presence > Ollama availability > default ollama
-    """
-    env_provider = os.getenv("AI_PROVIDER", "").lower()
-    
-    # Explicit provider set
-    if env_provider in ["gemini", "ollama"]:
-        return env_provider
-    
-    # Auto-detect based on available API keys
-    if os.getenv("GEMINI_API_KEY"):
-        return "gemini"
-    
-    return "ollama"
+# Indexing throughput knobs for the Ollama embedder
+OLLAMA_EMBED_BATCH_SIZE = int(os.getenv("OLLAMA_EMBED_BATCH_SIZE", "64"))
+OLLAMA_EMBED_CONCURRENCY = int(os.getenv("OLLAMA_EMBED_CONCURRENCY", "4"))
+OLLAMA_EMBED_RETRIES = int(os.getenv("OLLAMA_EMBED_RETRIES", "3"))
+
+_http_session = None
+
+def get_http_session():
+    """Shared keep-alive session, pooled for the embedding concurrency."""
+    global _http_session
+    if _http_session is None:
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4,
+                                                pool_maxsize=max(OLLAMA_EMBED_CONCURRENCY, 10))
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        _http_session = session
+    return _http_session
 
 def call_ollama_embedding(text):
     base_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
     model = os.getenv("OLLAMA_EMBED_MODEL", "nomic-embed-text")
     url = f"{base_url}/api/embeddings"
     try:
-        response = requests.post(url, json={
+        response = get_http_session().post(url, json={
             "model": model,
             "prompt": text
         }, timeout=30)
@@ -46,86 +69,140 @@ def call_ollama_embedding(text):
     except:
         return [0.0] * 768
 
+async def call_ollama_embedding_async(text):
+    """call_ollama_embedding over the shared pooled AsyncClient."""
+    base_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+    model = os.getenv("OLLAMA_EMBED_MODEL", "nomic-embed-text")
+    try:
+        response = await async_http.get_client().post(f"{base_url}/api/embeddings", json={
+            "model": model,
+            "prompt": text
+        }, timeout=30)
+        if response.status_code == 200:
+            return response.json().get('embedding', [])
+        return [0.0] * 768 # Fallback
+    except Exception:
+        return [0.0] * 768
+
+def call_ollama_embedding_batch(texts):
+    """
+    Embed many texts in one request via Ollama's /api/embed endpoint,
+    retrying with backoff. Falls back to one /api/embeddings call per text
+    on Ollama versions without batch support. Failed rows are zero vectors.
+    """
+    base_url = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+    model = os.getenv("OLLAMA_EMBED_MODEL", "nomic-embed-text")
+    session = get_http_session()
+
+    for attempt in range(OLLAMA_EMBED_RETRIES + 1):
+        try:
+            response = session.post(f"{base_url}/api/embed", json={
+                "model": model,
+                "input": texts
+            }, timeout=120)
+            if response.status_code == 200:
+                embeddings = response.json().get('embeddings', [])
+                if len(embeddings) == len(texts):
+                    return embeddings
+                print(f"  Ollama returned {len(embeddings)} embeddings for {len(texts)} inputs")
+            elif response.status_code == 404 and "model" not in response.text.lower():
+                # Endpoint missing (old Ollama), not a missing model
+                return [call_ollama_embedding(t) for t in texts]
+            else:
+                print(f"  Ollama embed error {response.status_code}: {response.text[:200]}")
+        except Exception as e:
+            print(f"  Ollama embed exception: {e}")
+        if attempt < OLLAMA_EMBED_RETRIES:
+            time.sleep((2 ** attempt) * 0.5 + random.uniform(0, 0.5))
+
+    return [[0.0] * 768 for _ in texts]
+
+def embed_ollama_documents(texts, progress=None):
+    """
+    Embed documents with Ollama, OLLAMA_EMBED_BATCH_SIZE texts per request
+    and up to OLLAMA_EMBED_CONCURRENCY requests in flight.
+    progress(done, total) is called as batches complete.
+    """
+    batches = [texts[i:i + OLLAMA_EMBED_BATCH_SIZE] for i in range(0, len(texts), OLLAMA_EMBED_BATCH_SIZE)]
+    results = [None] * len(batches)
+    done = 0
+
+    with ThreadPoolExecutor(max_workers=max(1, OLLAMA_EMBED_CONCURRENCY)) as pool:
+        futures = {pool.submit(call_ollama_embedding_batch, batch): i for i, batch in enumerate(batches)}
+        for future in as_completed(futures):
+            i = futures[future]
+            results[i] = future.result()
+            done += len(batches[i])
+            if progress:
+                progress(done, len(texts))
+            else:
+                print(f"  Embedded {done}/{len(texts)} documents")
+
+    return [emb for batch in results for emb in batch]
+
+def format_item(item):
+    """Convert a user data item (Topic/Session dict) to indexable text."""
+    # Flexible handling of dict items
+    text = str(item)
+    if isinstance(item, dict):
+        # Format nicely if it's a known structure
+        if 'title' in item: # Topic
+            text = f"Topic: {item.get('title')} ({item.get('category')}). Goal: {item.get('goal')}"
+        elif 'date' in item: # Session
+            text = f"Session on {item.get('date')} ({item.get('duration')} min): {item.get('notes')}"
+    return text
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+KNOWLEDGE_BASE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "knowledge_base.json")
+
+def iter_corpus(data_items=None):
+    """
+    Lazily yield the built-in knowledge — every file under data/ plus
+    knowledge_base.json, via data_loader — followed by the user data items.
+    Prose chunks that nearly duplicate an earlier one, from any file, are
+    skipped.
+    """
+    near_dups = dedup.NearDuplicateFilter()
+    yield from data_loader.iter_documents(DATA_DIR, dedupe=near_dups)
+    if os.path.exists(KNOWLEDGE_BASE_FILE):
+        yield from data_loader.iter_file(KNOWLEDGE_BASE_FILE, "General", dedupe=near_dups)
+    if near_dups.dropped:
+        print(f"Skipped {near_dups.dropped} near-duplicate chunks")
+    for item in data_items or []:
+        yield format_item(item)
+
 def preprocess_data(data_items):
     """
     Load and preprocess data from the data/ directory and input items.
+    Returns the documents; the live index is only replaced by build_index().
+    Prefer passing iter_corpus() straight to build_index(), which streams it.
     """
-    global documents
-    documents = []
-    
-    # Load built-in data
-    # Safe check for data loader existence, or just read directory
-    data_dir = os.path.join(os.path.dirname(__file__), "data")
-    if os.path.exists(data_dir):
-        for f in os.listdir(data_dir):
-            if f.endswith(".txt"):
-                try:
-                    with open(os.path.join(data_dir, f), "r", encoding="utf-8") as file:
-                        content = file.read()
-                        # Simple chunking by paragraph
-                        chunks = [c.strip() for c in content.split('\n\n') if c.strip()]
-                        documents.extend(chunks)
-                except Exception as e:
-                    print(f"Error reading {f}: {e}")
-
-    # Add user data items (Topics/Sessions converted to text)
-    if data_items:
-        for item in data_items:
-            # Flexible handling of dict items
-            text = str(item)
-            if isinstance(item, dict):
-                # Format nicely if it's a known structure
-                if 'title' in item: # Topic
-                    text = f"Topic: {item.get('title')} ({item.get('category')}). Goal: {item.get('goal')}"
-                elif 'date' in item: # Session
-                    text = f"Session on {item.get('date')} ({item.get('duration')} min): {item.get('notes')}"
-            
-            documents.append(text)
-            
-    return documents
+    return list(iter_corpus(data_items))
 
-import time
-import random
+GEMINI_EMBED_MODEL = providers.get("gemini").embed_model
 
-import requests
+# One store per (provider, embed model), opened lazily
+_embedding_stores = {}
 
-def build_index(docs):
+def get_embed_model(provider):
+    return providers.get(provider).embed_model
+
+def get_embedding_store(provider):
+    model = get_embed_model(provider)
+    store = _embedding_stores.get((provider, model))
+    if store is None:
+        store = embedding_store.EmbeddingStore(provider, model)
+        _embedding_stores[(provider, model)] = store
+    return store
+
+def embed_gemini_documents(texts, progress=None):
     """
-    Generate embeddings for all documents using Gemini V1 API with Rate Limiting.
+    Embed documents with the Gemini V1 batch API, with Rate Limiting.
+    Failed batches are padded with zero vectors.
     """
-    global document_embeddings, documents
-    
-    # Update documents list if provided
-    if docs is not None:
-        documents = docs
-        
-    if not documents:
-        print("No documents to index.")
-        return 0
-        
-    if get_provider() == "ollama":
-        print("Indexing documents with Ollama embeddings...")
-        all_embeddings = []
-        for d in documents:
-            emb = call_ollama_embedding(d)
-            all_embeddings.append(emb)
-        
-        document_embeddings = np.array(all_embeddings)
-        print("Ollama indexing complete.")
-        return len(documents)
-
-    # Gemini Indexing Logic
     api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        print("Error: No API Key found.")
-        return 0
 
-    # Configuration for Rate Limiting
-    BATCH_SIZE = 1 # Embed content does not support batch in v1 easily via simple rest without lookups
-    # Actually V1 batchEmbedContents exists but lets stick to simple 1 by 1 or check batch support
-    # To be safe and simple: 1 by 1 or V1 batch endpoint. 
     # V1 URL: https://generativelanguage.googleapis.com/v1/models/embedding-001:batchEmbedContents
-    
     url = "https://generativelanguage.googleapis.com/v1/models/embedding-001:batchEmbedContents"
     
     DELAY_SECONDS = 1
@@ -137,14 +214,14 @@ def build_index(docs):
     # Max batch size for Gemini is usually higher, but let's stick to 5
     BATCH_SIZE_API = 5
     
-    for i in range(0, len(documents), BATCH_SIZE_API):
-        batch_docs = documents[i:i + BATCH_SIZE_API]
+    for i in range(0, len(texts), BATCH_SIZE_API):
+        batch_docs = texts[i:i + BATCH_SIZE_API]
         print(f"Processing batch {i//BATCH_SIZE_API + 1}...")
         
         # Prepare payload
         requests_payload = {
             "requests": [{
-                "model": "models/embedding-001",
+                "model": GEMINI_EMBED_MODEL,
                 "content": {"parts": [{"text": d}]},
                 "taskType": "RETRIEVAL_DOCUMENT",
                 "title": "HyperActive Knowledge"
@@ -194,75 +271,1227 @@ def build_index(docs):
              current_batch_embeddings.extend([[0.0]*768] * (len(batch_docs) - len(current_batch_embeddings)))
              
         all_embeddings.extend(current_batch_embeddings)
+        if progress:
+            progress(len(all_embeddings), len(texts))
         time.sleep(DELAY_SECONDS)
 
+    return all_embeddings
+
+def embed_documents(texts, provider=None, progress=None, store=None):
+    """
+    Return a float32 embedding matrix for texts (one row per text).
+    Vectors already in the on-disk store are loaded from it; only new or
+    changed texts are sent to the embedding model, and the results are
+    persisted for the next start. progress(done, total) reports the
+    embedding of missing texts. store replaces the corpus store (anything
+    with get_many, put_many and dim).
+    """
+    provider = provider or providers.get_provider()
+    model = get_embed_model(provider)
+    store = store or get_embedding_store(provider)
+
+    keys = [embedding_store.make_key(provider, model, t) for t in texts]
+    vectors = store.get_many(keys)
+
+    # Embed each distinct missing text once
+    missing = {}
+    for key, text in zip(keys, texts):
+        if key not in vectors and key not in missing:
+            missing[key] = text
+    print(f"Embedding cache: {len(texts) - sum(1 for k in keys if k in missing)} cached, {len(missing)} to embed.")
+
+    if missing:
+        missing_keys = list(missing.keys())
+        missing_texts = list(missing.values())
+        if provider == "ollama":
+            fresh = embed_ollama_documents(missing_texts, progress)
+        else:
+            fresh = embed_gemini_documents(missing_texts, progress)
+        store.put_many(missing_keys, fresh)
+        for key, emb in zip(missing_keys, fresh):
+            vectors[key] = np.asarray(emb, dtype=np.float32)
+
+    # Failed embeddings may come back empty or with a fallback size
+    dim = store.dim or max((v.size for v in vectors.values()), default=768) or 768
+    matrix = np.zeros((len(texts), dim), dtype=np.float32)
+    for i, key in enumerate(keys):
+        vec = vectors[key]
+        if vec.size == dim:
+            matrix[i] = vec
+    return matrix
+
+def make_document_ids(texts):
+    """
+    Deterministic ids for corpus rows: a content hash, suffixed when the
+    same text appears more than once. Ids survive restarts.
+    """
+    ids, seen = [], {}
+    for text in texts:
+        base = hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+        n = seen.get(base, 0)
+        seen[base] = n + 1
+        ids.append(base if n == 0 else f"{base}-{n}")
+    return ids
+
+# Writers (builds, add/upsert/delete) are serialized; readers never lock
+_index_lock = threading.RLock()
+_building = False
+# Mutations made while build_index streams a new corpus, as
+# (op, id, text, created_at, vector); see _commit
+_journal = None
+# Documents read and embedded per batch during build_index
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "256"))
+
+class IndexSnapshot:
+    """
+    One published version of the shared index. Nothing reachable from a
+    published snapshot is edited afterwards: add/upsert/delete derive a
+    new snapshot, forking the structures they change (BM25, dense index,
+    records), and build_index assembles one off to the side. Publishing is a
+    single reference assignment, so a reader sees the old or the new
+    version, never a mix.
+
+    buffers are the vector arrays behind embeddings/scales/valid, with
+    spare rows that appends write past every older snapshot's last row.
+
+    A snapshot attached to a shared generation never copies that
+    generation's mapped vectors: embeddings/scales/valid stay the read-only
+    base and index stays fitted to it. rows maps each document to its
+    vector (a base row, len(base) + an overlay row, or -1 for none yet),
+    and vectors added or re-embedded by this worker go to overlay, its own
+    (codes, scales, valid, used) buffers with spare rows. Search combines
+    the two; see _search_parts.
+    """
+    __slots__ = ("documents", "ids", "embeddings", "scales", "valid", "lexical", "index", "records",
+                 "buffers", "overlay", "rows", "parts", "generation")
+
+    def __init__(self, documents=None, ids=None, embeddings=None, scales=None, valid=None,
+                 lexical=None, index=None, records=None, buffers=None, overlay=None, rows=None):
+        self.documents = documents if documents is not None else []
+        self.ids = ids if ids is not None else []
+        self.embeddings = embeddings
+        self.scales = scales
+        self.valid = valid
+        self.lexical = lexical
+        self.index = index
+        self.records = records if records is not None else record_store.RecordStore()
+        self.buffers = buffers
+        self.overlay = overlay
+        self.rows = rows
+        self.parts = None
+        self.generation = 0
+
+    def __len__(self):
+        return len(self.documents)
+
+_snapshot = IndexSnapshot()
+
+def current_index():
+    """The published IndexSnapshot. Hold on to it for the whole read."""
+    return _snapshot
+
+def _publish(snapshot):
+    global _snapshot
+    snapshot.generation = _snapshot.generation + 1
+    _snapshot = snapshot
+
+# Progress of the running (or last) build_index, reported by GET /ready
+build_status = {"state": "idle", "ready": False, "read": 0, "embedded": 0,
+                "started": None, "finished": None, "error": None}
+
+# Several workers on one host (uvicorn --workers N): set SHARED_INDEX_DIR
+# and only the leader worker embeds the corpus; the others map its vectors
+# read-only and poll every SHARED_INDEX_POLL seconds for new generations
+# and deltas. After SHARED_INDEX_COMPACT_OPS deltas the worker making the
+# next mutation folds them into a new generation.
+SHARED_INDEX_DIR = os.getenv("SHARED_INDEX_DIR", "")
+SHARED_INDEX_POLL = float(os.getenv("SHARED_INDEX_POLL", "1"))
+SHARED_INDEX_COMPACT_OPS = int(os.getenv("SHARED_INDEX_COMPACT_OPS", "500"))
+shared = None
+if SHARED_INDEX_DIR:
+    if shared_index.available():
+        shared = shared_index.SharedIndex(SHARED_INDEX_DIR)
+    else:
+        print("[Shared Index] flock is unavailable here; each worker builds its own index.")
+# Shared generation the published snapshot came from, and how far into
+# its deltas (byte offset, count) it has been brought
+_attached = 0
+_applied = 0
+_deltas = 0
+
+# "float32", "float16" or "int8" rows in memory. Compressed rows are searched
+# as-is, then the top RESCORE_FACTOR * k candidates are rescored against the
+# float32 vectors in the embedding store.
+EMBED_STORAGE = os.getenv("EMBED_STORAGE", "float32").lower()
+if EMBED_STORAGE not in quantization.STORAGE_TYPES:
+    EMBED_STORAGE = "float32"
+RESCORE_FACTOR = int(os.getenv("RESCORE_FACTOR", "4"))
+
+# "brute" (exact scan), "ivf" (inverted lists, approximate) or "auto"
+# (IVF once the corpus reaches IVF_MIN_DOCS rows)
+VECTOR_INDEX = os.getenv("VECTOR_INDEX", "auto").lower()
+IVF_MIN_DOCS = int(os.getenv("IVF_MIN_DOCS", "20000"))
+IVF_NLIST = int(os.getenv("IVF_NLIST", "0"))  # 0 = about 4 * sqrt(rows)
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "8"))
+# Trained lists are saved as EMBED_CACHE_DIR/ivf/ivf-<digest>.npz
+IVF_CACHE_PREFIX = "ivf-"
+
+def make_dense_index(n_docs):
+    if VECTOR_INDEX == "ivf" or (VECTOR_INDEX == "auto" and n_docs >= IVF_MIN_DOCS):
+        return vector_index.IVFIndex(nlist=IVF_NLIST or None, nprobe=IVF_NPROBE)
+    return vector_index.BruteForceIndex()
+
+def _ivf_cache_path(ids, dim):
+    """Trained lists are reused only for the exact same rows and embedder."""
+    provider = providers.get_provider()
+    digest = hashlib.sha1(f"{provider}/{get_embed_model(provider)}/{dim}/{IVF_NLIST}".encode("utf-8"))
+    for doc_id in ids:
+        digest.update(doc_id.encode("utf-8") + b"\n")
+    cache_dir = os.path.join(os.getenv("EMBED_CACHE_DIR") or embedding_store.DEFAULT_CACHE_DIR, "ivf")
+    return os.path.join(cache_dir, IVF_CACHE_PREFIX + digest.hexdigest() + ".npz")
+
+def fit_dense_index(embeddings, valid, ids, scales=None):
+    """Build the dense index for these rows, loading saved IVF lists when they match."""
+    index = make_dense_index(len(embeddings))
+    if isinstance(index, vector_index.IVFIndex):
+        path = _ivf_cache_path(ids, embeddings.shape[1])
+        if not (index.load(path) and len(index.assignments) == len(embeddings)):
+            start = time.time()
+            index.fit(embeddings, valid, scales)
+            print(f"Trained IVF index ({index.nlist} lists) in {time.time() - start:.1f}s")
+            try:
+                index.save(path)
+                # Only the lists for the current corpus are worth keeping
+                for name in os.listdir(os.path.dirname(path)):
+                    if (name.startswith(IVF_CACHE_PREFIX) and name.endswith(".npz")
+                            and not name.endswith(".tmp.npz") and name != os.path.basename(path)):
+                        os.remove(os.path.join(os.path.dirname(path), name))
+            except OSError as e:
+                print(f"Could not save IVF index: {e}")
+    else:
+        index.fit(embeddings, valid, scales)
+    return index
+
+def normalize_rows(matrix):
+    """
+    Return (unit-length float32 rows, validity mask). Zero rows (failed
+    embeddings) stay zero and are marked invalid.
+    """
+    matrix = np.atleast_2d(np.asarray(matrix, dtype=np.float32))
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    valid = norms[:, 0] > 0
+    normalized = np.zeros_like(matrix)
+    np.divide(matrix, norms, out=normalized, where=norms > 0)
+    return normalized, valid
+
+def _dense_parts(codes, scales, valid, n, ids):
+    """
+    Views of the first n rows of encoded buffers (spare rows absorb later
+    appends) and a dense index fitted to them:
+    (embeddings, scales, valid, index, buffers).
+    """
+    index = fit_dense_index(codes[:n], valid[:n], ids, None if scales is None else scales[:n])
+    parts = (codes[:n], None if scales is None else scales[:n], valid[:n], index, (codes, scales, valid))
+    usage = quantization.footprint(parts[0], parts[1])
+    print(f"Embeddings: {usage['rows']} x {usage['dim']} {usage['storage']}, "
+          f"{usage['bytes'] / 2**20:.1f} MiB ({usage['saving_vs_float32']:.0%} below float32)")
+    return parts
+
+def _grow(buffer, capacity):
+    """Copy of a row buffer with room for capacity rows; new rows are zero."""
+    grown = np.zeros((capacity,) + buffer.shape[1:], dtype=buffer.dtype)
+    grown[:len(buffer)] = buffer[:capacity]
+    return grown
+
+def batched(items, size):
+    """Yield lists of up to size items from any iterable, consuming it lazily."""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def embed_corpus(docs, provider):
+    """
+    Consume docs INGEST_BATCH_SIZE at a time, embedding each batch as it
+    arrives. Returns (texts, codes, scales, valid): normalized vectors in
+    EMBED_STORAGE precision in buffers that may have spare rows. Only one
+    batch of float32 vectors is alive at a time; provider=None reads the
+    texts without embedding them.
+    """
+    texts = []
+    codes = scales = valid = None
+    for batch in batched(docs, max(1, INGEST_BATCH_SIZE)):
+        start = len(texts)
+        texts.extend(batch)
+        build_status["read"] = len(texts)
+        if provider is None:
+            continue
+
+        vectors, ok = normalize_rows(embed_documents(batch, provider))
+        batch_codes, batch_scales = quantization.quantize(vectors, EMBED_STORAGE)
+        if codes is not None and codes.shape[1] != vectors.shape[1]:
+            if valid[:start].any():
+                print(f"  Skipping batch with {vectors.shape[1]}-d vectors (index is {codes.shape[1]}-d)")
+                ok[:] = False
+                batch_codes = np.zeros((len(batch), codes.shape[1]), dtype=codes.dtype)
+                batch_scales = None if scales is None else np.zeros(len(batch), dtype=np.float32)
+            else:
+                codes = None  # only failed rows so far; adopt the real dimension
+        if codes is None:
+            codes = np.zeros((max(16, 2 * len(texts)), vectors.shape[1]), dtype=EMBED_STORAGE)
+            scales = None if batch_scales is None else np.zeros(len(codes), dtype=np.float32)
+            valid = np.zeros(len(codes), dtype=bool)
+        elif len(texts) > len(codes):
+            capacity = 2 * len(texts)
+            codes, valid = _grow(codes, capacity), _grow(valid, capacity)
+            scales = None if scales is None else _grow(scales, capacity)
+        codes[start:len(texts)] = batch_codes
+        valid[start:len(texts)] = ok
+        if scales is not None:
+            scales[start:len(texts)] = batch_scales
+        build_status["embedded"] += int(ok.sum())
+        print(f"  Indexed {len(texts)} documents")
+    return texts, codes, scales, valid
+
+def embedding_footprint(snapshot=None):
+    """Memory held by the document vectors, with float32/float64 equivalents."""
+    snapshot = _snapshot if snapshot is None else snapshot
+    if snapshot.embeddings is None:
+        return quantization.footprint(np.zeros((0, 0), dtype=np.float32), None)
+    usage = quantization.footprint(snapshot.embeddings, snapshot.scales)
+    if snapshot.overlay is not None:
+        codes, scales, _, used = snapshot.overlay
+        extra = quantization.footprint(codes, scales, used)
+        for key in ("rows", "bytes", "float32_bytes", "float64_bytes"):
+            usage[key] += extra[key]
+        usage["saving_vs_float32"] = round(1 - usage["bytes"] / usage["float32_bytes"], 3) if usage["float32_bytes"] else 0.0
+    return usage
+
+def _embedded_rows(snapshot):
+    """Documents with a valid vector."""
+    return sum(int(np.count_nonzero(valid if owners is not None else valid[:len(snapshot)]))
+               for _, _, valid, _, owners in _search_parts(snapshot))
+
+def _write_row(buffers, i, vec, ok):
+    """Encode one normalized vector into row i of (codes, scales, valid) buffers."""
+    codes, scales = quantization.quantize(vec, EMBED_STORAGE)
+    buffers[0][i] = codes[0]
+    if buffers[1] is not None:
+        buffers[1][i] = scales[0]
+    buffers[2][i] = ok
+
+# Index size and last build time, exported on /metrics
+index_build_seconds = metrics.Gauge("rag_index_build_duration_seconds",
+                                    "Wall time of the last full index build (read, embed, publish).")
+
+def _index_size():
+    snapshot = _snapshot
+    return {
+        ("documents",): len(snapshot),
+        ("embedded",): _embedded_rows(snapshot),
+        ("vector_bytes",): embedding_footprint(snapshot)["bytes"],
+    }
+
+metrics.Collector("rag_index_size", "Knowledge base size: documents, rows with an embedding, and vector memory in bytes.",
+                  "gauge", _index_size, labels=["kind"])
+
+def build_index(docs):
+    """
+    Replace the corpus with docs and embed it, reusing the persistent
+    embedding store. docs may be any iterable (e.g. iter_corpus()) and is
+    streamed: documents are read and embedded INGEST_BATCH_SIZE at a time,
+    so peak memory beyond the texts themselves is one batch of float32
+    vectors. None re-embeds the current documents.
+
+    The new snapshot is assembled off to the side while the previous one
+    keeps serving; add/upsert/delete calls made meanwhile are replayed onto
+    it before it is published and warmed. When sharing, the host's build
+    lock is held throughout so the deltas to replay aren't compacted away.
+    """
+    with _build_lock():
+        return _build(docs)
+
+def _build(docs):
+    global _building, _journal
+
+    with _index_lock:
+        source = list(_snapshot.documents) if docs is None else docs
+        _building = True
+        _journal = []
+        if shared is not None:
+            with shared.writer():
+                generation = shared.generation()
+                offset = shared.deltas_offset(generation)
+    started = time.perf_counter()
+    build_status.update(state="building", read=0, embedded=0, started=time.time(), finished=None, error=None)
+
     try:
-        document_embeddings = np.array(all_embeddings)
+        provider = providers.get_provider()
+        if provider != "ollama" and not os.getenv("GEMINI_API_KEY"):
+            print("Error: No API Key found.")
+            provider = None
+        else:
+            print(f"Indexing documents with {provider} embeddings...")
+
+        texts, codes, scales, valid = embed_corpus(source, provider)
+        ids = make_document_ids(texts)
+        dense = _dense_parts(codes, scales, valid, len(texts), ids) if codes is not None else (None,) * 5
+        embeddings, scales, valid, index, buffers = dense
+        snapshot = IndexSnapshot(texts, ids, embeddings, scales, valid, bm25.BM25Index.build(texts), index,
+                                 record_store.RecordStore.build(ids, texts), buffers)
+
+        with _index_lock, _writer():
+            # Shared: every worker's mutations since the build started, not just ours
+            journal = _journal if shared is None else shared.deltas_since(generation, offset)[0]
+            _building, _journal = False, None
+            snapshot = _replay(snapshot, journal)
+            if shared is not None:
+                snapshot = _share(snapshot)
+            _publish(snapshot)
+        warm_index(snapshot)
+        build_status.update(state="ready", ready=True, finished=time.time())
+
+        if not texts:
+            print("No documents to index.")
+            return 0
+        if codes is None:
+            return 0
+        index_build_seconds.set(time.perf_counter() - started)
         print("Indexing complete.")
-        return len(documents)
+        return len(snapshot)
     except Exception as e:
         print(f"Error finalizing index: {e}")
+        build_status.update(state="failed", finished=time.time(), error=str(e))
         return 0
+    finally:
+        _building = False
+        _journal = None
 
-def retrieve(query, k=3):
+def warm_index(snapshot):
     """
-    Retrieve top k documents using Cosine Similarity via V1 API.
+    Run one search through each part of a fresh snapshot so lazily built
+    structures (IVF lists) and the query embedder are loaded before the
+    snapshot is reported ready.
     """
-    global document_embeddings, documents
-    
-    if not documents or document_embeddings is None:
+    try:
+        if snapshot.lexical is not None:
+            snapshot.lexical.search("warm up", 1)
+        if snapshot.embeddings is not None and len(snapshot.embeddings):
+            dim = snapshot.embeddings.shape[1]
+            probe = np.full((1, dim), 1 / np.sqrt(dim), dtype=np.float32)
+            snapshot.index.search(snapshot.embeddings, snapshot.valid, probe, 1, snapshot.scales)
+            embed_query("warm up")
+    except Exception as e:
+        print(f"Index warm-up failed: {e}")
+
+def readiness():
+    """(ready, details) for GET /ready. Ready once a build has been published and warmed."""
+    snapshot = _snapshot
+    details = dict(build_status, generation=snapshot.generation, documents=len(snapshot),
+                   embedded_rows=_embedded_rows(snapshot))
+    if shared is not None:
+        details.update(shared_generation=_attached, shared_deltas=_deltas,
+                       role="leader" if shared.is_leader else "follower")
+    return build_status["ready"], details
+
+def _is_live(snapshot):
+    """True when mutations should embed immediately (index built, or empty and idle)."""
+    if _building:
+        return False
+    return snapshot.embeddings is not None or not snapshot.documents
+
+def _embed_text(text):
+    """Embed and normalize a single document: (vector, is_valid)."""
+    matrix, valid = normalize_rows(embed_documents([text]))
+    return matrix[0], bool(valid[0])
+
+def _embed_unlocked(text):
+    """
+    Vector for a document about to be added or changed, embedded before
+    the caller takes _index_lock and the writer lock so a slow embedder
+    holds up nobody else. None when nothing would use it: no vectors to
+    add it to and no build to replay it into.
+    """
+    if not (_building or _is_live(_snapshot)):
+        return None
+    return _embed_text(text)
+
+def _embed_one(text, snapshot, vector=None):
+    """
+    Embed and normalize a single document, unless vector already holds it
+    (embedded before locking, or from a journal). Returns (vector, is_valid).
+    """
+    vec, ok = _embed_text(text) if vector is None else vector
+    if snapshot.embeddings is not None and vec.size != snapshot.embeddings.shape[1]:
+        return np.zeros(snapshot.embeddings.shape[1], dtype=np.float32), False
+    return vec, ok
+
+def _edit_lexical(lexical, op, row, text, documents):
+    """Fork of lexical with one row change applied, compacted when due."""
+    if lexical is None:
+        return None
+    lexical = lexical.fork()
+    if op == "add":
+        lexical.add(text)
+    elif op == "update":
+        lexical.update(row, text)
+    else:
+        lexical.delete(row)
+    if lexical.needs_compaction():
+        lexical.rebuild(documents)
+    return lexical
+
+def _append_overlay(snapshot, vec, ok):
+    """
+    Write one vector to the first unused row of snapshot's overlay, growing
+    it geometrically; the mapped base is never written. Returns (overlay,
+    row) with row numbered after the base rows.
+    """
+    codes, scales, valid, used = snapshot.overlay or (None, None, None, 0)
+    if codes is None:
+        codes = np.zeros((16, vec.size), dtype=EMBED_STORAGE)
+        scales = np.zeros(16, dtype=np.float32) if EMBED_STORAGE == "int8" else None
+        valid = np.zeros(16, dtype=bool)
+    elif used >= len(codes):
+        codes, valid = _grow(codes, 2 * used), _grow(valid, 2 * used)
+        scales = None if scales is None else _grow(scales, 2 * used)
+    # Row used is past the end of every published view of these buffers
+    _write_row((codes, scales, valid), used, vec, ok)
+    return (codes, scales, valid, used + 1), len(snapshot.embeddings) + used
+
+def _with_added(snapshot, doc_id, text, vector=None, created_at=None):
+    """Snapshot with one document appended; only its vector is computed (if not given)."""
+    n = len(snapshot)
+    embeddings, scales, valid = snapshot.embeddings, snapshot.scales, snapshot.valid
+    index, buffers, overlay, rows = snapshot.index, snapshot.buffers, snapshot.overlay, snapshot.rows
+    if rows is not None:
+        # Mapped base: the vector goes to the overlay (none yet while a build runs)
+        row = -1
+        if _is_live(snapshot):
+            overlay, row = _append_overlay(snapshot, *_embed_one(text, snapshot, vector))
+        rows = np.append(rows, row)
+    elif _is_live(snapshot):
+        vec, ok = _embed_one(text, snapshot, vector)
+        # Documents added during a build that then failed have no rows yet
+        m = 0 if embeddings is None else len(embeddings)
+        if buffers is None or n >= len(buffers[0]) or m < n:
+            # Grow geometrically so repeated appends don't copy the matrix each time;
+            # missing rows stay zero and invalid
+            capacity = max(16, 2 * n)
+            grown = np.zeros((capacity, vec.size), dtype=EMBED_STORAGE)
+            grown_scales = np.zeros(capacity, dtype=np.float32) if EMBED_STORAGE == "int8" else None
+            grown_valid = np.zeros(capacity, dtype=bool)
+            if m:
+                grown[:m] = embeddings
+                grown_valid[:m] = valid
+                if grown_scales is not None:
+                    grown_scales[:m] = scales
+            buffers = (grown, grown_scales, grown_valid)
+        # Row n is past the end of every published view of these buffers
+        _write_row(buffers, n, vec, ok)
+        embeddings, valid = buffers[0][:n + 1], buffers[2][:n + 1]
+        scales = None if buffers[1] is None else buffers[1][:n + 1]
+        if index is not None:
+            index = index.fork()
+            for _ in range(m, n):
+                index.add(np.zeros_like(vec))
+            index.add(vec)
+
+    documents = snapshot.documents + [text]
+    records = snapshot.records.fork()
+    records.put(doc_id, text, created_at)
+    return IndexSnapshot(documents, snapshot.ids + [doc_id], embeddings, scales, valid,
+                         _edit_lexical(snapshot.lexical, "add", n, text, documents), index,
+                         records, buffers, overlay, rows)
+
+def _with_updated(snapshot, i, text, vector=None):
+    """
+    Snapshot with row i's text replaced, re-embedding that row (unless
+    given) into copied arrays, or into the overlay over a mapped base.
+    """
+    embeddings, scales, valid = snapshot.embeddings, snapshot.scales, snapshot.valid
+    index, buffers, overlay, rows = snapshot.index, snapshot.buffers, snapshot.overlay, snapshot.rows
+    if _embeds_update(snapshot, i, text):
+        vec, ok = _embed_one(text, snapshot, vector)
+        if rows is not None:
+            overlay, row = _append_overlay(snapshot, vec, ok)
+            rows = rows.copy()
+            rows[i] = row
+        else:
+            buffers = (embeddings.copy(), None if scales is None else scales.copy(), valid.copy())
+            _write_row(buffers, i, vec, ok)
+            embeddings, scales, valid = buffers
+            if index is not None:
+                index = index.fork()
+                index.update(i, vec)
+
+    documents = list(snapshot.documents)
+    documents[i] = text
+    records = snapshot.records.fork()
+    records.put(snapshot.ids[i], text)
+    return IndexSnapshot(documents, snapshot.ids, embeddings, scales, valid,
+                         _edit_lexical(snapshot.lexical, "update", i, text, documents), index,
+                         records, buffers, overlay, rows)
+
+def _without(snapshot, i):
+    """Snapshot with row i removed; later rows move up one."""
+    embeddings, scales, valid = snapshot.embeddings, snapshot.scales, snapshot.valid
+    index, buffers, overlay, rows = snapshot.index, snapshot.buffers, snapshot.overlay, snapshot.rows
+    if rows is not None:
+        # Mapped base: the vector is left in place, unreferenced
+        rows = np.delete(rows, i)
+    elif embeddings is not None and i < len(embeddings):
+        embeddings, valid = np.delete(embeddings, i, axis=0), np.delete(valid, i)
+        scales = None if scales is None else np.delete(scales, i)
+        buffers = (embeddings, scales, valid)
+        if index is not None:
+            index = index.fork()
+            index.delete(i)
+
+    documents = snapshot.documents[:i] + snapshot.documents[i + 1:]
+    records = snapshot.records.fork()
+    records.delete(snapshot.ids[i])
+    return IndexSnapshot(documents, snapshot.ids[:i] + snapshot.ids[i + 1:], embeddings, scales, valid,
+                         _edit_lexical(snapshot.lexical, "delete", i, None, documents), index,
+                         records, buffers, overlay, rows)
+
+def _embeds_update(snapshot, i, text):
+    """True when replacing row i's text with text needs a new vector now."""
+    embeddings = snapshot.embeddings
+    return (snapshot.documents[i] != text and _is_live(snapshot) and embeddings is not None
+            and (snapshot.rows is not None or i < len(embeddings)))
+
+def _replay(snapshot, journal):
+    """
+    Apply journaled (op, id, text, created_at, vector) mutations to a
+    snapshot that doesn't have them yet. Rows journaled without a vector
+    are embedded now.
+    """
+    for op, doc_id, text, created_at, vector in journal or ():
+        if doc_id in snapshot.ids:
+            i = snapshot.ids.index(doc_id)
+            snapshot = _without(snapshot, i) if op == "delete" else _with_updated(snapshot, i, text, vector)
+        elif op != "delete":
+            snapshot = _with_added(snapshot, doc_id, text, vector, created_at)
+    return snapshot
+
+def add_document(text, doc_id=None):
+    """
+    Append one document to the index, embedding only that document.
+    Returns its id.
+    """
+    doc_id = doc_id or uuid.uuid4().hex
+    vector = _embed_unlocked(text)
+    with _index_lock, _writer():
+        _sync()
+        if doc_id in _snapshot.ids:
+            raise ValueError(f"Document {doc_id} already exists")
+        created_at = time.time()
+        _commit(_with_added(_snapshot, doc_id, text, vector, created_at), "upsert", doc_id, text,
+                created_at, vector)
+        return doc_id
+
+def upsert_document(doc_id, text):
+    """
+    Replace the text of an existing document (re-embedding just its row)
+    or add it if the id is unknown. Returns True if it existed.
+    """
+    snapshot = _snapshot
+    unchanged = doc_id in snapshot.ids and snapshot.documents[snapshot.ids.index(doc_id)] == text
+    vector = None if unchanged else _embed_unlocked(text)
+    with _index_lock, _writer():
+        _sync()
+        if doc_id not in _snapshot.ids:
+            created_at = time.time()
+            _commit(_with_added(_snapshot, doc_id, text, vector, created_at), "upsert", doc_id, text,
+                    created_at, vector)
+            return False
+        i = _snapshot.ids.index(doc_id)
+        _commit(_with_updated(_snapshot, i, text, vector), "upsert", doc_id, text, None, vector)
+        return True
+
+def delete_document(doc_id):
+    """Remove a document. Returns True if the id existed."""
+    with _index_lock, _writer():
+        _sync()
+        if doc_id not in _snapshot.ids:
+            return False
+        _commit(_without(_snapshot, _snapshot.ids.index(doc_id)), "delete", doc_id, None)
+        return True
+
+def _commit(snapshot, op, doc_id, text, created_at=None, vector=None):
+    """
+    Publish a mutated snapshot. When sharing, the mutation is appended to
+    the host's deltas for the other workers to apply, and folded into a
+    new generation every SHARED_INDEX_COMPACT_OPS deltas. Under
+    _index_lock and _writer().
+    """
+    global _applied, _deltas
+    if _journal is not None:
+        _journal.append((op, doc_id, text, created_at, vector))
+    if shared is not None:
+        # Synced before the mutation, so nobody else appended in between
+        _applied = shared.append(_attached, op, doc_id, text, created_at, vector)
+        _deltas += 1
+        if _deltas >= SHARED_INDEX_COMPACT_OPS:
+            snapshot = _compact(snapshot)
+    _publish(snapshot)
+
+# Shared index across workers
+def _writer():
+    return shared.writer() if shared is not None else contextlib.nullcontext()
+
+def _build_lock():
+    return shared.building() if shared is not None else contextlib.nullcontext()
+
+def _share(snapshot):
+    """
+    Write snapshot as the host's next generation and return it backed by
+    the mapped files, so this worker doesn't keep a private copy either.
+    Under _index_lock and _writer().
+    """
+    global _attached, _applied, _deltas
+    embeddings, scales, valid = _dense_rows(snapshot)
+    index = snapshot.index
+    if snapshot.rows is not None and index is not None:
+        # Fitted to the old base; assign the gathered rows to its trained lists
+        index = index.fork()
+        index.fit(embeddings, valid, scales)
+    generation = shared.publish(snapshot.documents, snapshot.ids, embeddings, scales, valid, index,
+                                snapshot.records.export(snapshot.ids))
+    loaded = shared.load(generation)
+    _attached, _applied, _deltas = generation, 0, 0
+    return IndexSnapshot(snapshot.documents, snapshot.ids, loaded.embeddings, loaded.scales, loaded.valid,
+                         snapshot.lexical, index, snapshot.records,
+                         rows=_base_rows(len(snapshot), loaded.embeddings))
+
+def _base_rows(n, embeddings):
+    """rows for n documents attached to a mapped generation: document i is base row i."""
+    if embeddings is None:
+        return None
+    rows = np.arange(n, dtype=np.int64)
+    rows[len(embeddings):] = -1
+    return rows
+
+def _dense_rows(snapshot):
+    """
+    (embeddings, scales, valid) with one row per document. Over a mapped
+    base this gathers base and overlay rows into new arrays, to be written
+    out as a generation.
+    """
+    if snapshot.rows is None:
+        return snapshot.embeddings, snapshot.scales, snapshot.valid
+    rows, base = snapshot.rows, len(snapshot.embeddings)
+    embeddings = np.zeros((len(rows), snapshot.embeddings.shape[1]), dtype=snapshot.embeddings.dtype)
+    scales = None if snapshot.scales is None else np.zeros(len(rows), dtype=np.float32)
+    valid = np.zeros(len(rows), dtype=bool)
+    sources = [((snapshot.embeddings, snapshot.scales, snapshot.valid), 0)]
+    if snapshot.overlay is not None:
+        sources.append((snapshot.overlay[:3], base))
+    for source, start in sources:
+        mine = (rows >= start) & (rows < start + len(source[0]))
+        taken = rows[mine] - start
+        embeddings[mine] = source[0][taken]
+        valid[mine] = source[2][taken]
+        if scales is not None:
+            scales[mine] = source[1][taken]
+    return embeddings, scales, valid
+
+def _compact(snapshot):
+    """Fold the deltas into a new generation, unless a full build (which will) is running."""
+    with shared.building(blocking=False) as idle:
+        if not idle:
+            return snapshot
+        print(f"[Shared Index] Compacting {_deltas} deltas into a new generation")
+        return _share(snapshot)
+
+def _load_shared(generation):
+    """
+    Snapshot of a shared generation, before its deltas. Vectors are mapped;
+    BM25 is rebuilt locally and records restored with their saved seqs.
+    """
+    loaded = shared.load(generation)
+    embeddings, scales, valid, index = loaded.embeddings, loaded.scales, loaded.valid, None
+    if embeddings is not None:
+        index = make_dense_index(len(embeddings))
+        if not (loaded.ivf_path and isinstance(index, vector_index.IVFIndex) and index.load(loaded.ivf_path)
+                and len(index.assignments) == len(embeddings)):
+            index.fit(embeddings, valid, scales)
+    if loaded.records is not None:
+        records = record_store.RecordStore.restore(loaded.ids, loaded.documents, loaded.records)
+    else:
+        records = record_store.RecordStore.build(loaded.ids, loaded.documents)
+    return IndexSnapshot(loaded.documents, loaded.ids, embeddings, scales, valid,
+                         bm25.BM25Index.build(loaded.documents), index, records,
+                         rows=_base_rows(len(loaded.documents), embeddings))
+
+def _sync(loaded=None):
+    """
+    Bring the published snapshot up to the host's latest state: attach a
+    newer generation if another worker wrote one (loaded may hold it as
+    (generation, snapshot), read outside the lock), then apply the deltas
+    appended since. Under _index_lock. Returns the snapshot published, or
+    None if there was nothing new.
+    """
+    global _attached, _applied, _deltas
+    if shared is None:
+        return None
+    snapshot = None
+    generation = shared.generation()
+    if generation > _attached:
+        snapshot = loaded[1] if loaded is not None and loaded[0] == generation else _load_shared(generation)
+        _attached, _applied, _deltas = generation, 0, 0
+    deltas, offset = shared.deltas_since(_attached, _applied)
+    if deltas:
+        snapshot = _replay(_snapshot if snapshot is None else snapshot, deltas)
+        _applied, _deltas = offset, _deltas + len(deltas)
+    if snapshot is not None:
+        _publish(snapshot)
+    return snapshot
+
+def _follow():
+    """Background loop applying deltas and attaching generations published by other workers."""
+    while True:
+        time.sleep(SHARED_INDEX_POLL)
+        try:
+            # A new generation is loaded before taking the lock; deltas are cheap to apply under it
+            generation = shared.generation()
+            loaded = (generation, _load_shared(generation)) if generation > _attached else None
+            with _index_lock:
+                snapshot = _sync(loaded)
+            if snapshot is None or loaded is None:
+                continue
+            warm_index(snapshot)
+            if not build_status["ready"]:
+                build_status.update(state="ready", ready=True, finished=time.time())
+        except Exception as e:
+            print(f"[Shared Index] Could not attach generation: {e}")
+
+def init_index():
+    """
+    Startup entry point. Without SHARED_INDEX_DIR this builds the index
+    from iter_corpus(). With it, the host's latest generation (if any) is
+    attached straight away and kept current in the background, and only
+    the worker holding the leader lock reads and embeds the corpus.
+    """
+    if shared is None:
+        return build_index(iter_corpus())
+
+    with _index_lock:
+        snapshot = _sync()
+    if snapshot is not None:
+        warm_index(snapshot)
+        build_status.update(state="ready", ready=True, finished=time.time())
+    else:
+        build_status["state"] = "waiting"
+    threading.Thread(target=_follow, daemon=True).start()
+
+    # Followers wait for a generation; one takes over if the leader dies first
+    while not shared.try_lead():
+        if build_status["ready"]:
+            print(f"[Shared Index] Following generation {_attached} in {shared.directory}")
+            return len(_snapshot)
+        time.sleep(SHARED_INDEX_POLL)
+    print(f"[Shared Index] Leader: building the index into {shared.directory}")
+    return build_index(iter_corpus())
+
+class ScratchIndex:
+    """
+    Short-lived index over one request's data (e.g. a user's topics and
+    sessions). It is searched alongside the shared corpus by retrieve()
+    without touching the published IndexSnapshot.
+    """
+    __slots__ = ("documents", "embeddings", "scales", "valid", "lexical", "index", "rows", "parts")
+
+    def __init__(self, documents, embeddings):
+        self.documents = documents
+        self.embeddings, self.valid = (None, None) if embeddings is None else normalize_rows(embeddings)
+        self.scales = None  # request-scoped rows stay float32
+        self.lexical = bm25.BM25Index.build(documents)
+        # Per-request data is small; an exact scan beats any index build
+        self.index = vector_index.BruteForceIndex()
+        self.rows = self.parts = None  # one row per document, no overlay
+
+    def __len__(self):
+        return len(self.documents)
+
+class ScratchEmbeddings:
+    """
+    Bounded in-memory stand-in for the embedding store, for request-scoped
+    texts: a user's sessions stay cached while they are in use and then
+    expire, instead of being appended to the persistent corpus store.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.cache = ttl_cache.LRUTTLCache(maxsize=maxsize, ttl=ttl)
+        self.dim = None
+
+    def get_many(self, keys):
+        found = {}
+        for key in keys:
+            vec = self.cache.get(key)
+            if vec is not None:
+                found[key] = vec
+        return found
+
+    def put_many(self, keys, vectors):
+        for key, vec in zip(keys, vectors):
+            arr = np.asarray(vec, dtype=np.float32)
+            if arr.ndim == 1 and arr.size and np.any(arr):
+                self.cache.put(key, arr)
+                self.dim = self.dim or arr.size
+
+# Keys already include (provider, embed model), as in the corpus store
+scratch_embeddings = ScratchEmbeddings(int(os.getenv("SCRATCH_CACHE_SIZE", "4096")),
+                                       float(os.getenv("SCRATCH_CACHE_TTL", "3600")))
+
+def build_scratch_index(data_items):
+    """
+    Embed request-scoped data items into a ScratchIndex. Items seen in
+    recent requests are served from scratch_embeddings, so the cost
+    depends only on how many items are new, not on the corpus store's size.
+    """
+    docs = [format_item(item) for item in data_items or []]
+    if not docs:
+        return ScratchIndex([], None)
+
+    provider = providers.get_provider()
+    if provider != "ollama" and not os.getenv("GEMINI_API_KEY"):
+        return ScratchIndex(docs, None)
+
+    try:
+        return ScratchIndex(docs, embed_documents(docs, provider, store=scratch_embeddings))
+    except Exception as e:
+        print(f"Scratch indexing error: {e}")
+        return ScratchIndex(docs, None)
+
+# Query embeddings, keyed by normalized text and scoped to (provider, embed model)
+query_embedding_cache = ttl_cache.LRUTTLCache(
+    maxsize=int(os.getenv("QUERY_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("QUERY_CACHE_TTL", "3600")),
+)
+
+def normalize_query(query):
+    return " ".join(query.split()).casefold()
+
+def embed_query(query):
+    """
+    Embed a search query, served from query_embedding_cache when possible.
+    Returns None on failure; failures are not cached.
+    """
+    provider = providers.get_provider()
+    query_embedding_cache.bind((provider, get_embed_model(provider)))
+    key = normalize_query(query)
+
+    cached = query_embedding_cache.get(key)
+    if cached is not None:
+        return cached
+
+    with metrics.stage("embed"):
+        emb = fetch_query_embedding(query, provider)
+    if emb is not None and emb.size and np.any(emb):
+        query_embedding_cache.put(key, emb)
+    return emb
+
+async def embed_query_async(query):
+    """embed_query for request handlers; the model call doesn't block the event loop."""
+    provider = providers.get_provider()
+    query_embedding_cache.bind((provider, get_embed_model(provider)))
+    key = normalize_query(query)
+
+    cached = query_embedding_cache.get(key)
+    if cached is not None:
+        return cached
+
+    with metrics.stage("embed"):
+        emb = await fetch_query_embedding_async(query, provider)
+    if emb is not None and emb.size and np.any(emb):
+        query_embedding_cache.put(key, emb)
+    return emb
+
+def gemini_query_request(query):
+    """(url, params, payload) for embedding a query with Gemini, or None without a key."""
+    # Gemini path requires API key
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        print("Retrieval skipped: No GEMINI_API_KEY and provider is not ollama.")
+        return None
+    url = "https://generativelanguage.googleapis.com/v1/models/embedding-001:embedContent"
+    payload = {
+        "model": GEMINI_EMBED_MODEL,
+        "content": {"parts": [{"text": query}]},
+        "taskType": "RETRIEVAL_QUERY"
+    }
+    return url, {"key": api_key}, payload
+
+def parse_gemini_query_response(status_code, text, data):
+    if status_code != 200:
+        print(f"Retrieval embedding error: {text}")
+        return None
+    if 'embedding' not in data or 'values' not in data['embedding']:
+         return None
+    return np.array(data['embedding']['values'])
+
+def fetch_query_embedding(query, provider):
+    """
+    Embed a search query with the given provider. Returns None on failure.
+    """
+    if provider == "ollama":
+        return np.array(call_ollama_embedding(query))
+
+    request = gemini_query_request(query)
+    if request is None:
+        return None
+    url, params, payload = request
+    response = requests.post(
+        url, 
+        headers={"Content-Type": "application/json"},
+        params=params,
+        json=payload,
+        timeout=10
+    )
+    data = response.json() if response.status_code == 200 else {}
+    return parse_gemini_query_response(response.status_code, response.text, data)
+
+async def fetch_query_embedding_async(query, provider):
+    """Async fetch_query_embedding over the shared pooled AsyncClient."""
+    if provider == "ollama":
+        return np.array(await call_ollama_embedding_async(query))
+
+    request = gemini_query_request(query)
+    if request is None:
+        return None
+    url, params, payload = request
+    response = await async_http.get_client().post(
+        url,
+        headers={"Content-Type": "application/json"},
+        params=params,
+        json=payload,
+        timeout=10
+    )
+    data = response.json() if response.status_code == 200 else {}
+    return parse_gemini_query_response(response.status_code, response.text, data)
+
+def top_k_indices(scores, k, valid=None):
+    """
+    Indices of the k highest scores, best first, skipping rows masked out
+    by valid. Uses argpartition, so cost is O(n) rather than a full sort.
+    """
+    return vector_index.top_k(scores, k, None if valid is None else valid[:len(scores)])
+
+def _search_parts(snapshot):
+    """
+    Blocks of vectors to search for a snapshot's documents, as
+    (embeddings, scales, valid, index, owners). owners maps a block's rows
+    to documents, or is None when row i is document i. Over a mapped base
+    that is the base (rows no document uses any more masked out) and the
+    overlay; cached on the snapshot, which never changes.
+    """
+    if snapshot.embeddings is None:
         return []
+    index = snapshot.index or vector_index.BruteForceIndex()
+    if snapshot.rows is None:
+        return [(snapshot.embeddings, snapshot.scales, snapshot.valid, index, None)]
+    if snapshot.parts is None:
+        rows, base = snapshot.rows, len(snapshot.embeddings)
+        codes, scales, valid, used = snapshot.overlay or (None, None, None, 0)
+        owners = np.full(base + used, -1, dtype=np.int64)
+        owners[rows[rows >= 0]] = np.flatnonzero(rows >= 0)
+        parts = [(snapshot.embeddings, snapshot.scales, snapshot.valid & (owners[:base] >= 0), index,
+                  owners[:base])]
+        if used:
+            parts.append((codes[:used], None if scales is None else scales[:used],
+                          valid[:used] & (owners[base:] >= 0), vector_index.BruteForceIndex(), owners[base:]))
+        snapshot.parts = parts
+    return snapshot.parts
+
+def _retrieval_sources(scratch):
+    """(docs, dense parts, lexical) for the current snapshot and the scratch index; see _search_parts."""
+    usable = []
+    for source in (_snapshot, scratch):
+        if source is None or not source.documents:
+            continue
+        lexical = source.lexical
+        if lexical is not None and len(lexical) != len(source.documents):
+            lexical = None  # not built for these rows yet
+        parts = _search_parts(source)
+        if parts or lexical is not None:
+            usable.append((source.documents, parts, lexical))
+    return usable
+
+def rescore(docs, rows, scores, query):
+    """
+    Re-rank candidates found on compressed rows using their float32
+    vectors from the embedding store. Rows missing from the store keep
+    their approximate score.
+    """
+    provider = providers.get_provider()
+    model = get_embed_model(provider)
+    keys = [embedding_store.make_key(provider, model, docs[i]) for i in rows]
+    found = get_embedding_store(provider).get_many(keys)
+    exact = np.array(scores, dtype=np.float32)
+    for j, key in enumerate(keys):
+        vec = found.get(key)
+        if vec is not None and vec.size == query.size:
+            norm = np.linalg.norm(vec)
+            if norm > 0:
+                exact[j] = float(vec @ query) / norm
+    order = np.argsort(-exact, kind="stable")
+    return rows[order], exact[order]
+
+def dense_candidates(query_vectors, depth, sources):
+    """
+    Score query vectors against each source's normalized rows through its
+    dense index (one matrix product for brute force, probed lists for IVF).
+    Compressed rows are over-fetched by RESCORE_FACTOR and rescored at
+    full precision. Returns, per query, [(score, doc)] best first, or None
+    when the query has no usable embedding.
+    """
+    dense_parts = [(docs, part) for docs, parts, _ in sources for part in parts]
+    if not dense_parts:
+        return [None] * len(query_vectors)
+
+    dim = dense_parts[0][1][0].shape[1]
+    query_matrix = np.zeros((len(query_vectors), dim), dtype=np.float32)
+    for j, emb in enumerate(query_vectors):
+        if emb is not None:
+            emb = np.asarray(emb, dtype=np.float32)
+            if emb.size == dim:
+                query_matrix[j] = emb
+    query_matrix, query_valid = normalize_rows(query_matrix)
+
+    candidates = [[] if query_valid[j] else None for j in range(len(query_vectors))]
+    rows_wanted = np.flatnonzero(query_valid)
+    for docs, (embeddings, scales, valid, index, owners) in dense_parts:
+        n = len(embeddings)
+        if owners is None:
+            # Rows added while a build was running have no vector yet
+            n = min(len(docs), n)
+        if scales is not None:
+            n = min(n, len(scales))
+        if embeddings.shape[1] != dim or not len(rows_wanted):
+            continue
+        compressed = scales is not None or embeddings.dtype != np.float32
+        fetch = depth * max(RESCORE_FACTOR, 1) if compressed else depth
+        hits = index.search(embeddings[:n], None if valid is None else valid[:n],
+                            query_matrix[rows_wanted], fetch, None if scales is None else scales[:n])
+        for j, (rows, scores) in zip(rows_wanted, hits):
+            if owners is not None:
+                rows = owners[rows]
+            if compressed:
+                rows, scores = rescore(docs, rows, scores, query_matrix[j])
+                rows, scores = rows[:depth], scores[:depth]
+            candidates[j].extend((float(s), docs[i]) for i, s in zip(rows, scores))
+
+    for cands in candidates:
+        if cands is not None:
+            cands.sort(key=lambda c: c[0], reverse=True)
+    return candidates
+
+def lexical_candidates(query, depth, sources):
+    """BM25 matches for one query across sources, [(score, doc)] best first."""
+    candidates = []
+    for docs, _, lexical in sources:
+        if lexical is None:
+            continue
+        rows, scores = lexical.search(query, depth)
+        candidates.extend((float(s), docs[i]) for i, s in zip(rows, scores))
+    candidates.sort(key=lambda c: c[0], reverse=True)
+    return candidates
+
+def reciprocal_rank_fusion(ranked_lists, k, c=60):
+    """Merge ranked [(score, doc)] lists by sum of 1 / (c + rank)."""
+    fused = {}
+    for ranked in ranked_lists:
+        for rank, (_, doc) in enumerate(ranked):
+            fused[doc] = fused.get(doc, 0.0) + 1.0 / (c + rank + 1)
+    return [doc for doc, _ in sorted(fused.items(), key=lambda kv: kv[1], reverse=True)[:k]]
+
+def _has_vectors(source):
+    docs, parts, _ = source
+    return any(valid is None or np.any(valid if owners is not None else valid[:len(docs)])
+               for _, _, valid, _, owners in parts)
+
+def rank_queries(queries, query_vectors, k, sources, mode):
+    """
+    Rank documents for each query in the given mode. Dense ranking falls
+    back to BM25 for queries whose embedding failed or that found no dense
+    candidates, and sources without a single valid row (built while the
+    embedder was down) are ranked by BM25 and fused in.
+    """
+    depth = k if mode == "dense" else max(4 * k, 20)
+    embedded = [s for s in sources if _has_vectors(s)]
+    unembedded = [s for s in sources if not _has_vectors(s)]
+    if mode != "lexical" and embedded:
+        dense = dense_candidates(query_vectors, depth, embedded)
+    else:
+        dense = [None] * len(queries)
+
+    results = []
+    for query, dense_ranked in zip(queries, dense):
+        if mode == "lexical" or not dense_ranked:
+            results.append([doc for _, doc in lexical_candidates(query, k, sources)])
+        elif mode == "hybrid":
+            results.append(reciprocal_rank_fusion([dense_ranked, lexical_candidates(query, depth, sources)], k))
+        elif unembedded:
+            results.append(reciprocal_rank_fusion([dense_ranked, lexical_candidates(query, depth, unembedded)], k))
+        else:
+            results.append([doc for _, doc in dense_ranked[:k]])
+    return results
+
+def _resolve_mode(mode):
+    mode = (mode or RETRIEVAL_MODE).lower()
+    return mode if mode in RETRIEVAL_MODES else "dense"
+
+def retrieve_many(queries, k=3, scratch=None, mode=None):
+    """
+    Retrieve the top k documents for each query. Dense scoring runs all
+    queries against each index with a single matrix product over the
+    normalized rows. Returns one list of documents per query.
+    """
+    mode = _resolve_mode(mode)
+    sources = _retrieval_sources(scratch)
+    if not queries or not sources:
+        return [[] for _ in queries]
 
     try:
-        if get_provider() == "ollama":
-            query_embedding = np.array(call_ollama_embedding(query))
+        query_vectors = [None] * len(queries) if mode == "lexical" else [embed_query(q) for q in queries]
+        with metrics.stage("retrieve"):
+            return rank_queries(queries, query_vectors, k, sources, mode)
+    except Exception as e:
+        print(f"Retrieval Error: {e}")
+        return [[] for _ in queries]
+
+async def retrieve_many_async(queries, k=3, scratch=None, mode=None):
+    """retrieve_many with query embeddings fetched concurrently and without blocking."""
+    mode = _resolve_mode(mode)
+    sources = _retrieval_sources(scratch)
+    if not queries or not sources:
+        return [[] for _ in queries]
+
+    try:
+        if mode == "lexical":
+            query_vectors = [None] * len(queries)
         else:
-            # Gemini path requires API key
-            api_key = os.getenv("GEMINI_API_KEY")
-            if not api_key:
-                print("Retrieval skipped: No GEMINI_API_KEY and provider is not ollama.")
-                return []
-            
-            # Embed query with Gemini
-            url = "https://generativelanguage.googleapis.com/v1/models/embedding-001:embedContent"
-            payload = {
-                "model": "models/embedding-001",
-                "content": {"parts": [{"text": query}]},
-                "taskType": "RETRIEVAL_QUERY"
-            }
-            
-            response = requests.post(
-                url, 
-                headers={"Content-Type": "application/json"},
-                params={"key": api_key},
-                json=payload,
-                timeout=10
-            )
-            
-            if response.status_code != 200:
-                print(f"Retrieval embedding error: {response.text}")
-                return []
-                
-            data = response.json()
-            if 'embedding' not in data or 'values' not in data['embedding']:
-                 return []
-                 
-            query_embedding = np.array(data['embedding']['values'])
-        
-        # Calculate Cosine Similarity
-        doc_norms = np.linalg.norm(document_embeddings, axis=1)
-        query_norm = np.linalg.norm(query_embedding)
-        
-        if query_norm == 0 or np.any(doc_norms == 0):
-            return []
-            
-        scores = np.dot(document_embeddings, query_embedding) / (doc_norms * query_norm)
-        
-        top_k_indices = np.argsort(scores)[-k:][::-1]
-        
-        results = [documents[i] for i in top_k_indices]
-        return results
-        
+            query_vectors = await asyncio.gather(*(embed_query_async(q) for q in queries))
+        with metrics.stage("retrieve"):
+            return rank_queries(queries, query_vectors, k, sources, mode)
     except Exception as e:
         print(f"Retrieval Error: {e}")
-        return []
+        return [[] for _ in queries]
+
+def retrieve(query, k=3, scratch=None, mode=None):
+    """
+    Retrieve top k documents by cosine similarity ("dense"), BM25
+    ("lexical") or both fused ("hybrid"); mode defaults to RETRIEVAL_MODE.
+    If a ScratchIndex is given, its documents compete with the shared
+    corpus and the best k across both are returned.
+    """
+    return retrieve_many([query], k, scratch, mode)[0]
+
+async def retrieve_async(query, k=3, scratch=None, mode=None):
+    return (await retrieve_many_async([query], k, scratch, mode))[0]
@@ -0,0 +1,216 @@
+import re
+import time
+import bisect
+import threading
+
+# Per-document metadata, parsed once when a document is ingested instead of
+# on every GET /rag/knowledge. Rows of an IndexSnapshot's documents carry the
+# text that is embedded; records carry what the Resources page shows.
+
+# Sources shown on the Resources page; raw user data (topics, sessions)
+# and dataset rows are searchable but not listed
+LISTED_SOURCES = frozenset({"user", "knowledge", "guide", "text"})
+
+# Compact the listing indexes once this share of their entries is dead
+COMPACT_RATIO = 0.25
+
+# GET /rag/knowledge page size when no limit is given, and the largest allowed
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+_PREFIX_RE = re.compile(r"^(User Resource|General Knowledge|Dataset) \((.*?)\): ", re.DOTALL)
+_PREFIX_SOURCES = {"User Resource": "user", "General Knowledge": "knowledge", "Dataset": "dataset"}
+_KNOWLEDGE_PREFIX = "Knowledge ("
+
+
+class DocumentRecord:
+    __slots__ = ("id", "seq", "source", "category", "title", "text", "created_at")
+
+    def __init__(self, doc_id, seq, source, category, title, text, created_at):
+        self.id = doc_id
+        self.seq = seq
+        self.source = source
+        self.category = category
+        self.title = title
+        self.text = text
+        self.created_at = created_at
+
+    def to_dict(self):
+        item = {"id": self.id, "category": self.category, "content": self.text,
+                "source": self.source, "created_at": self.created_at}
+        if self.title:
+            item["title"] = self.title
+        return item
+
+
+def parse_document(text):
+    """(source, category, title, content) from an indexed document string."""
+    match = _PREFIX_RE.match(text)
+    if match:
+        content = text[match.end():]
+        title = None
+        first, _, rest = content.partition("\n")
+        if first.startswith("#") and rest.strip():
+            title, content = first.lstrip("#").strip(), rest.strip()
+        return _PREFIX_SOURCES[match.group(1)], match.group(2), title, content
+    category = None
+    if text.startswith(_KNOWLEDGE_PREFIX):
+        # Files under data/: the folder is the category, the content decides guide or text
+        category, _, text = text[len(_KNOWLEDGE_PREFIX):].partition("): ")
+    elif text.startswith("Session on"):
+        return "session", "Session", None, text
+    elif text.startswith("Topic:"):
+        return "topic", "Topic", None, text
+    if "# " in text and "**" in text:  # Simple MD detection
+        lines = text.split("\n")
+        return "guide", category or "Guide", lines[0].replace("#", "").strip(), "\n".join(lines[1:]).strip()
+    return "text", category or "Study Material", None, text
+
+
+class RecordStore:
+    """
+    Records by id, plus listing indexes built at write time: all listed
+    records and each category's records as ascending insertion sequence
+    numbers. A page is a bisect to the cursor and a short scan. Deleted
+    entries stay in the indexes as tombstones until compaction.
+
+    Records are never edited in place (put replaces the object), so a
+    fork() shares them and copies only the containers.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.records = {}
+        self._next_seq = 1
+        self._id_of_seq = {}
+        self._order = []
+        self._by_category = {}
+        self._dead = 0
+
+    @classmethod
+    def build(cls, ids, texts):
+        store = cls()
+        for doc_id, text in zip(ids, texts):
+            store.put(doc_id, text)
+        return store
+
+    @classmethod
+    def restore(cls, ids, texts, saved):
+        """
+        Store as export() saved it: the same seqs (listing cursors) and
+        creation times, so every process that loads it pages identically.
+        """
+        store = cls()
+        rows = sorted(zip(saved["seqs"], ids, texts, saved["created"]))
+        for seq, doc_id, text, created_at in rows:
+            source, category, title, content = parse_document(text)
+            record = DocumentRecord(doc_id, seq, source, category, title, content, created_at)
+            store.records[doc_id] = record
+            store._list(record)
+        store._next_seq = saved["next_seq"]
+        return store
+
+    def export(self, ids):
+        """Seqs and creation times of ids' records, plus the next seq, for restore()."""
+        with self._lock:
+            records = [self.records[doc_id] for doc_id in ids]
+            return {"seqs": [record.seq for record in records],
+                    "created": [record.created_at for record in records], "next_seq": self._next_seq}
+
+    def __len__(self):
+        return len(self.records)
+
+    def fork(self):
+        """Copy for a writer; the original is left as published."""
+        with self._lock:
+            clone = RecordStore()
+            clone.records = dict(self.records)
+            clone._next_seq = self._next_seq
+            clone._id_of_seq = dict(self._id_of_seq)
+            clone._order = list(self._order)
+            clone._by_category = {key: list(seqs) for key, seqs in self._by_category.items()}
+            clone._dead = self._dead
+            return clone
+
+    def get(self, doc_id):
+        return self.records.get(doc_id)
+
+    def put(self, doc_id, text, created_at=None):
+        """Insert or replace the record for doc_id; a replaced record keeps its position."""
+        source, category, title, content = parse_document(text)
+        with self._lock:
+            record = self.records.get(doc_id)
+            if record is not None:
+                self._unlist(record)
+                record = DocumentRecord(doc_id, record.seq, source, category, title, content, record.created_at)
+                self.records[doc_id] = record
+            else:
+                record = DocumentRecord(doc_id, self._next_seq, source, category, title, content,
+                                        created_at or time.time())
+                self._next_seq += 1
+                self.records[doc_id] = record
+            self._list(record)
+            return record
+
+    def delete(self, doc_id):
+        with self._lock:
+            record = self.records.pop(doc_id, None)
+            if record is None:
+                return False
+            self._unlist(record)
+            return True
+
+    def _list(self, record):
+        if record.source not in LISTED_SOURCES:
+            return
+        self._id_of_seq[record.seq] = record.id
+        i = bisect.bisect_left(self._order, record.seq)
+        if i < len(self._order) and self._order[i] == record.seq:
+            self._dead -= 1  # revives its own tombstone (replaced record)
+        else:
+            self._order.insert(i, record.seq)
+        bisect.insort(self._by_category.setdefault(record.category.casefold(), []), record.seq)
+
+    def _unlist(self, record):
+        if self._id_of_seq.pop(record.seq, None) is None:
+            return
+        # Leave a tombstone in _order; the category entry is removed now so
+        # a record that changes category isn't listed twice
+        seqs = self._by_category.get(record.category.casefold(), [])
+        i = bisect.bisect_left(seqs, record.seq)
+        if i < len(seqs) and seqs[i] == record.seq:
+            del seqs[i]
+        self._dead += 1
+        if self._dead > COMPACT_RATIO * max(len(self._id_of_seq), 1):
+            self._order = [seq for seq in self._order if seq in self._id_of_seq]
+            self._dead = 0
+
+    def categories(self):
+        """Listed categories and their record counts."""
+        with self._lock:
+            return {self.records[self._id_of_seq[seqs[0]]].category: len(seqs)
+                    for seqs in self._by_category.values() if seqs}
+
+    def page(self, category=None, cursor=None, limit=None, newest_first=False):
+        """
+        Listed records in insertion order (or newest first), optionally for
+        one category (case-insensitive), starting after cursor. Returns
+        (records, next_cursor); next_cursor is None on the last page.
+        """
+        with self._lock:
+            seqs = self._order if category is None else self._by_category.get(category.casefold(), [])
+            if newest_first:
+                end = bisect.bisect_left(seqs, cursor) if cursor is not None else len(seqs)
+                positions = range(end - 1, -1, -1)
+            else:
+                start = bisect.bisect_right(seqs, cursor) if cursor is not None else 0
+                positions = range(start, len(seqs))
+            page = []
+            for position in positions:
+                doc_id = self._id_of_seq.get(seqs[position])
+                if doc_id is None:
+                    continue
+                if limit is not None and len(page) >= limit:
+                    return page, page[-1].seq
+                page.append(self.records[doc_id])
+            return page, None
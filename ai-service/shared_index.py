@@ -0,0 +1,240 @@
+import os
+import json
+import shutil
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, so no cross-process sharing
+    fcntl = None
+
+# Host-wide copy of the built index for multi-worker deployments
+# (uvicorn --workers N). One process, the leader, embeds the corpus and
+# writes it here; every worker maps the vectors read-only, so the OS keeps
+# one copy in the page cache however many workers attach.
+#
+# A generation is a full copy of the index, written by a build or by
+# compaction. Mutations in between are appended to that generation's
+# delta files, one journal line and one vector row each, and every worker
+# applies them to its own snapshot instead of reloading the corpus.
+#
+# Layout:
+#     CURRENT            {"generation": N}, atomically replaced on publish
+#     gen-0000000N/      vectors.npy, scales.npy (int8 only), valid.npy,
+#                        documents.json {"documents", "ids", "records"},
+#                        ivf.npz (IVF only),
+#                        deltas.jsonl  upsert/delete ops since the generation
+#                        deltas.f32    their normalized float32 vectors
+#     leader.lock        flock held for the leader's lifetime
+#     writer.lock        flock held while publishing or appending deltas
+#     build.lock         flock held by a running full build; compaction waits
+CURRENT_FILE = "CURRENT"
+DOCUMENTS_FILE = "documents.json"
+IVF_FILE = "ivf.npz"
+DELTAS_FILE = "deltas.jsonl"
+DELTA_VECTORS_FILE = "deltas.f32"
+
+# Generations kept on disk; older ones may still be mapped by a slow reader
+KEEP_GENERATIONS = 3
+
+
+def available():
+    return fcntl is not None
+
+
+@contextmanager
+def file_lock(path, blocking=True):
+    """
+    Exclusive lock on path across processes (no-op where flock is missing).
+    Yields whether it was acquired, which is always True when blocking.
+    """
+    if fcntl is None:
+        yield True
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class Generation:
+    """A loaded generation: documents and record metadata, vectors as read-only maps."""
+    __slots__ = ("number", "documents", "ids", "records", "embeddings", "scales", "valid", "ivf_path")
+
+    def __init__(self, number, documents, ids, records, embeddings, scales, valid, ivf_path):
+        self.number = number
+        self.documents = documents
+        self.ids = ids
+        self.records = records
+        self.embeddings = embeddings
+        self.scales = scales
+        self.valid = valid
+        self.ivf_path = ivf_path
+
+
+class SharedIndex:
+    def __init__(self, directory):
+        self.directory = os.path.abspath(directory)
+        os.makedirs(self.directory, exist_ok=True)
+        self._leader_file = None
+
+    @property
+    def is_leader(self):
+        return self._leader_file is not None
+
+    def try_lead(self):
+        """Become this host's leader unless another live process already is."""
+        if self._leader_file is None:
+            f = open(os.path.join(self.directory, "leader.lock"), "a")
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                f.close()
+                return False
+            self._leader_file = f  # the lock lasts as long as the open file
+        return True
+
+    def writer(self):
+        """Serializes publishes and delta appends across workers."""
+        return file_lock(os.path.join(self.directory, "writer.lock"))
+
+    def building(self, blocking=True):
+        """Held for a whole full build, so nobody compacts the deltas it will replay."""
+        return file_lock(os.path.join(self.directory, "build.lock"), blocking)
+
+    def _path(self, generation):
+        return os.path.join(self.directory, f"gen-{generation:08d}")
+
+    def generation(self):
+        """Latest published generation, 0 if none."""
+        try:
+            with open(os.path.join(self.directory, CURRENT_FILE), "r", encoding="utf-8") as f:
+                return int(json.load(f)["generation"])
+        except (OSError, ValueError, KeyError):
+            return 0
+
+    # ── Publish / attach ──────────────────────────────────────────────────────
+    def publish(self, documents, ids, embeddings, scales, valid, index=None, records=None):
+        """
+        Write a new generation and point CURRENT at it. records is saved
+        as-is for load() (record metadata that must match across workers).
+        Call under writer(). Returns the generation number.
+        """
+        generation = self.generation() + 1
+        path = self._path(generation)
+        tmp_path = path + ".tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        with open(os.path.join(tmp_path, DOCUMENTS_FILE), "w", encoding="utf-8") as f:
+            json.dump({"documents": documents, "ids": ids, "records": records}, f)
+        if embeddings is not None:
+            np.save(os.path.join(tmp_path, "vectors.npy"), embeddings)
+            np.save(os.path.join(tmp_path, "valid.npy"), valid)
+            if scales is not None:
+                np.save(os.path.join(tmp_path, "scales.npy"), scales)
+        if index is not None and hasattr(index, "save"):
+            index.save(os.path.join(tmp_path, IVF_FILE))
+        os.replace(tmp_path, path)
+
+        current = os.path.join(self.directory, CURRENT_FILE)
+        with open(current + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"generation": generation}, f)
+        os.replace(current + ".tmp", current)
+        self._prune(generation)
+        return generation
+
+    def _prune(self, generation):
+        for name in os.listdir(self.directory):
+            if name.startswith("gen-") and not name.endswith(".tmp"):
+                try:
+                    if int(name[4:]) <= generation - KEEP_GENERATIONS:
+                        # Mapped files stay readable until unmapped
+                        shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+                except ValueError:
+                    pass
+
+    def load(self, generation):
+        """
+        Generation as published. The arrays are read-only memory maps;
+        ivf_path is None unless saved.
+        """
+        path = self._path(generation)
+        with open(os.path.join(path, DOCUMENTS_FILE), "r", encoding="utf-8") as f:
+            data = json.load(f)
+        embeddings = scales = valid = None
+        if os.path.exists(os.path.join(path, "vectors.npy")):
+            embeddings = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+            valid = np.load(os.path.join(path, "valid.npy"), mmap_mode="r")
+            if os.path.exists(os.path.join(path, "scales.npy")):
+                scales = np.load(os.path.join(path, "scales.npy"), mmap_mode="r")
+        ivf_path = os.path.join(path, IVF_FILE)
+        return Generation(generation, data["documents"], data["ids"], data.get("records"),
+                          embeddings, scales, valid, ivf_path if os.path.exists(ivf_path) else None)
+
+    # ── Deltas ────────────────────────────────────────────────────────────────
+    def append(self, generation, op, doc_id, text, created_at=None, vector=None):
+        """
+        Record a mutation made on top of generation, with the vector it was
+        embedded to as (normalized float32 vector, ok) or None. Call under
+        writer(). Returns the deltas offset just past it.
+        """
+        path = self._path(generation)
+        os.makedirs(path, exist_ok=True)  # generation 0: before the first publish
+        entry = {"op": op, "id": doc_id, "text": text, "created_at": created_at}
+        if vector is not None:
+            vec, ok = vector
+            vec = np.ascontiguousarray(vec, dtype=np.float32)
+            with open(os.path.join(path, DELTA_VECTORS_FILE), "ab") as f:
+                entry.update(offset=f.tell(), dim=int(vec.size), ok=bool(ok))
+                f.write(vec.tobytes())
+        # The vector is written first, so a reader never finds a line without it
+        with open(os.path.join(path, DELTAS_FILE), "ab") as f:
+            f.write(json.dumps(entry).encode("utf-8") + b"\n")
+            return f.tell()
+
+    def deltas_offset(self, generation):
+        """End of generation's deltas, for a later deltas_since()."""
+        try:
+            return os.path.getsize(os.path.join(self._path(generation), DELTAS_FILE))
+        except OSError:
+            return 0
+
+    def deltas_since(self, generation, offset):
+        """
+        Mutations appended to generation after offset, as (op, id, text,
+        created_at, vector) with vector as in append(), and the offset past
+        the last complete one. Safe without writer(): a line still being
+        written is left for the next call.
+        """
+        path = self._path(generation)
+        try:
+            with open(os.path.join(path, DELTAS_FILE), "rb") as f:
+                f.seek(offset)
+                data = f.read()
+        except OSError:
+            return [], offset
+        end = data.rfind(b"\n") + 1
+        deltas = []
+        vectors = None
+        try:
+            for line in data[:end].splitlines():
+                entry = json.loads(line)
+                vector = None
+                if "offset" in entry:
+                    vectors = vectors or open(os.path.join(path, DELTA_VECTORS_FILE), "rb")
+                    vectors.seek(entry["offset"])
+                    vector = (np.frombuffer(vectors.read(4 * entry["dim"]), dtype=np.float32), entry["ok"])
+                deltas.append((entry["op"], entry["id"], entry["text"], entry["created_at"], vector))
+        finally:
+            if vectors is not None:
+                vectors.close()
+        return deltas, offset + end
@@ -0,0 +1,94 @@
+import asyncio
+import threading
+
+# Request coalescing: concurrent calls with the same key share one
+# execution of the underlying function and all receive its result (or
+# exception). Nothing is remembered once the call finishes — that is the
+# response cache's job.
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Thread version: the first caller runs fn, later callers block on its result."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.leaders = 0
+        self.joined = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.joined += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+                leader = True
+
+        if leader:
+            try:
+                call.result = fn()
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+        else:
+            call.done.wait()
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def stats(self):
+        with self._lock:
+            in_flight = len(self._calls)
+        return {"in_flight": in_flight, "leaders": self.leaders, "joined": self.joined}
+
+
+class AsyncSingleFlight:
+    """
+    asyncio version. The shared call runs as its own task and every caller
+    awaits it through asyncio.shield, so a caller that is cancelled (e.g. a
+    client disconnect) leaves the upstream request running for the others.
+    """
+
+    def __init__(self):
+        self._tasks = {}
+        self.leaders = 0
+        self.joined = 0
+
+    async def do(self, key, coro_fn):
+        loop = asyncio.get_running_loop()
+        task = self._tasks.get(key)
+        if task is not None and not task.done() and task.get_loop() is loop:
+            self.joined += 1
+        else:
+            task = loop.create_task(coro_fn())
+            self._tasks[key] = task
+            self.leaders += 1
+            task.add_done_callback(lambda t, key=key: self._finished(key, t))
+        return await asyncio.shield(task)
+
+    def _finished(self, key, task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        if not task.cancelled():
+            task.exception()  # retrieved here so an unawaited failure isn't logged as lost
+
+    def stats(self):
+        return {"in_flight": len(self._tasks), "leaders": self.leaders, "joined": self.joined}
@@ -0,0 +1,142 @@
+"""
+Where cold-start time goes.
+
+    python startup_profile.py              # import times, then the service's init steps
+    python startup_profile.py --no-init    # import times only
+    python startup_profile.py --top 30     # more rows
+
+Imports are measured in a fresh interpreter with -X importtime: main's
+direct imports with their cumulative cost, then the slowest packages
+pulled in anywhere. Init runs main.run_async_init (provider selection,
+index build or attach, model warm-up) and prints its steps.
+
+The service records the same steps on every start (see /debug "startup");
+STARTUP_PROFILE=1 also prints them once initialization finishes.
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+import subprocess
+from contextlib import contextmanager
+
+ENABLED = os.getenv("STARTUP_PROFILE", "").lower() in ("1", "true", "yes")
+
+_steps = []
+_lock = threading.Lock()
+
+
+def process_age():
+    """Seconds since this process started (Linux /proc), or None."""
+    try:
+        with open("/proc/self/stat", "r") as f:
+            # Field 22, counted after the parenthesised command name
+            started = int(f.read().rsplit(")", 1)[1].split()[19]) / os.sysconf("SC_CLK_TCK")
+        with open("/proc/uptime", "r") as f:
+            return float(f.read().split()[0]) - started
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def record(name, seconds):
+    with _lock:
+        _steps.append((name, seconds))
+
+
+@contextmanager
+def step(name):
+    """Time one startup step."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def steps():
+    """{step: seconds} in the order they finished."""
+    with _lock:
+        return {name: round(seconds, 3) for name, seconds in _steps}
+
+
+def report():
+    for name, seconds in steps().items():
+        print(f"[Startup] {name:<28} {seconds * 1000:>9.0f} ms")
+
+
+# ── Import timing ─────────────────────────────────────────────────────────────
+def import_times(module="main"):
+    """
+    Import module in a fresh interpreter under -X importtime. Returns
+    (total, direct, packages): total seconds, {direct import: seconds} and
+    {top-level package: seconds} for the first import of each package.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=here, capture_output=True, text=True)
+    total, direct, packages = 0.0, {}, {}
+    subtree = []  # (depth, name, seconds) since the last top-level import
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|", 2)
+        if not cumulative.strip().isdigit():
+            continue  # column header
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        name, seconds = name.strip(), int(cumulative) / 1e6
+        if depth > 0:
+            subtree.append((depth, name, seconds))
+            continue
+        if name == module:
+            # Children are listed before their parent
+            total = seconds
+            for child_depth, child, child_seconds in subtree:
+                if child_depth == 1:
+                    direct[child] = child_seconds
+                # A package's largest cumulative time is its outermost (first) import
+                package = child.split(".")[0]
+                packages[package] = max(packages.get(package, 0.0), child_seconds)
+        subtree = []
+    if result.returncode != 0:
+        print(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "import failed")
+    return total, direct, packages
+
+
+def print_imports(module, top):
+    total, direct, packages = import_times(module)
+    print(f"import {module}: {total * 1000:.0f} ms\n")
+    print(f"  {'direct import':<32} {'ms':>8}")
+    for name, seconds in sorted(direct.items(), key=lambda kv: -kv[1])[:top]:
+        print(f"  {name:<32} {seconds * 1000:>8.0f}")
+    print(f"\n  {'package (anywhere)':<32} {'ms':>8}")
+    for name, seconds in sorted(packages.items(), key=lambda kv: -kv[1])[:top]:
+        print(f"  {name:<32} {seconds * 1000:>8.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report ai-service import and init timings.")
+    parser.add_argument("--module", default="main", help="module to import")
+    parser.add_argument("--top", type=int, default=15, help="rows per table")
+    parser.add_argument("--no-init", action="store_true", help="skip running the service's init steps")
+    args = parser.parse_args()
+
+    print_imports(args.module, args.top)
+    if args.no_init:
+        return 0
+
+    # main records into the imported module, not this __main__ copy
+    import startup_profile as profile
+    profile.ENABLED = False  # reported below instead
+    print("\nInit steps:")
+    with profile.step("import main"):
+        import main as service
+    with profile.step("resolve provider"):
+        service.providers.resolve()
+    service.run_async_init()
+    profile.report()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,35 @@
+import os
+import sys
+import zlib
+
+import numpy as np
+import pytest
+
+# The service is a flat set of modules run from ai-service/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DIM = 256
+
+
+def fake_embed(texts, provider=None, progress=None, store=None):
+    """Bag-of-words vectors hashed into DIM buckets: similar texts, similar vectors."""
+    vectors = np.zeros((len(texts), DIM), dtype=np.float32)
+    for i, text in enumerate(texts):
+        for token in text.lower().split():
+            vectors[i, zlib.crc32(token.encode("utf-8")) % DIM] += 1.0
+    return vectors
+
+
+@pytest.fixture
+def pipeline(monkeypatch, tmp_path):
+    """rag_pipeline with an empty index, no shared directory and a fake embedder."""
+    import rag_pipeline
+    monkeypatch.setenv("EMBED_CACHE_DIR", str(tmp_path / "embeddings"))
+    monkeypatch.setattr(rag_pipeline, "embed_documents", fake_embed)
+    monkeypatch.setattr(rag_pipeline, "fetch_query_embedding", lambda query, provider: fake_embed([query])[0])
+    monkeypatch.setattr(rag_pipeline, "VECTOR_INDEX", "brute")
+    monkeypatch.setattr(rag_pipeline, "build_status", dict(rag_pipeline.build_status))
+    for name, value in (("_snapshot", rag_pipeline.IndexSnapshot()), ("_building", False), ("_journal", None),
+                        ("shared", None), ("_attached", 0), ("_applied", 0), ("_deltas", 0)):
+        monkeypatch.setattr(rag_pipeline, name, value)
+    return rag_pipeline
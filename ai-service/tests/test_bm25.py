@@ -0,0 +1,72 @@
+import bm25
+
+DOCS = ["alpha apples", "bravo bananas", "charlie cherries", "delta dates", "echo elderberries"]
+
+
+def top(index, query):
+    rows, _ = index.search(query, k=1)
+    return int(rows[0]) if len(rows) else None
+
+
+def test_search_finds_rows():
+    index = bm25.BM25Index.build(DOCS)
+    assert top(index, "cherries") == 2
+    assert top(index, "zebra") is None
+
+
+def test_delete_shifts_later_rows_up():
+    index = bm25.BM25Index.build(DOCS)
+    index.delete(1)
+    assert top(index, "bananas") is None
+    assert top(index, "alpha") == 0
+    assert top(index, "cherries") == 1
+    assert top(index, "elderberries") == 3
+    assert len(index) == 4
+
+
+def test_added_rows_follow_deletes():
+    index = bm25.BM25Index.build(DOCS)
+    index.delete(0)
+    index.add("foxtrot figs")
+    index.delete(2)  # "delta dates", now row 2
+    assert top(index, "figs") == 3
+    assert top(index, "elderberries") == 2
+    assert top(index, "dates") is None
+
+
+def test_update_replaces_row_text():
+    index = bm25.BM25Index.build(DOCS)
+    index.update(3, "golf grapes")
+    assert top(index, "grapes") == 3
+    assert top(index, "dates") is None
+
+
+def test_fork_leaves_the_original_untouched():
+    index = bm25.BM25Index.build(DOCS)
+    fork = index.fork()
+    fork.delete(0)
+    fork.add("hotel honeydew")
+    fork.update(0, "india ice")
+    assert top(index, "apples") == 0
+    assert top(index, "bananas") == 1
+    assert top(index, "honeydew") is None
+    assert len(index) == 5
+    assert top(fork, "honeydew") == 4
+    assert top(fork, "ice") == 0
+
+
+def test_rebuild_after_churn_matches_a_fresh_index():
+    docs = list(DOCS)
+    index = bm25.BM25Index.build(docs)
+    for i, text in enumerate(["juliet juniper", "kilo kiwi", "lima limes"]):
+        index.add(text)
+        docs.append(text)
+        del docs[0]
+        index.delete(0)
+    assert index.needs_compaction()
+    fresh = bm25.BM25Index.build(docs)
+    for query in ("juniper", "kiwi", "limes", "dates", "elderberries"):
+        assert top(index, query) == top(fresh, query)
+    index.rebuild(docs)
+    assert not index.needs_compaction()
+    assert top(index, "limes") == docs.index("lima limes")
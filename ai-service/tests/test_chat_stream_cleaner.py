@@ -0,0 +1,46 @@
+import random
+
+import pytest
+
+import generator
+
+
+def render(chunks):
+    """Feed chunks through a cleaner; returns (what the client shows, cleaner)."""
+    cleaner = generator.ChatStreamCleaner()
+    shown = ""
+    events = [event for chunk in chunks for event in cleaner.feed(chunk)] + cleaner.finish()
+    for kind, text in events:
+        shown = "" if kind == "reset" else shown + text
+    return shown, cleaner
+
+
+def split_randomly(text, rng):
+    cuts = sorted(rng.sample(range(1, len(text)), min(len(text) - 1, rng.randint(1, 8))))
+    return [text[a:b] for a, b in zip([0] + cuts, cuts + [len(text)])]
+
+
+@pytest.mark.parametrize("raw", [
+    "  Hello there, student!  ",
+    "User: hi\nAssistant: Hello!",
+    "Assistant: first draft\nAssistant: final answer",
+    "Photosynthesis makes sugar. Assist the plant.",
+    "Ends with a partial Assist",
+])
+def test_stream_matches_the_batch_cleanup(raw):
+    rng = random.Random(raw)
+    for _ in range(20):
+        shown, cleaner = render(split_randomly(raw, rng))
+        assert shown.strip() == cleaner.reply == raw.split("Assistant:")[-1].strip()
+
+
+def test_marker_split_across_chunks_is_not_shown():
+    cleaner = generator.ChatStreamCleaner()
+    events = cleaner.feed("Assis") + cleaner.feed("tant: Hi")
+    assert events == [("token", "Hi")]
+
+
+def test_late_marker_resets_what_was_sent():
+    cleaner = generator.ChatStreamCleaner()
+    assert cleaner.feed("Draft text ") == [("token", "Draft text ")]
+    assert cleaner.feed("Assistant: Real") == [("reset", None), ("token", "Real")]
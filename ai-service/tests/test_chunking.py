@@ -0,0 +1,32 @@
+import chunking
+
+
+def sentence(words, tag):
+    return " ".join(f"{tag}{i}" for i in range(words - 1)) + "."
+
+
+def test_overlap_never_pushes_a_chunk_over_budget():
+    # Short sentences fill the carry, then a sentence that fits alone but not beside it
+    text = " ".join([sentence(5, "a"), sentence(5, "b"), sentence(5, "c"), sentence(18, "d"), sentence(5, "e")])
+    chunks = list(chunking.pack([text], max_tokens=20, overlap=10))
+    assert all(chunking.count_tokens(c) <= 20 for c in chunks)
+    assert any(c.startswith("d0") for c in chunks)
+    assert chunks[-1].endswith(sentence(5, "e"))
+
+
+def test_chunks_overlap_by_trailing_sentences():
+    text = " ".join(sentence(6, tag) for tag in "abcdef")
+    chunks = list(chunking.pack([text], max_tokens=18, overlap=6))
+    assert all(chunking.count_tokens(c) <= 18 for c in chunks)
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert chunk.split(".")[0] + "." in previous
+
+
+def test_oversized_sentences_are_split_within_budget():
+    chunks = chunking.chunk_text(sentence(100, "w"), max_tokens=30, overlap=5)
+    assert len(chunks) > 1
+    assert all(chunking.count_tokens(c) <= 30 for c in chunks)
+
+
+def test_text_within_budget_is_unchanged():
+    assert chunking.chunk_text("One short line.", max_tokens=30) == ["One short line."]
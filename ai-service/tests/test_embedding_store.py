@@ -0,0 +1,65 @@
+import json
+import os
+
+import numpy as np
+
+import embedding_store
+
+
+def vectors(n, dim=4, start=1):
+    return [np.arange(start + i * dim, start + (i + 1) * dim, dtype=np.float32) for i in range(n)]
+
+
+def test_put_and_reopen(tmp_path):
+    store = embedding_store.EmbeddingStore("p", "m", cache_dir=str(tmp_path))
+    assert store.put_many(["a", "b"], vectors(2)) == 2
+    reopened = embedding_store.EmbeddingStore("p", "m", cache_dir=str(tmp_path))
+    assert len(reopened) == 2
+    np.testing.assert_array_equal(reopened.get_many(["b"])["b"], vectors(2)[1])
+
+
+def test_skips_known_zero_and_wrong_dimension_rows(tmp_path):
+    store = embedding_store.EmbeddingStore("p", "m", cache_dir=str(tmp_path))
+    store.put_many(["a"], vectors(1))
+    written = store.put_many(["a", "z", "w", "c"],
+                             [vectors(1)[0], np.zeros(4), np.ones(3), vectors(1, start=50)[0]])
+    assert written == 1
+    assert set(store.get_many(["a", "z", "w", "c"])) == {"a", "c"}
+
+
+def test_appends_only_the_new_keys(tmp_path):
+    store = embedding_store.EmbeddingStore("p", "m", cache_dir=str(tmp_path))
+    store.put_many(["a", "b"], vectors(2))
+    size = os.path.getsize(store.keys_path)
+    store.put_many(["c"], vectors(1, start=100))
+    with open(store.keys_path, "rb") as f:
+        assert f.read()[:size] == b"a\nb\n"
+    with open(store.manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    assert manifest["count"] == 3 and "keys" not in manifest
+
+
+def test_instances_see_each_others_appends(tmp_path):
+    first = embedding_store.EmbeddingStore("p", "m", cache_dir=str(tmp_path))
+    second = embedding_store.EmbeddingStore("p", "m", cache_dir=str(tmp_path))
+    first.put_many(["a"], vectors(1))
+    second.put_many(["b"], vectors(1, start=20))
+    first.put_many(["c"], vectors(1, start=40))
+    reopened = embedding_store.EmbeddingStore("p", "m", cache_dir=str(tmp_path))
+    assert reopened.keys == ["a", "b", "c"]
+    np.testing.assert_array_equal(reopened.get_many(["b"])["b"], vectors(1, start=20)[0])
+
+
+def test_uncommitted_tail_is_ignored(tmp_path):
+    store = embedding_store.EmbeddingStore("p", "m", cache_dir=str(tmp_path))
+    store.put_many(["a"], vectors(1))
+    # A crash after writing rows and keys but before the manifest
+    with open(store.vectors_path, "ab") as f:
+        f.write(np.ones(4, dtype=np.float32).tobytes())
+    with open(store.keys_path, "ab") as f:
+        f.write(b"ghost\n")
+    reopened = embedding_store.EmbeddingStore("p", "m", cache_dir=str(tmp_path))
+    assert reopened.keys == ["a"]
+    reopened.put_many(["b"], vectors(1, start=9))
+    assert embedding_store.EmbeddingStore("p", "m", cache_dir=str(tmp_path)).keys == ["a", "b"]
+
@@ -0,0 +1,36 @@
+import grading
+
+
+def grade(expected, answer):
+    return grading.grade_fast({"correctAnswer": expected, "userAnswer": answer})
+
+
+def test_exact_and_numeric_answers():
+    assert grade("Paris", "paris.")["isCorrect"] is True
+    assert grade("0.5", "1/2")["isCorrect"] is True
+    assert grade("3", "4")["isCorrect"] is False
+
+
+def test_empty_answer_is_wrong():
+    assert grade("Paris", "  ")["isCorrect"] is False
+
+
+def test_close_paraphrase_passes_on_overlap():
+    assert grade("the powerhouse of the cell", "powerhouse of the cell")["isCorrect"] is True
+
+
+def test_added_negation_goes_to_the_model():
+    assert grade("the mitochondria is the powerhouse of the cell",
+                 "the mitochondria is not the powerhouse of the cell") is None
+
+
+def test_dropped_negation_goes_to_the_model():
+    assert grade("water is not a compound of carbon and oxygen",
+                 "water is a compound of carbon and oxygen") is None
+
+
+def test_negating_words():
+    assert grading.is_negating("never")
+    assert grading.is_negating("unstable")
+    assert not grading.is_negating("into")
+    assert not grading.is_negating("cell")
@@ -0,0 +1,120 @@
+import threading
+
+import numpy as np
+
+from conftest import DIM
+
+CORPUS = [f"Knowledge (Science): fact {i} about {topic}"
+          for i, topic in enumerate(["atoms", "cells", "planets", "magnets", "volcanoes"])]
+
+
+class BlockingCorpus:
+    """Yields the first half, then waits until released (optionally failing instead)."""
+
+    def __init__(self, texts, fail=False):
+        self.texts, self.fail = texts, fail
+        self.reached = threading.Event()
+        self.release = threading.Event()
+
+    def __iter__(self):
+        half = len(self.texts) // 2
+        yield from self.texts[:half]
+        self.reached.set()
+        self.release.wait(5)
+        if self.fail:
+            raise RuntimeError("corpus went away")
+        yield from self.texts[half:]
+
+
+def build_in_background(pipeline, corpus):
+    thread = threading.Thread(target=pipeline.build_index, args=(corpus,))
+    thread.start()
+    assert corpus.reached.wait(5)
+    return thread
+
+
+def test_build_publishes_a_searchable_snapshot(pipeline):
+    assert pipeline.build_index(CORPUS) == len(CORPUS)
+    snapshot = pipeline.current_index()
+    assert snapshot.embeddings.shape[0] == len(CORPUS)
+    assert pipeline.retrieve("volcanoes", k=1) == [CORPUS[4]]
+    assert pipeline.readiness()[0]
+
+
+def test_mutations_leave_published_snapshots_untouched(pipeline):
+    pipeline.build_index(CORPUS)
+    before = pipeline.current_index()
+    row = before.embeddings[1].copy()
+
+    pipeline.add_document("User Resource (Notes): comets have tails", "note")
+    pipeline.upsert_document(before.ids[1], "Knowledge (Science): fact about glaciers")
+    pipeline.delete_document(before.ids[0])
+
+    after = pipeline.current_index()
+    assert len(before) == len(CORPUS) and before.documents == CORPUS
+    assert before.records.get("note") is None
+    assert before.records.get(before.ids[1]).text == "fact 1 about cells"
+    np.testing.assert_array_equal(before.embeddings[1], row)
+    assert before.lexical.search("glaciers")[0].size == 0
+
+    assert after.ids == before.ids[1:] + ["note"]
+    assert after.records.get("note").source == "user"
+    assert pipeline.retrieve("glaciers", k=1) == ["Knowledge (Science): fact about glaciers"]
+    assert pipeline.retrieve("comets tails", k=1, mode="lexical") == ["User Resource (Notes): comets have tails"]
+
+
+def test_mutations_during_a_build_are_replayed(pipeline):
+    pipeline.build_index(CORPUS[:2])
+    corpus = BlockingCorpus(CORPUS)
+    thread = build_in_background(pipeline, corpus)
+    pipeline.add_document("User Resource (Notes): comets have tails", "note")
+    pipeline.upsert_document(pipeline.make_document_ids(CORPUS)[3], "Knowledge (Science): replaced magnets")
+    pipeline.delete_document(pipeline.make_document_ids(CORPUS)[0])
+    corpus.release.set()
+    thread.join(5)
+
+    snapshot = pipeline.current_index()
+    assert snapshot.documents == CORPUS[1:3] + ["Knowledge (Science): replaced magnets", CORPUS[4],
+                                                "User Resource (Notes): comets have tails"]
+    assert snapshot.embeddings.shape[0] == len(snapshot) and snapshot.valid.all()
+    assert len(snapshot.lexical) == len(snapshot) and len(snapshot.records) == len(snapshot)
+    assert pipeline.retrieve("comets tails", k=1) == ["User Resource (Notes): comets have tails"]
+
+
+def test_add_after_a_failed_build_pads_missing_rows(pipeline):
+    pipeline.build_index(CORPUS)
+    corpus = BlockingCorpus(CORPUS, fail=True)
+    thread = build_in_background(pipeline, corpus)
+    pipeline.add_document("User Resource (Notes): added while building", "during")
+    corpus.release.set()
+    thread.join(5)
+    assert pipeline.build_status["state"] == "failed"
+
+    pipeline.add_document("User Resource (Notes): comets have tails", "after")
+    snapshot = pipeline.current_index()
+    n = len(CORPUS)
+    assert snapshot.embeddings.shape[0] == len(snapshot) == n + 2
+    assert snapshot.valid[:n].all() and not snapshot.valid[n] and snapshot.valid[n + 1]
+    assert pipeline.retrieve("comets tails", k=1) == ["User Resource (Notes): comets have tails"]
+
+
+def test_dense_falls_back_to_bm25_when_no_row_was_embedded(pipeline, monkeypatch):
+    monkeypatch.setattr(pipeline, "embed_documents", lambda texts, *args, **kwargs: np.zeros((len(texts), DIM), np.float32))
+    pipeline.build_index(CORPUS)
+    assert not pipeline.current_index().valid.any()
+    assert pipeline.retrieve("volcanoes", k=1, mode="dense") == [CORPUS[4]]
+    assert pipeline.retrieve("volcanoes", k=1, mode="hybrid") == [CORPUS[4]]
+
+
+def test_ivf_lists_are_cached_under_the_embedding_cache(pipeline, monkeypatch, tmp_path):
+    monkeypatch.setattr(pipeline, "VECTOR_INDEX", "ivf")
+    cache_dir = tmp_path / "embeddings" / "ivf"
+    cache_dir.mkdir(parents=True)
+    (cache_dir / "unrelated.npz").write_bytes(b"not ours")
+    (cache_dir / "ivf-stale.npz").write_bytes(b"old corpus")
+
+    pipeline.build_index(CORPUS)
+    saved = sorted(p.name for p in cache_dir.iterdir())
+    assert "unrelated.npz" in saved and "ivf-stale.npz" not in saved
+    assert len(saved) == 2 and not (tmp_path / "ivf").exists()
+    assert pipeline.retrieve("volcanoes", k=1) == [CORPUS[4]]
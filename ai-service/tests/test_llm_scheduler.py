@@ -0,0 +1,128 @@
+import asyncio
+import threading
+
+import pytest
+
+import llm_scheduler
+
+LIMITS = {"interactive": 4, "standard": 4, "batch": 4}
+
+
+def run(coro):
+    return asyncio.run(asyncio.wait_for(coro, 5))
+
+
+async def settle():
+    for _ in range(3):
+        await asyncio.sleep(0)
+
+
+def test_free_slots_are_taken_without_queueing():
+    async def scenario():
+        queue = llm_scheduler.BackendQueue("test", 2, LIMITS)
+        await queue.acquire_async("batch")
+        await queue.acquire_async("batch")
+        assert queue.active == 2
+        queue.release()
+        queue.release()
+        assert queue.active == 0
+    run(scenario())
+
+
+def test_released_slot_goes_to_the_highest_priority_waiter():
+    async def scenario():
+        queue = llm_scheduler.BackendQueue("test", 1, LIMITS)
+        await queue.acquire_async("standard")
+        order = []
+
+        async def wait(priority):
+            await queue.acquire_async(priority)
+            order.append(priority)
+            queue.release()
+
+        tasks = [asyncio.create_task(wait(p)) for p in ("batch", "standard", "interactive")]
+        await settle()
+        queue.release()
+        await asyncio.gather(*tasks)
+        assert order == ["interactive", "standard", "batch"]
+        assert queue.active == 0
+    run(scenario())
+
+
+def test_full_queue_is_refused_with_retry_after():
+    async def scenario():
+        queue = llm_scheduler.BackendQueue("test", 1, {"interactive": 1, "standard": 0, "batch": 0})
+        await queue.acquire_async("interactive")
+        with pytest.raises(llm_scheduler.QueueFull) as refused:
+            queue.admit("standard")
+        assert refused.value.retry_after >= 1
+        waiter = asyncio.create_task(queue.acquire_async("interactive"))
+        await settle()
+        with pytest.raises(llm_scheduler.QueueFull):
+            await queue.acquire_async("interactive")
+        queue.release()
+        await waiter
+        queue.release()
+        assert queue.stats()["priorities"]["interactive"]["rejected"] == 1
+    run(scenario())
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def scenario():
+        queue = llm_scheduler.BackendQueue("test", 1, LIMITS)
+        await queue.acquire_async("standard")
+        cancelled = asyncio.create_task(queue.acquire_async("interactive"))
+        waiting = asyncio.create_task(queue.acquire_async("batch"))
+        await settle()
+        cancelled.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        assert queue.stats()["priorities"]["interactive"]["queued"] == 0
+        queue.release()
+        await waiting
+        assert queue.active == 1
+        queue.release()
+        assert queue.active == 0
+    run(scenario())
+
+
+def test_slot_granted_to_a_cancelled_waiter_is_handed_on():
+    async def scenario():
+        queue = llm_scheduler.BackendQueue("test", 1, LIMITS)
+        await queue.acquire_async("standard")
+        granted = asyncio.create_task(queue.acquire_async("interactive"))
+        next_in_line = asyncio.create_task(queue.acquire_async("batch"))
+        await settle()
+        queue.release()  # grants the interactive waiter...
+        granted.cancel()  # ...which is cancelled before it resumes
+        with pytest.raises(asyncio.CancelledError):
+            await granted
+        await next_in_line
+        assert queue.active == 1
+        queue.release()
+        assert queue.active == 0
+    run(scenario())
+
+
+def test_threads_and_tasks_share_slots():
+    async def scenario():
+        scheduler = llm_scheduler.LLMScheduler({"test": 1}, LIMITS)
+        queue = scheduler.queue("test")
+        await queue.acquire_async("standard")
+        entered = threading.Event()
+
+        def worker():
+            with scheduler.slot_sync("test", "interactive"):
+                entered.set()
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        while queue.stats()["priorities"]["interactive"]["queued"] == 0:
+            await asyncio.sleep(0.01)
+        queue.release()
+        await asyncio.to_thread(thread.join, 2)
+        assert entered.is_set()
+        async with scheduler.slot("test", "batch"):
+            assert queue.active == 1
+        assert queue.active == 0
+    run(scenario())
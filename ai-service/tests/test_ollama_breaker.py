@@ -0,0 +1,45 @@
+import requests
+
+import generator
+import ollama_health
+
+
+def fresh_breaker(monkeypatch):
+    breaker = ollama_health.CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    monkeypatch.setattr(generator, "ollama_breaker", breaker)
+    monkeypatch.setattr(generator.ollama_monitor, "trigger", lambda: None)
+    return breaker
+
+
+def raising(exc):
+    def post(*args, **kwargs):
+        raise exc
+    return post
+
+
+def test_connect_timeouts_open_the_breaker(monkeypatch):
+    breaker = fresh_breaker(monkeypatch)
+    monkeypatch.setattr(generator.requests, "post", raising(requests.exceptions.ConnectTimeout("no route")))
+    assert generator.call_ollama("hi") == generator.OLLAMA_DOWN_MESSAGE
+    assert generator.call_ollama("hi") == generator.OLLAMA_DOWN_MESSAGE
+    assert breaker.state == ollama_health.OPEN
+    assert not breaker.allow_request()
+
+
+def test_read_timeouts_count_as_reachable(monkeypatch):
+    breaker = fresh_breaker(monkeypatch)
+    monkeypatch.setattr(generator.requests, "post", raising(requests.exceptions.ReadTimeout("slow")))
+    for _ in range(3):
+        assert "timed out" in generator.call_ollama("hi")
+    assert breaker.state == ollama_health.CLOSED
+
+
+def test_half_open_trial_failure_reopens(monkeypatch):
+    breaker = fresh_breaker(monkeypatch)
+    breaker.record_failure("down")
+    breaker.record_failure("down")
+    breaker.opened_at -= 60
+    assert breaker.allow_request() and breaker.state == ollama_health.HALF_OPEN
+    assert not breaker.allow_request()  # one trial at a time
+    breaker.record_failure("still down")
+    assert breaker.state == ollama_health.OPEN
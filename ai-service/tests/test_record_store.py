@@ -0,0 +1,95 @@
+import record_store
+
+
+def make_store(n=5, category="Notes"):
+    store = record_store.RecordStore()
+    for i in range(n):
+        store.put(f"d{i}", f"User Resource ({category}): note {i}")
+    return store
+
+
+def ids(records):
+    return [record.id for record in records]
+
+
+def all_pages(store, limit, **kwargs):
+    pages, cursor = [], None
+    while True:
+        page, cursor = store.page(cursor=cursor, limit=limit, **kwargs)
+        pages.append(ids(page))
+        if cursor is None:
+            return pages
+
+
+def test_parse_document_sources():
+    assert record_store.parse_document("User Resource (Notes): hi")[:2] == ("user", "Notes")
+    assert record_store.parse_document("Dataset (Survey): a | b")[0] == "dataset"
+    assert record_store.parse_document("Knowledge (Maths): plain text") == ("text", "Maths", None, "plain text")
+    source, category, title, _ = record_store.parse_document("Knowledge (Maths): # Algebra\n**x** = 1")
+    assert (source, category, title) == ("guide", "Maths", "Algebra")
+    assert record_store.parse_document("plain text")[:2] == ("text", "Study Material")
+    assert record_store.parse_document("Session on 2024-01-01 (30 min): x")[0] == "session"
+
+
+def test_unlisted_sources_stay_out_of_pages():
+    store = make_store(2)
+    store.put("row", "Dataset (Survey): Alice | 42")
+    store.put("topic", "Topic: Algebra (Maths). Goal: pass")
+    assert ids(store.page()[0]) == ["d0", "d1"]
+    assert store.get("row").source == "dataset"
+
+
+def test_pages_oldest_and_newest_first():
+    store = make_store(5)
+    assert all_pages(store, 2) == [["d0", "d1"], ["d2", "d3"], ["d4"]]
+    assert all_pages(store, 2, newest_first=True) == [["d4", "d3"], ["d2", "d1"], ["d0"]]
+
+
+def test_cursor_survives_deletes_and_inserts():
+    store = make_store(5)
+    first, cursor = store.page(limit=2, newest_first=True)
+    store.delete("d2")
+    store.put("d9", "User Resource (Notes): newest")
+    assert ids(store.page(cursor=cursor, limit=2, newest_first=True)[0]) == ["d1", "d0"]
+
+
+def test_replaced_record_keeps_position_and_moves_category():
+    store = make_store(3)
+    store.put("d1", "User Resource (Formula): e = mc2")
+    assert ids(store.page()[0]) == ["d0", "d1", "d2"]
+    assert ids(store.page(category="formula")[0]) == ["d1"]
+    assert ids(store.page(category="Notes")[0]) == ["d0", "d2"]
+    assert store.categories() == {"Notes": 2, "Formula": 1}
+
+
+def test_tombstones_are_compacted():
+    store = make_store(20)
+    for i in range(10):
+        store.delete(f"d{i}")
+    assert len(store._order) < 20
+    assert ids(store.page()[0]) == [f"d{i}" for i in range(10, 20)]
+
+
+def test_fork_leaves_the_original_untouched():
+    store = make_store(3)
+    record = store.get("d1")
+    fork = store.fork()
+    fork.put("d1", "User Resource (Notes): changed")
+    fork.delete("d0")
+    fork.put("d3", "User Resource (Notes): new")
+    assert ids(store.page()[0]) == ["d0", "d1", "d2"]
+    assert store.get("d1") is record and record.text == "note 1"
+    assert ids(fork.page()[0]) == ["d1", "d2", "d3"]
+
+
+def test_restore_keeps_seqs_and_creation_times():
+    store = make_store(4)
+    store.delete("d1")
+    doc_ids = ["d3", "d0", "d2"]
+    texts = [f"User Resource (Notes): note {i}" for i in (3, 0, 2)]
+    restored = record_store.RecordStore.restore(doc_ids, texts, store.export(doc_ids))
+    for doc_id in doc_ids:
+        assert restored.get(doc_id).seq == store.get(doc_id).seq
+        assert restored.get(doc_id).created_at == store.get(doc_id).created_at
+    assert all_pages(restored, 2, newest_first=True) == all_pages(store, 2, newest_first=True)
+    assert restored.put("d5", "User Resource (Notes): x").seq == store.put("d5", "User Resource (Notes): x").seq
@@ -0,0 +1,201 @@
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+import pytest
+
+import shared_index
+from conftest import fake_embed
+
+pytestmark = pytest.mark.skipif(not shared_index.available(), reason="needs flock")
+
+CORPUS = [f"Knowledge (Science): fact {i} about {topic}"
+          for i, topic in enumerate(["atoms", "cells", "planets", "magnets", "volcanoes"])]
+
+
+class Worker:
+    """One uvicorn worker's view of rag_pipeline, swapped in while active."""
+
+    def __init__(self, pipeline, directory):
+        self.pipeline = pipeline
+        self.state = {"_snapshot": pipeline.IndexSnapshot(), "_attached": 0, "_applied": 0, "_deltas": 0,
+                      "_building": False, "_journal": None, "shared": shared_index.SharedIndex(directory)}
+
+    @contextmanager
+    def active(self):
+        for name, value in self.state.items():
+            setattr(self.pipeline, name, value)
+        try:
+            yield self.pipeline
+        finally:
+            self.state = {name: getattr(self.pipeline, name) for name in self.state}
+
+    def run(self, function, *args):
+        with self.active() as pipeline:
+            return getattr(pipeline, function)(*args)
+
+    def sync(self):
+        with self.active() as pipeline, pipeline._index_lock:
+            pipeline._sync()
+        return self.state["_snapshot"]
+
+    def page(self, limit, cursor=None):
+        records, next_cursor = self.state["_snapshot"].records.page(cursor=cursor, limit=limit, newest_first=True)
+        return [record.id for record in records], next_cursor
+
+
+@pytest.fixture
+def workers(pipeline, tmp_path):
+    leader, follower = Worker(pipeline, tmp_path / "index"), Worker(pipeline, tmp_path / "index")
+    leader.run("build_index", CORPUS)
+    follower.sync()
+    return leader, follower
+
+
+def test_generation_round_trip(tmp_path):
+    shared = shared_index.SharedIndex(tmp_path)
+    vectors = np.eye(3, dtype=np.float32)
+    with shared.writer():
+        generation = shared.publish(["a", "b", "c"], ["1", "2", "3"], vectors, None, np.ones(3, dtype=bool),
+                                    records={"seqs": [1, 2, 3], "created": [0, 0, 0], "next_seq": 4})
+    loaded = shared.load(generation)
+    assert (loaded.documents, loaded.ids, loaded.records["next_seq"]) == (["a", "b", "c"], ["1", "2", "3"], 4)
+    np.testing.assert_array_equal(loaded.embeddings, vectors)
+    assert not loaded.embeddings.flags.writeable
+
+
+def test_deltas_skip_a_line_still_being_written(tmp_path):
+    shared = shared_index.SharedIndex(tmp_path)
+    vector = (np.arange(4, dtype=np.float32), True)
+    end = shared.append(1, "upsert", "d1", "text", 12.5, vector)
+    shared.append(1, "delete", "d0", None)
+    with open(tmp_path / "gen-00000001" / shared_index.DELTAS_FILE, "ab") as f:
+        f.write(b'{"op": "ups')
+    deltas, offset = shared.deltas_since(1, 0)
+    assert [delta[:4] for delta in deltas] == [("upsert", "d1", "text", 12.5), ("delete", "d0", None, None)]
+    np.testing.assert_array_equal(deltas[0][4][0], vector[0])
+    assert deltas[0][4][1] is True and deltas[1][4] is None
+    assert shared.deltas_since(1, end)[0][0][:2] == ("delete", "d0")
+    assert shared.deltas_since(1, offset) == ([], offset)
+
+
+def test_follower_attaches_mapped_vectors_and_the_same_records(workers):
+    leader, follower = workers
+    ours, theirs = leader.state["_snapshot"], follower.state["_snapshot"]
+    assert theirs.ids == ours.ids and theirs.documents == ours.documents
+    assert not theirs.embeddings.flags.writeable
+    assert follower.page(10) == leader.page(10)
+
+
+def test_mutations_reach_other_workers_as_deltas(workers, monkeypatch):
+    leader, follower = workers
+    generation = leader.state["_attached"]
+    bases = leader.state["_snapshot"].embeddings, follower.state["_snapshot"].embeddings
+    leader.run("add_document", "User Resource (Notes): comets have tails", "d1")
+    follower.run("add_document", "User Resource (Notes): glaciers carve valleys", "d2")
+    leader.run("add_document", "User Resource (Notes): tides follow the moon", "d3")
+    leader.run("delete_document", "d1")
+
+    # Applying deltas reuses the journaled vectors instead of embedding again
+    embedded = []
+    monkeypatch.setattr(follower.pipeline, "embed_documents", lambda texts, *a, **k: embedded.append(texts))
+    follower.sync()
+    leader.sync()
+    assert embedded == []
+    assert leader.state["_attached"] == follower.state["_attached"] == generation
+    assert follower.state["_deltas"] == 4
+
+    ours, theirs = leader.state["_snapshot"], follower.state["_snapshot"]
+    assert theirs.ids == ours.ids == ours.ids[:5] + ["d2", "d3"]
+    for got, want in zip(leader.pipeline._dense_rows(theirs), leader.pipeline._dense_rows(ours)):
+        np.testing.assert_array_equal(got, want)
+    assert theirs.records.get("d3").created_at == ours.records.get("d3").created_at
+    # Both kept the mapped generation and put the new vectors in their own overlay
+    assert (ours.embeddings, theirs.embeddings) == bases
+    assert not theirs.embeddings.flags.writeable and theirs.overlay[3] == 3
+
+
+def test_overlay_over_the_mapped_base_is_searched(workers):
+    leader, follower = workers
+    base = follower.state["_snapshot"].embeddings
+    ids = leader.state["_snapshot"].ids
+    leader.run("upsert_document", ids[4], "Knowledge (Science): glaciers carve valleys")
+    leader.run("delete_document", ids[2])
+    leader.run("add_document", "User Resource (Notes): comets have tails", "d1")
+    follower.sync()
+
+    for worker in workers:
+        snapshot = worker.state["_snapshot"]
+        assert snapshot.embeddings is base or not snapshot.embeddings.flags.writeable
+        assert worker.run("retrieve", "glaciers valleys", 1) == ["Knowledge (Science): glaciers carve valleys"]
+        assert worker.run("retrieve", "comets tails", 1) == ["User Resource (Notes): comets have tails"]
+        # The replaced and deleted rows are still in the base, but no longer found
+        found = worker.run("retrieve", "fact about volcanoes planets", 5)
+        assert CORPUS[4] not in found and CORPUS[2] not in found and len(found) == 5
+        assert worker.run("readiness")[1]["embedded_rows"] == 5
+    assert follower.state["_snapshot"].embeddings is base
+
+
+def test_documents_are_embedded_outside_the_locks(workers, monkeypatch):
+    leader, _ = workers
+    held = []
+
+    def embed(texts, *args, **kwargs):
+        held.append(leader.pipeline._index_lock._is_owned())
+        return fake_embed(texts)
+
+    monkeypatch.setattr(leader.pipeline, "embed_documents", embed)
+    leader.run("add_document", "User Resource (Notes): comets have tails", "d1")
+    leader.run("upsert_document", "d1", "User Resource (Notes): comets have long tails")
+    leader.run("upsert_document", "d1", "User Resource (Notes): comets have long tails")
+    assert held == [False, False]
+    assert leader.run("retrieve", "long tails", 1) == ["User Resource (Notes): comets have long tails"]
+
+
+def test_cursors_match_across_workers_and_compaction(workers, monkeypatch):
+    leader, follower = workers
+    monkeypatch.setattr(leader.pipeline, "SHARED_INDEX_COMPACT_OPS", 4)
+    for i in range(1, 4):
+        (leader if i % 2 else follower).run("add_document", f"User Resource (Notes): note {i}", f"d{i}")
+    leader.run("delete_document", "d1")
+    # The fourth delta was folded into a new generation, which the follower reloads
+    follower.sync()
+    assert leader.state["_attached"] == follower.state["_attached"] == 2
+
+    first, cursor = leader.page(2)
+    assert first == ["d3", "d2"]
+    rest = leader.page(2, cursor)
+    assert rest == follower.page(2, cursor)
+    assert rest[0] == leader.pipeline.make_document_ids(CORPUS)[:-3:-1]
+    follower.run("add_document", "User Resource (Notes): note 4", "d4")
+    leader.sync()
+    assert leader.page(3) == follower.page(3) == (["d4", "d3", "d2"], leader.page(3)[1])
+
+
+def test_build_replays_other_workers_deltas(workers, monkeypatch):
+    leader, follower = workers
+    monkeypatch.setattr(leader.pipeline, "SHARED_INDEX_COMPACT_OPS", 1)
+    reached, release = threading.Event(), threading.Event()
+
+    def corpus():
+        yield from CORPUS[:3]
+        reached.set()
+        release.wait(5)
+        yield from CORPUS[3:]
+
+    with leader.active() as pipeline:
+        thread = threading.Thread(target=pipeline.build_index, args=(corpus(),))
+        thread.start()
+        assert reached.wait(5)
+    # Another worker mutates meanwhile; its compaction waits for the build
+    follower.run("add_document", "User Resource (Notes): comets have tails", "d1")
+    assert follower.state["_attached"] == 1
+    with leader.active():
+        release.set()
+        thread.join(5)
+
+    assert leader.state["_attached"] == 2
+    snapshot = follower.sync()
+    assert follower.state["_attached"] == 2
+    assert snapshot.ids[-1] == "d1" and follower.pipeline._dense_rows(snapshot)[2][-1]
+    assert follower.page(1) == leader.page(1) == (["d1"], snapshot.records.get("d1").seq)
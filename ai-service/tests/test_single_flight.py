@@ -0,0 +1,113 @@
+import asyncio
+import threading
+import time
+
+import single_flight
+
+
+def run(coro):
+    return asyncio.run(asyncio.wait_for(coro, 5))
+
+
+async def settle():
+    for _ in range(3):
+        await asyncio.sleep(0)
+
+
+def test_cancelled_leader_leaves_the_call_running_for_followers():
+    async def scenario():
+        flight = single_flight.AsyncSingleFlight()
+        release = asyncio.Event()
+        calls = []
+
+        async def upstream():
+            calls.append(1)
+            await release.wait()
+            return "answer"
+
+        leader = asyncio.create_task(flight.do("q", upstream))
+        await settle()
+        followers = [asyncio.create_task(flight.do("q", upstream)) for _ in range(2)]
+        await settle()
+        leader.cancel()
+        await settle()
+        release.set()
+
+        assert await asyncio.gather(*followers) == ["answer", "answer"]
+        assert leader.cancelled() and calls == [1]
+        assert flight.stats() == {"in_flight": 0, "leaders": 1, "joined": 2}
+    run(scenario())
+
+
+def test_exception_reaches_every_async_waiter():
+    async def scenario():
+        flight = single_flight.AsyncSingleFlight()
+        release = asyncio.Event()
+
+        async def upstream():
+            await release.wait()
+            raise RuntimeError("backend down")
+
+        waiters = [asyncio.create_task(flight.do("q", upstream)) for _ in range(3)]
+        await settle()
+        release.set()
+        results = await asyncio.gather(*waiters, return_exceptions=True)
+        assert all(isinstance(r, RuntimeError) and str(r) == "backend down" for r in results)
+        assert flight.stats()["in_flight"] == 0
+    run(scenario())
+
+
+def test_async_key_is_cleared_after_completion():
+    async def scenario():
+        flight = single_flight.AsyncSingleFlight()
+        results = iter(["first", "second"])
+
+        async def upstream():
+            return next(results)
+
+        assert await flight.do("q", upstream) == "first"
+        await settle()
+        assert flight.stats()["in_flight"] == 0
+        assert await flight.do("q", upstream) == "second"
+        assert flight.leaders == 2 and flight.joined == 0
+    run(scenario())
+
+
+def test_threads_share_one_call_and_its_exception():
+    flight = single_flight.SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    calls, errors = [], []
+
+    def upstream():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        raise RuntimeError("backend down")
+
+    def caller():
+        try:
+            flight.do("q", upstream)
+        except RuntimeError as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=caller)
+    leader.start()
+    assert started.wait(5)
+    followers = [threading.Thread(target=caller) for _ in range(2)]
+    for thread in followers:
+        thread.start()
+    while flight.joined < 2:
+        time.sleep(0.001)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(5)
+
+    assert calls == [1] and len(errors) == 3
+    assert flight.stats() == {"in_flight": 0, "leaders": 1, "joined": 2}
+    assert flight.do("q", lambda: "fresh") == "fresh"
+
+
+def test_different_keys_do_not_share():
+    flight = single_flight.SingleFlight()
+    assert [flight.do(k, lambda k=k: k.upper()) for k in "ab"] == ["A", "B"]
+    assert flight.leaders == 2
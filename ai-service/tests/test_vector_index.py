@@ -0,0 +1,62 @@
+import numpy as np
+
+import vector_index
+
+
+def clustered(n, dim=32, clusters=20, seed=0):
+    """Unit-length rows scattered around random centers, like topical embeddings."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    rows = centers[rng.integers(clusters, size=n)] + 0.3 * rng.normal(size=(n, dim))
+    rows /= np.linalg.norm(rows, axis=1, keepdims=True)
+    return rows.astype(np.float32)
+
+
+def recall(found, exact):
+    return np.mean([len(set(f[0]) & set(e[0])) / len(e[0]) for f, e in zip(found, exact)])
+
+
+def test_ivf_recall_against_brute_force():
+    embeddings = clustered(4000)
+    valid = np.ones(len(embeddings), dtype=bool)
+    queries = clustered(50, seed=1)
+    exact = vector_index.BruteForceIndex().search(embeddings, valid, queries, 10)
+
+    index = vector_index.IVFIndex(nlist=64, nprobe=8)
+    index.fit(embeddings, valid)
+    assert recall(index.search(embeddings, valid, queries, 10), exact) >= 0.9
+
+    index.nprobe = index.nlist
+    assert recall(index.search(embeddings, valid, queries, 10), exact) == 1.0
+
+
+def test_ivf_skips_invalid_rows():
+    embeddings = clustered(500)
+    valid = np.ones(len(embeddings), dtype=bool)
+    valid[::2] = False
+    index = vector_index.IVFIndex(nlist=8, nprobe=8)
+    index.fit(embeddings, valid)
+    for rows, _ in index.search(embeddings, valid, embeddings[:5], 10):
+        assert valid[rows].all()
+
+
+def test_ivf_save_load_round_trip(tmp_path):
+    embeddings = clustered(1000)
+    valid = np.ones(len(embeddings), dtype=bool)
+    queries = clustered(20, seed=1)
+    index = vector_index.IVFIndex(nlist=16, nprobe=4)
+    index.fit(embeddings, valid)
+    path = str(tmp_path / "ivf" / "lists.npz")
+    index.save(path)
+
+    loaded = vector_index.IVFIndex(nprobe=4)
+    assert loaded.load(path)
+    assert loaded.nlist == 16
+    np.testing.assert_array_equal(loaded.centroids, index.centroids)
+    np.testing.assert_array_equal(loaded.assignments, index.assignments)
+    for (rows, scores), (rows2, scores2) in zip(index.search(embeddings, valid, queries, 5),
+                                                loaded.search(embeddings, valid, queries, 5)):
+        np.testing.assert_array_equal(rows, rows2)
+        np.testing.assert_allclose(scores, scores2)
+
+    assert not vector_index.IVFIndex().load(str(tmp_path / "missing.npz"))
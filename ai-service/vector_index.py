@@ -0,0 +1,217 @@
+import os
+import copy
+
+import numpy as np
+
+import quantization
+
+# Vector search behind retrieve(). Indexes are given the caller's
+# normalized matrix and validity mask at search time, and are told about
+# row mutations so they stay aligned with the document list. The matrix
+# may be compressed (see quantization), in which case scales is passed too.
+# An index that a published snapshot holds is never mutated: writers fork()
+# it and apply the row change to the copy.
+
+# Rows processed per matrix product, to bound temporary memory
+CHUNK_ROWS = 16384
+
+
+def top_k(scores, k, valid=None):
+    """Indices of the k highest finite scores, best first (argpartition)."""
+    if valid is not None:
+        scores = np.where(valid, scores, -np.inf)
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top])]
+    return top[np.isfinite(scores[top])]
+
+
+class BruteForceIndex:
+    """Exact search: one matrix product over every row."""
+
+    name = "brute"
+
+    def fit(self, embeddings, valid, scales=None):
+        pass
+
+    def fork(self):
+        return self
+
+    def add(self, vector):
+        pass
+
+    def update(self, row, vector):
+        pass
+
+    def delete(self, row):
+        pass
+
+    def search(self, embeddings, valid, queries, k, scales=None):
+        """Returns, per query row, (rows, scores) best first."""
+        n = len(embeddings)
+        scores = quantization.score(embeddings, scales, queries)  # (n_docs, n_queries)
+        results = []
+        for j in range(len(queries)):
+            column = scores[:, j]
+            rows = top_k(column, k, None if valid is None else valid[:n])
+            results.append((rows, column[rows]))
+        return results
+
+    def stats(self):
+        return {"type": self.name}
+
+
+class IVFIndex:
+    """
+    Inverted-file index: spherical k-means centroids partition the rows,
+    and a query scans only the nprobe lists whose centroids are closest.
+    nlist/nprobe trade recall for latency; rows are scored exactly.
+
+    assignments is aligned with the caller's rows, so add/update/delete
+    are O(1)/O(n) array edits; the inverted lists are re-derived from it
+    lazily on the next search.
+    """
+
+    name = "ivf"
+
+    def __init__(self, nlist=None, nprobe=8, train_sample=50000, iterations=10, seed=0):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_sample = train_sample
+        self.iterations = iterations
+        self.seed = seed
+        self.centroids = None
+        self.assignments = np.empty(0, dtype=np.int32)
+        self._order = None
+        self._offsets = None
+
+    # ── Training ──────────────────────────────────────────────────────────────
+    def _assign(self, vectors, scales=None):
+        out = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), CHUNK_ROWS):
+            block = quantization.dequantize(vectors, scales, slice(start, start + CHUNK_ROWS))
+            out[start:start + len(block)] = np.argmax(block @ self.centroids.T, axis=1)
+        return out
+
+    def train(self, vectors):
+        """Spherical k-means on (a sample of) unit-length rows."""
+        rng = np.random.default_rng(self.seed)
+        if len(vectors) > self.train_sample:
+            vectors = vectors[rng.choice(len(vectors), self.train_sample, replace=False)]
+        nlist = self.nlist or max(1, int(4 * np.sqrt(len(vectors))))
+        nlist = min(nlist, len(vectors))
+        self.centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+
+        for _ in range(self.iterations):
+            assign = self._assign(vectors)
+            counts = np.bincount(assign, minlength=nlist)
+            # Per-cluster sums via one sort + reduceat
+            order = np.argsort(assign, kind="stable")
+            starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+            sums = np.zeros_like(self.centroids)
+            nonempty = counts > 0
+            sums[nonempty] = np.add.reduceat(vectors[order], starts[nonempty], axis=0)
+            empty = ~nonempty
+            if empty.any():
+                # Re-seed empty clusters on random rows
+                sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            self.centroids = sums / np.maximum(norms, 1e-12)
+        self.nlist = nlist
+
+    def fit(self, embeddings, valid, scales=None):
+        live = np.flatnonzero(valid) if valid is not None else np.arange(len(embeddings))
+        if self.centroids is None or self.centroids.shape[1] != embeddings.shape[1]:
+            if len(live) == 0:
+                self.centroids = None
+                self.assignments = np.zeros(len(embeddings), dtype=np.int32)
+                self._order = None
+                return
+            if len(live) > self.train_sample:
+                live = np.sort(np.random.default_rng(self.seed).choice(live, self.train_sample, replace=False))
+            self.train(quantization.dequantize(embeddings, scales, live))
+        self.assignments = self._assign(embeddings, scales)
+        self._order = None
+
+    # ── Mutations ─────────────────────────────────────────────────────────────
+    def _nearest(self, vector):
+        if self.centroids is None:
+            return 0
+        return int(np.argmax(self.centroids @ vector))
+
+    def fork(self):
+        """Copy for a writer: centroids are shared (never edited), assignments copied."""
+        clone = copy.copy(self)
+        clone.assignments = self.assignments.copy()
+        return clone
+
+    def add(self, vector):
+        self.assignments = np.append(self.assignments, np.int32(self._nearest(vector)))
+        self._order = None
+
+    def update(self, row, vector):
+        self.assignments[row] = self._nearest(vector)
+        self._order = None
+
+    def delete(self, row):
+        self.assignments = np.delete(self.assignments, row)
+        self._order = None
+
+    # ── Search ────────────────────────────────────────────────────────────────
+    def _lists(self):
+        if self._order is None:
+            self._order = np.argsort(self.assignments, kind="stable")
+            counts = np.bincount(self.assignments, minlength=len(self.centroids))
+            self._offsets = np.concatenate(([0], np.cumsum(counts)))
+        return self._order, self._offsets
+
+    def search(self, embeddings, valid, queries, k, scales=None):
+        n = len(embeddings)
+        if self.centroids is None or len(self.assignments) != n:
+            # Not (yet) aligned with these rows — stay correct, scan everything
+            return BruteForceIndex().search(embeddings, valid, queries, k, scales)
+
+        order, offsets = self._lists()
+        nprobe = min(self.nprobe, len(self.centroids))
+        probes = np.argpartition(-(queries @ self.centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+
+        results = []
+        for j, query in enumerate(queries):
+            rows = np.concatenate([order[offsets[p]:offsets[p + 1]] for p in probes[j]])
+            scores = quantization.score(embeddings, scales, query, rows)[:, 0]
+            best = top_k(scores, k, None if valid is None else valid[rows])
+            results.append((rows[best], scores[best]))
+        return results
+
+    # ── Persistence ───────────────────────────────────────────────────────────
+    def save(self, path):
+        if self.centroids is None:
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, centroids=self.centroids, assignments=self.assignments,
+                 nprobe=self.nprobe)
+        os.replace(tmp_path, path)
+
+    def load(self, path):
+        """Restore centroids and assignments; returns False if unavailable."""
+        try:
+            with np.load(path) as data:
+                self.centroids = data["centroids"]
+                self.assignments = data["assignments"].astype(np.int32)
+            self.nlist = len(self.centroids)
+            self._order = None
+            return True
+        except Exception:
+            return False
+
+    def stats(self):
+        sizes = np.bincount(self.assignments, minlength=self.nlist or 0) if self.centroids is not None else []
+        return {
+            "type": self.name,
+            "nlist": self.nlist,
+            "nprobe": self.nprobe,
+            "largest_list": int(max(sizes)) if len(sizes) else 0,
+        }
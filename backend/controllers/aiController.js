@@ -221,9 +221,17 @@ exports.decomposeTask = async (req, res) => {
     }
 };
 
+// GET /api/ai/resources — one page of the knowledge base, newest first.
+// ?limit/?cursor/?category/?order pass through; X-Next-Cursor marks more pages.
 exports.getResources = async (req, res) => {
     try {
-        const response = await aiClient.get('/rag/knowledge');
+        const { limit, cursor, category, order } = req.query;
+        const response = await aiClient.get('/rag/knowledge', { params: { limit, cursor, category, order } });
+        if (response.status !== 200) {
+            return res.status(response.status).json(response.data);
+        }
+        const nextCursor = response.headers['x-next-cursor'];
+        if (nextCursor) res.set('X-Next-Cursor', nextCursor);
         res.json(response.data);
     } catch (err) {
         handleAiError(res, err);
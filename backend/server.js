@@ -49,6 +49,7 @@ const corsOptions = {
         callback(new Error(`CORS: origin ${origin} not allowed`));
     },
     credentials: true,
+    exposedHeaders: ['X-Next-Cursor'],  // Resources page pagination
     optionsSuccessStatus: 200
 };
 app.use(cors(corsOptions));
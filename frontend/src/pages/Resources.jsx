@@ -10,22 +10,32 @@ const Resources = () => {
     const [newItem, setNewItem] = useState({ category: '', content: '' });
     const [selectedResource, setSelectedResource] = useState(null);
     const [copied, setCopied] = useState(false);
+    const [nextCursor, setNextCursor] = useState(null);
+    const [loadingMore, setLoadingMore] = useState(false);
 
     useEffect(() => {
         fetchResources();
     }, []);
 
-    const fetchResources = async () => {
+    const PAGE_SIZE = 50;
+
+    // Newest first, one page at a time; a cursor appends the next page
+    const fetchResources = async (cursor = null) => {
+        if (cursor) setLoadingMore(true);
         try {
-            const res = await fetch(`${API_URL}/api/ai/resources`);
+            const params = new URLSearchParams({ limit: PAGE_SIZE });
+            if (cursor) params.set('cursor', cursor);
+            const res = await fetch(`${API_URL}/api/ai/resources?${params}`);
             if (res.ok) {
                 const data = await res.json();
-                setResources(data);
+                setResources(prev => cursor ? [...prev, ...data] : data);
+                setNextCursor(res.headers.get('X-Next-Cursor'));
             }
         } catch (err) {
             console.error(err);
         } finally {
             setLoading(false);
+            setLoadingMore(false);
         }
     };
 
@@ -68,7 +78,7 @@ const Resources = () => {
             <div style={{ display: 'flex', justifyContent: 'space-between', alignItems: 'center', marginBottom: '2rem' }}>
                 <div>
                     <h2 style={{ fontSize: '2.5rem', margin: 0, fontWeight: 800, letterSpacing: '-0.03em' }}>Learning Resources</h2>
-                    <p style={{ color: 'var(--text-secondary)', margin: '0.3rem 0 0' }}>{resources.length} items in your knowledge base</p>
+                    <p style={{ color: 'var(--text-secondary)', margin: '0.3rem 0 0' }}>{resources.length}{nextCursor ? '+' : ''} items in your knowledge base</p>
                 </div>
                 <div style={{ display: 'flex', gap: '1rem' }}>
                     <motion.button
@@ -86,7 +96,7 @@ const Resources = () => {
                         {showForm ? <><X size={18} /> Cancel</> : <><Plus size={18} /> Add Resource</>}
                     </motion.button>
                     <button
-                        onClick={fetchResources}
+                        onClick={() => fetchResources()}
                         style={{
                             background: 'transparent', border: '1px solid var(--border)',
                             color: 'var(--text-primary)', padding: '0.7rem', borderRadius: '12px', cursor: 'pointer'
@@ -155,10 +165,10 @@ const Resources = () => {
 
                         return (
                             <motion.div
-                                key={index}
+                                key={res.id ?? index}
                                 initial={{ opacity: 0, y: 20 }}
                                 animate={{ opacity: 1, y: 0 }}
-                                transition={{ delay: index * 0.04 }}
+                                transition={{ delay: (index % PAGE_SIZE) * 0.04 }}
                                 whileHover={{ y: -6, boxShadow: `0 12px 30px ${color}20` }}
                                 onClick={() => setSelectedResource(res)}
                                 className="glass-card"
@@ -227,6 +237,21 @@ const Resources = () => {
                             <p style={{ fontSize: '1.1rem' }}>No resources found. Add some to get started!</p>
                         </div>
                     )}
+                    {nextCursor && (
+                        <div style={{ gridColumn: '1/-1', textAlign: 'center' }}>
+                            <button
+                                onClick={() => fetchResources(nextCursor)}
+                                disabled={loadingMore}
+                                style={{
+                                    background: 'transparent', border: '1px solid var(--border)',
+                                    color: 'var(--text-primary)', padding: '0.7rem 1.4rem', borderRadius: '12px',
+                                    cursor: loadingMore ? 'wait' : 'pointer', fontWeight: 600
+                                }}
+                            >
+                                {loadingMore ? 'Loading...' : 'Load more'}
+                            </button>
+                        </div>
+                    )}
                 </div>
             )}
 